@@ -3,11 +3,23 @@ This module contains the class Answerer, which combines the search engine
 with the reading comprehension model (BERT) to select an answer.
 """
 
+import asyncio
 import logging
+import re
+from concurrent.futures import ThreadPoolExecutor
 from typing import List
+import numpy as np
 
-from document_retrieval import get_articles
-from reading_comprehension import get_model_predictions
+from article_cache import MemoryCache
+from document_retrieval import get_articles, get_articles_batch, get_articles_concurrent, \
+                               iter_article_depths, iter_articles, search_titles
+from metrics import REGISTRY, Timings, stage, track_request
+from inference_backend import InferenceBackend
+from model_client import ModelServerClient
+from passage_ranking import rank_passages
+from reading_comprehension import get_article_predictions, get_model_predictions_batch, \
+                                  get_tokenizer, tokenizer_fingerprint
+from worker_pool import WorkerPool
 
 
 logging.info("Running QA module")
@@ -31,29 +43,223 @@ class BertTokenSizeOutOfRange(Exception):
         self.token_count = token_count
 
 
+class NoAnswerFound(Exception):
+    """
+    Raised when there is nothing to answer a question from, i.e. when no articles were
+    found, every article failed to download, or the articles were empty.
+    """
+
+
+def _normalize_question(question: str) -> str:
+    """
+    Lower-cases a question and strips punctuation and extra whitespace, so that
+    "What is the capital of France?" and "what is the capital of france" are the same.
+    """
+    return " ".join(re.sub(r"[^\w\s]", " ", question.lower()).split())
+
+
+def _copy_result(result: dict, keep_scores: bool = True) -> dict:
+    """
+    Returns a copy of a result whose answers can be changed without changing the original,
+    i.e. an entry of the answer cache. Unless `keep_scores` is set, the (large) start and
+    end score vectors are left out of the copy.
+    """
+    def copy(evaluation):
+        return {key: value for key, value in evaluation.items()
+                if keep_scores or key not in ("start_scores", "end_scores")}
+
+    result = dict(result, answer=None if result["answer"] is None else copy(result["answer"]),
+                  other_results=[copy(evaluation) for evaluation in result["other_results"]])
+    if "top_answers" in result:
+        result["top_answers"] = [dict(span) for span in result["top_answers"]]
+
+    return result
+
+
 class Answerer:
     """
     Attributes
     ----------
-    model_server_address : str
-        Address of the BERT model server.
+    model_server_address : str, list or InferenceBackend
+        Address of the BERT model server, a list of addresses of model server replicas, or
+        a backend that runs the model, like `inference_backend.OnnxRuntimeBackend`.
     num_articles_search : int
         The number of articles that will be downloaded by the document retriever.
     characters_per_article : int
         Only use the first `characters_per_article` from the article - the answer is likely to
         be in the beginning of a document.
+    max_batch : int
+        The maximum number of article chunks sent to the model server in a single request.
+    include_scores : bool
+        If True, every result also has the model's "start_scores" and "end_scores" for every
+        token, as float32 arrays. These are large, so they are left out by default.
+    request_format : str
+        "row" or "columnar". The columnar format is more compact and faster to parse.
+    pool_size : int
+        The maximum number of connections kept open to each model server replica.
+    timeout : float
+        The number of seconds to wait for the model server to answer a request.
+    max_retries : int
+        The number of times a failed model server request is retried.
+    load_balancing : str
+        "round_robin" or "least_outstanding", see `ModelServerClient`.
+    max_answer_len : int
+        The maximum length of an answer, in tokens.
+    chunking : str
+        How articles are split up for the model. "words" splits on whitespace and re-encodes
+        every chunk. "tokens" tokenizes each article once and splits it into overlapping
+        windows that fill the model's entire context; answers are spans of the article text.
+    stride : int
+        When `chunking` is "tokens", the number of tokens by which the windows overlap.
+    rerank_top_n : int
+        If set, the chunks are scored by how many words they share with the question (BM25)
+        and only the best `rerank_top_n` chunks are sent to the model server. With
+        `streaming`, each article is ranked on its own as it arrives, so up to
+        `rerank_top_n` chunks of every article are sent; with `adaptive_depth_score`, up to
+        `rerank_top_n` chunks of every depth.
+    retrieval_workers : int
+        If set, articles are downloaded in parallel on this many threads.
+    page_timeout : float
+        When downloading in parallel, articles that take longer than this are skipped.
+    backend : module
+        The search engine used for document retrieval, i.e. an `article_cache.CachedBackend`.
+        Defaults to the `wikipedia` module.
+    answer_cache_size : int
+        If set, up to this many answers are cached, keyed by the normalized question. Repeated
+        questions are then answered without any retrieval or model server calls.
+    answer_cache_ttl : float
+        Cached answers older than this many seconds are not used. None means no expiry.
+    cache_scores : bool
+        If False, the "start_scores" and "end_scores" (see `include_scores`) are dropped from
+        cached answers to save memory, so answers that come from the cache will not have them.
+    streaming : bool
+        If True, each article is sent to the model server as soon as it has been downloaded,
+        so that downloading and reading comprehension overlap.
+    early_exit_score : float
+        When streaming, stop downloading and scoring articles as soon as an answer has
+        start_scores_max + end_scores_max >= early_exit_score.
+    tokenizer : object
+        The BERT tokenizer. By default, it is loaded with `reading_comprehension.get_tokenizer`
+        the first time a question is answered.
+    process_pool : WorkerPool or int
+        If set, tokenization and answer decoding run on this `worker_pool.WorkerPool` (or on
+        a new pool with this many processes, which uses `tokenizer`), so that they can use
+        several cores when many questions are answered at the same time. A pool whose
+        tokenizer is different from `tokenizer` raises a ValueError when it is first used.
+    token_cache : TokenCache
+        When `chunking` is "tokens", articles are only tokenized the first time they are
+        read, and kept in this `token_cache.TokenCache`.
+    adaptive_depth_score : float
+        If set, only the introductions of the articles are downloaded and scored first. The
+        next section of each article is only read while the best answer has
+        start_scores_max + end_scores_max < adaptive_depth_score, up to
+        `characters_per_article` characters per article. This takes precedence over
+        `streaming`.
+    top_k : int
+        If set, every result also has "top_answers": the `top_k` best answer spans across
+        all the chunks that were read, best first (see `span_decoding.top_k_spans`). Unlike
+        "other_results", which has the best answer of every other chunk, several of them may
+        come from the same chunk.
 
     Methods
     -------
     answer_question
         Returns an answer object in response to a question.
         This answer must be parsed like ans["answer"]["answer"]
+        ans["cache_hit"] is True if the answer came from the answer cache.
+        ans["timings"] maps each stage of the pipeline to the seconds spent in it.
+    answer_questions
+        Returns a list of answer objects in response to a list of questions.
+    answer_questions_async
+        An awaitable version of `answer_questions`.
+    close
+        Closes the model server client and the process pool, if the Answerer created them.
     """
 
-    def __init__(self, model_server_address, num_articles_search=5, characters_per_article=2500):
+    def __init__(self, model_server_address, num_articles_search=5, characters_per_article=2500,
+                 max_batch=16, include_scores=False, request_format="row", pool_size=10,
+                 timeout=10.0, max_retries=2, load_balancing="round_robin", max_answer_len=30,
+                 chunking="words", stride=128, rerank_top_n=None, retrieval_workers=None,
+                 page_timeout=10.0, backend=None, answer_cache_size=None, answer_cache_ttl=None,
+                 cache_scores=False, streaming=False, early_exit_score=None, tokenizer=None,
+                 process_pool=None, token_cache=None, adaptive_depth_score=None, top_k=None):
         self.model_server_address = model_server_address
         self.num_articles_search = num_articles_search
         self.characters_per_article = characters_per_article
+        self.max_batch = max_batch
+        self.include_scores = include_scores
+        # Only what the Answerer creates itself is closed by `close`.
+        self._owns_client = not isinstance(model_server_address, InferenceBackend)
+        if not self._owns_client:
+            self.client = model_server_address
+        else:
+            self.client = ModelServerClient(model_server_address, pool_size=pool_size,
+                                            timeout=timeout, max_retries=max_retries,
+                                            load_balancing=load_balancing,
+                                            request_format=request_format)
+        self.max_answer_len = max_answer_len
+        self.chunking = chunking
+        self.stride = stride
+        self.rerank_top_n = rerank_top_n
+        self.retrieval_workers = retrieval_workers
+        self.page_timeout = page_timeout
+        self.backend = backend
+        self.answer_cache = MemoryCache(answer_cache_size, answer_cache_ttl) \
+                            if answer_cache_size else None
+        self.cache_scores = cache_scores
+        self.streaming = streaming
+        self.early_exit_score = early_exit_score
+        self._tokenizer = tokenizer
+        self._owns_process_pool = isinstance(process_pool, int)
+        # A pool that was passed in is checked when it is first used, see `_check_process_pool`.
+        self._process_pool_checked = process_pool is None or self._owns_process_pool
+        if self._owns_process_pool:
+            process_pool = WorkerPool(process_pool, tokenizer=tokenizer)
+        self.process_pool = process_pool
+        self.token_cache = token_cache
+        self.adaptive_depth_score = adaptive_depth_score
+        self.top_k = top_k
+
+
+    @property
+    def tokenizer(self):
+        """
+        The BERT tokenizer, which is loaded the first time it is needed.
+        """
+        if self._tokenizer is None:
+            self._tokenizer = get_tokenizer()
+        return self._tokenizer
+
+
+    def _check_process_pool(self):
+        """
+        Makes sure that the process pool uses the same tokenizer as the Answerer. This loads
+        the tokenizer, so it is only done when the pool is first used.
+        """
+        if self._process_pool_checked:
+            return
+
+        if self.process_pool.fingerprint() != tokenizer_fingerprint(self.tokenizer):
+            raise ValueError("The process pool and the Answerer use different tokenizers")
+        self._process_pool_checked = True
+
+
+    def close(self):
+        """
+        Closes the model server client and the process pool, if the Answerer created them.
+        """
+        if self._owns_client:
+            self.client.close()
+        if self._owns_process_pool:
+            self.process_pool.close()
+
+
+    def __enter__(self):
+        return self
+
+
+    def __exit__(self, *exc):
+        self.close()
 
 
     def _get_tokens(self, query_or_context: str) -> int:
@@ -100,6 +306,188 @@ class Answerer:
             yield chunk
 
 
+    def _chunk_size(self, question: str) -> int:
+        """
+        Returns the number of words per article chunk that fit in BERT with the question.
+        """
+        # Subtract 150 because BERT's tokenizer may return more tokens than my own.
+        return 509 - len(self._get_tokens(question)) - 150
+
+
+    def _check_question(self, question: str):
+        """
+        Makes sure that the query is not too long. Long queries hurt performance.
+        """
+        question_token_len = len(self._get_tokens(question))
+        if question_token_len > 15:
+            raise BertTokenSizeOutOfRange(question_token_len)
+
+
+    def _get_articles(self, question: str) -> List[tuple]:
+        """
+        Downloads all the relevant Wikipedia articles for a question.
+        """
+        if self.retrieval_workers:
+            return get_articles_concurrent(question, num_articles_search=self.num_articles_search,
+                                           characters_per_article=self.characters_per_article,
+                                           max_workers=self.retrieval_workers,
+                                           page_timeout=self.page_timeout, backend=self.backend)
+
+        return get_articles(question, num_articles_search=self.num_articles_search,
+                            characters_per_article=self.characters_per_article,
+                            backend=self.backend)
+
+
+    def _score_many(self, items: List[tuple], max_in_flight: int = 1) -> List[List[dict]]:
+        """
+        Splits articles into chunks and sends them to the model server in as few requests
+        as possible. Chunks from different questions share the same requests.
+
+        Parameters
+        ----------
+        items : list
+            A list of (question, articles) tuples, where articles is a list of
+            (article_title, article_text) tuples.
+        max_in_flight : int
+            The maximum number of requests sent to the model server at the same time.
+
+        Returns
+        -------
+        list
+            One list per item, with one dict per chunk. See `answer_question` for the schema.
+        """
+        self._check_process_pool()
+
+        # Collect tuples of article chunks: (item_index, article_title, article_chunk)
+        if self.chunking == "tokens":
+            articles = [(i, question, article) for i, (question, question_articles)
+                        in enumerate(items) for article in question_articles]
+            preds = get_article_predictions([question for _, question, _ in articles],
+                                            [text for _, _, (_, text) in articles],
+                                            self.client, stride=self.stride,
+                                            max_batch=self.max_batch,
+                                            include_scores=self.include_scores,
+                                            max_answer_len=self.max_answer_len,
+                                            top_n=self.rerank_top_n,
+                                            max_in_flight=max_in_flight,
+                                            tokenizer=self.tokenizer,
+                                            pool=self.process_pool,
+                                            titles=[title for _, _, (title, _) in articles],
+                                            token_cache=self.token_cache, top_k=self.top_k)
+            contexts = [(articles[pred["article_index"]][0],
+                         articles[pred["article_index"]][2][0], pred["context"])
+                        for pred in preds]
+        else:
+            contexts = []
+            for i, (question, question_articles) in enumerate(items):
+                question_contexts = []
+                for article_title, article_text in question_articles:
+                    for article_chunk in self._get_article_chunks(article_text,
+                                                                  self._chunk_size(question)):
+                        question_contexts.append((i, article_title, article_chunk))
+
+                if self.rerank_top_n is not None:
+                    question_contexts = [question_contexts[j] for j in rank_passages(
+                        question, [chunk for _, _, chunk in question_contexts],
+                        self.rerank_top_n)]
+                contexts.extend(question_contexts)
+
+            preds = []
+            if contexts:
+                preds = get_model_predictions_batch([items[i][0] for i, _, _ in contexts],
+                                                    [chunk for _, _, chunk in contexts],
+                                                    self.client, max_batch=self.max_batch,
+                                                    include_scores=self.include_scores,
+                                                    max_answer_len=self.max_answer_len,
+                                                    max_in_flight=max_in_flight,
+                                                    tokenizer=self.tokenizer,
+                                                    pool=self.process_pool, top_k=self.top_k)
+
+        logging.debug("Got model predictions for %d chunks", len(preds))
+
+        output = [[] for _ in items]
+        for (i, article_title, article_chunk), pred in zip(contexts, preds):
+            if np.isneginf(pred["start_scores_max"]):
+                # The chunk had no valid answer span, i.e. it was empty.
+                continue
+
+            data = {
+                    "answer": pred["answer"],
+                    "context": article_chunk,
+                    "context_article_title": article_title,
+                    "start_scores_max": pred["start_scores_max"],
+                    "end_scores_max": pred["end_scores_max"]
+                    }
+
+            if self.include_scores:
+                data["start_scores"] = pred["start_scores"]
+                data["end_scores"] = pred["end_scores"]
+
+            if self.top_k is not None:
+                data["top_answers"] = [dict(span, context=article_chunk,
+                                            context_article_title=article_title)
+                                       for span in pred["top_answers"]]
+
+            output[i].append(data)
+
+        return output
+
+
+    def _score_streaming(self, question: str) -> List[dict]:
+        """
+        Scores each article as soon as it has been downloaded. If `early_exit_score` is set,
+        this stops as soon as a good enough answer has been found, and the remaining
+        articles are neither downloaded nor scored. `rerank_top_n` applies to each article.
+        """
+        articles = iter_articles(question, num_articles_search=self.num_articles_search,
+                                 characters_per_article=self.characters_per_article,
+                                 max_workers=self.retrieval_workers or self.num_articles_search,
+                                 page_timeout=self.page_timeout, backend=self.backend)
+
+        output = []
+        try:
+            for article in articles:
+                evaluations = self._score_many([(question, [article])])[0]
+                output.extend(evaluations)
+
+                if self.early_exit_score is not None and any(
+                        evaluation["start_scores_max"] + evaluation["end_scores_max"]
+                        >= self.early_exit_score for evaluation in evaluations):
+                    logging.debug("Found a confident answer, skipping the remaining articles")
+                    break
+        finally:
+            articles.close()
+
+        return output
+
+
+    def _score_adaptive(self, question: str) -> List[dict]:
+        """
+        Scores the introductions of the articles, then their sections one at a time, until
+        an answer scores at least `adaptive_depth_score` or the articles have been read up
+        to `characters_per_article`.
+        """
+        depths = iter_article_depths(question, num_articles_search=self.num_articles_search,
+                                     characters_per_article=self.characters_per_article,
+                                     max_workers=self.retrieval_workers or
+                                     self.num_articles_search,
+                                     page_timeout=self.page_timeout, backend=self.backend)
+
+        output = []
+        try:
+            for depth, parts in enumerate(depths):
+                output.extend(self._score_many([(question, parts)])[0])
+
+                if max((evaluation["start_scores_max"] + evaluation["end_scores_max"]
+                        for evaluation in output), default=-np.inf) >= self.adaptive_depth_score:
+                    logging.debug("Found a confident answer at depth %d", depth)
+                    break
+        finally:
+            depths.close()
+
+        return output
+
+
     def _decider(self, model_evaluations: List[dict], question: str) -> dict:
         """
         This function accepts a list of dicts, where each dict contains info about the model's
@@ -117,34 +505,60 @@ class Answerer:
         -------
         dict
             A dict where the model evaluation containing the answer is mapped to the key
-            "answer" and the other evaluations are in a list and mapped to "other results"
+            "answer" and the other evaluations are in a list and mapped to "other results".
+            If `top_k` is set, the best spans across all the evaluations are mapped to
+            "top_answers".
         """
-        choice_index, choice_max_sum = 0, 0
-
-        for i, evaluation in enumerate(model_evaluations):
-            sum_scores = evaluation["start_scores_max"] + evaluation["end_scores_max"]
-            if sum_scores > choice_max_sum:
-                choice_max_sum = sum_scores
-                choice_index = i
-
-        answer = model_evaluations[choice_index]
-        model_evaluations.pop(choice_index)
+        if not model_evaluations:
+            raise NoAnswerFound(f"No articles were found to answer {question!r}")
+
+        with stage("decider"):
+            # Each batch found its own best spans, so the best of those are the best overall.
+            top_answers = None
+            if self.top_k is not None:
+                top_answers = sorted((span for evaluation in model_evaluations
+                                      for span in evaluation.pop("top_answers")),
+                                     key=lambda span: span["start_scores_max"] +
+                                     span["end_scores_max"], reverse=True)[:self.top_k]
+
+            sum_scores = np.fromiter((evaluation["start_scores_max"] +
+                                      evaluation["end_scores_max"]
+                                      for evaluation in model_evaluations),
+                                     dtype=np.float64, count=len(model_evaluations))
+            choice_index = int(np.argmax(sum_scores))
+
+            answer = model_evaluations[choice_index]
+            model_evaluations.pop(choice_index)
 
         all_model_data = {
             "question": question,
             "answer": answer,
             "other_results": model_evaluations
         }
+        if top_answers is not None:
+            all_model_data["top_answers"] = top_answers
 
         return all_model_data
 
 
+    def _cacheable(self, result: dict) -> dict:
+        """
+        Returns the copy of `result` that is stored in the answer cache. Unless
+        `cache_scores` is set, the (large) start and end score vectors are left out.
+        """
+        return _copy_result(result, keep_scores=self.cache_scores)
+
+
     def answer_question(self, question: str) -> dict:
         """
         This function searches Wikipedia to provide an answer for a given question.
         It returns a dict with two keys: "answer" and "other_results". "other_results"
         is a list but contains entries with an identical structure to "answer".
         answer_question(question)["answer"]["answer"] contains the answer to the question.
+        answer_question(question)["cache_hit"] is True if the answer came from the cache.
+        answer_question(question)["timings"] maps each stage to the seconds spent in it, e.g.
+        {"wiki_search": 0.3, "wiki_page": 1.2, "tokenization": 0.05, "model_request": 0.4, ...}
+        Stages that run in parallel are added up, so only "total" is wall-clock time.
 
         Parameters
         ----------
@@ -155,38 +569,204 @@ class Answerer:
         -------
         dict
             A dict that contains the query results.
+
+        Raises
+        ------
+        BertTokenSizeOutOfRange
+            If the question is too long.
+        NoAnswerFound
+            If no articles (or only empty ones) could be downloaded for the question.
         """
-        # Subtract 150 because BERT's tokenizer may return more tokens than my own.
-        chunk_size = 509 - len(self._get_tokens(question)) - 150
+        REGISTRY.inc("qa_questions_total")
 
-        # Make sure that the query is not too long. Long queries hurt performance.
-        question_token_len = len(self._get_tokens(question))
-        if question_token_len > 15:
-            raise BertTokenSizeOutOfRange(question_token_len)
+        with track_request() as timings:
+            with stage("total"):
+                result, cache_hit = self._answer_question_cached(question)
 
-        # Download all the relevant Wikipedia articles.
-        articles = get_articles(question, num_articles_search=self.num_articles_search,
-                                          characters_per_article=self.characters_per_article)
+        return dict(result, cache_hit=cache_hit, timings=timings.as_dict())
+
+
+    def _answer_question_cached(self, question: str) -> tuple:
+        """
+        Answers a question using the answer cache, if there is one.
+
+        Returns
+        -------
+        tuple
+            (result, cache_hit)
+        """
+        if self.answer_cache is None:
+            return self._answer_question(question), False
 
-        # Collect tuples of article chunks: (article_title, article_chunk)
+        key = (_normalize_question(question), self.num_articles_search,
+               self.characters_per_article)
+        result = self.answer_cache.get(key)
+        if result is not None:
+            REGISTRY.inc("qa_answer_cache_hits_total")
+            # The cached answer may have been asked in other words.
+            return dict(_copy_result(result), question=question), True
+
+        REGISTRY.inc("qa_answer_cache_misses_total")
+        result = self._answer_question(question)
+        self.answer_cache.set(key, self._cacheable(result))
+
+        return result, False
+
+
+    def _answer_question(self, question: str) -> dict:
+        """
+        Answers a question without using the answer cache. See `answer_question`.
+        """
+        self._check_question(question)
+
+        if self.adaptive_depth_score is not None:
+            return self._decider(self._score_adaptive(question), question)
+
+        if self.streaming:
+            return self._decider(self._score_streaming(question), question)
+
+        with stage("retrieval"):
+            articles = self._get_articles(question)
+
+        with stage("reading_comprehension"):
+            evaluations = self._score_many([(question, articles)])[0]
+
+        return self._decider(evaluations, question)
+
+
+    def answer_questions(self, questions: List[str], max_concurrency: int = 8) -> List[dict]:
+        """
+        Answers many questions at once. Repeated questions are only answered once, the
+        articles for all the questions are downloaded in parallel (articles found for
+        several questions only once), and the chunks of all the questions are sent to the
+        model server in shared batches. `streaming` and `adaptive_depth_score` are not used
+        here.
+
+        Parameters
+        ----------
+        questions : list
+            A list of questions or queries.
+        max_concurrency : int
+            The maximum number of questions whose articles are downloaded at the same time,
+            and the maximum number of requests sent to the model server at the same time.
+
+        Returns
+        -------
+        list
+            One dict per question, in the same order as `questions`. See `answer_question`.
+            Questions that cannot be answered, because they are too long or no articles were
+            found for them, get a dict with an "error" message and None as their "answer"
+            instead.
+        """
+        errors = {}
+        for i, question in enumerate(questions):
+            try:
+                self._check_question(question)
+            except BertTokenSizeOutOfRange as err:
+                errors[i] = f"The question is too long ({err.token_count} words)"
+        REGISTRY.inc("qa_questions_total", len(questions))
+
+        valid_questions = [question for i, question in enumerate(questions) if i not in errors]
+        with track_request() as shared_timings:
+            with stage("total"):
+                results, keys, retrieval_timings = self._answer_questions(valid_questions,
+                                                                          max_concurrency)
+
+        # Work shared by the whole batch counts towards every question.
         output = []
+        keys = iter(keys)
+        for i, question in enumerate(questions):
+            if i in errors:
+                output.append({"question": question, "answer": None, "other_results": [],
+                               "error": errors[i], "cache_hit": False, "timings": {}})
+                continue
+
+            key = next(keys)
+            timings = Timings()
+            timings.update(shared_timings)
+            if key in retrieval_timings:
+                timings.update(retrieval_timings[key])
+            # Repeated questions share a result, and it may be in the answer cache.
+            output.append(dict(_copy_result(results[key]), question=question,
+                               timings=timings.as_dict()))
+
+        return output
+
+
+    def _answer_questions(self, questions: List[str], max_concurrency: int) -> tuple:
+        """
+        Answers many questions at once. See `answer_questions`.
+
+        Returns
+        -------
+        tuple
+            (results, keys, retrieval_timings), where `results` and `retrieval_timings` map
+            the cache key of each question to its result and to the timings of searching
+            for its articles, and `keys` has the key of each question in `questions`. The
+            articles are downloaded once for all the questions, which counts as shared work.
+        """
+        keys = [(_normalize_question(question), self.num_articles_search,
+                 self.characters_per_article) for question in questions]
+
+        results = {}
+        if self.answer_cache is not None:
+            for key in set(keys):
+                result = self.answer_cache.get(key)
+                if result is not None:
+                    REGISTRY.inc("qa_answer_cache_hits_total")
+                    results[key] = dict(result, cache_hit=True)
+
+        # Only answer the first of each group of repeated questions.
+        pending = {}
+        for question, key in zip(questions, keys):
+            if key not in results:
+                pending.setdefault(key, question)
+
+        if self.answer_cache is not None:
+            REGISTRY.inc("qa_answer_cache_misses_total", len(pending))
+
+        if not pending:
+            return results, keys, {}
+
+        def search_timed(question):
+            with track_request() as timings:
+                with stage("retrieval"):
+                    return search_titles(question, self.num_articles_search,
+                                         self.backend), timings
+
+        with ThreadPoolExecutor(max_workers=max_concurrency) as executor:
+            searched = list(executor.map(search_timed, pending.values()))
+        retrieval_timings = {key: timings for key, (_, timings) in zip(pending, searched)}
+
+        with stage("retrieval"):
+            articles = get_articles_batch([titles for titles, _ in searched],
+                                          self.characters_per_article,
+                                          max_workers=self.retrieval_workers or max_concurrency,
+                                          page_timeout=self.page_timeout, backend=self.backend)
+
+        with stage("reading_comprehension"):
+            evaluations = self._score_many(list(zip(pending.values(), articles)),
+                                           max_concurrency)
+
+        for (key, question), question_evaluations in zip(pending.items(), evaluations):
+            try:
+                result = self._decider(question_evaluations, question)
+            except NoAnswerFound as err:
+                results[key] = {"question": question, "answer": None, "other_results": [],
+                                "error": str(err), "cache_hit": False}
+                continue
+            if self.answer_cache is not None:
+                self.answer_cache.set(key, self._cacheable(result))
+            results[key] = dict(result, cache_hit=False)
+
+        return results, keys, retrieval_timings
+
+
+    async def answer_questions_async(self, questions: List[str],
+                                     max_concurrency: int = 8) -> List[dict]:
+        """
+        Like `answer_questions`, but can be awaited without blocking the event loop.
+        """
+        loop = asyncio.get_running_loop()
 
-        for article_title, article_text in articles:
-            chunks = list(self._get_article_chunks(article_text, chunk_size))
-            for article_chunk in chunks:
-                logging.debug("Getting model prediction")
-                pred = get_model_predictions(question, article_chunk, self.model_server_address)
-
-                data = {
-                        "answer": pred["answer"],
-                        "context": article_chunk,
-                        "context_article_title": article_title,
-                        "start_scores_max": pred["start_scores_max"],
-                        "end_scores_max": pred["end_scores_max"],
-                        "start_scores": pred["start_scores"],
-                        "end_scores": pred["end_scores"]
-                        }
-
-                output.append(data)
-
-        return self._decider(output, question)
+        return await loop.run_in_executor(None, self.answer_questions, questions, max_concurrency)
@@ -0,0 +1,275 @@
+"""
+This module contains a cache for document retrieval, so that repeated and overlapping
+queries can be answered without going back to Wikipedia.
+
+The cache has two tiers: `MemoryCache`, an in-memory LRU cache, and `SQLiteCache`, which
+persists entries on disk. `TieredCache` combines them, and `CachedBackend` wraps the
+`wikipedia` module so that it can be passed as the `backend` of `get_articles`:
+
+    cache = TieredCache(MemoryCache(max_entries=1000, ttl=3600),
+                        SQLiteCache("articles.sqlite", max_entries=100000, ttl=86400))
+    articles = get_articles(query, 5, 2500, backend=CachedBackend(cache=cache))
+"""
+
+import json
+import logging
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from types import SimpleNamespace
+
+
+logging.info("Running article cache module")
+
+
+class MemoryCache:
+    """
+    An in-memory cache that evicts the least recently used entry when it is full.
+    `None` cannot be stored, because `get` returns `None` for a miss.
+
+    Attributes
+    ----------
+    max_entries : int
+        The maximum number of entries held in the cache.
+    ttl : float
+        Entries older than `ttl` seconds are treated as misses. None means no expiry.
+    hits : int
+        The number of calls to `get` that found an entry.
+    misses : int
+        The number of calls to `get` that did not find an entry.
+    """
+
+    def __init__(self, max_entries=1024, ttl=None):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()  # Maps keys to (created, value)
+        self._lock = threading.Lock()
+
+
+    def get(self, key):
+        """
+        Returns the value stored for `key`, or None.
+        """
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and self.ttl is not None and time.time() - entry[0] > self.ttl:
+                del self._entries[key]
+                entry = None
+
+            if entry is None:
+                self.misses += 1
+                return None
+
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[1]
+
+
+    def set(self, key, value):
+        """
+        Stores `value` under `key`, evicting the least recently used entries if necessary.
+        """
+        with self._lock:
+            self._entries[key] = (time.time(), value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+
+    def __len__(self):
+        return len(self._entries)
+
+
+class SQLiteCache:
+    """
+    A persistent cache stored in a SQLite database. Values must be JSON serializable.
+    When the cache is full, the least recently used entries are deleted.
+
+    Attributes
+    ----------
+    path : str
+        The location of the database file.
+    max_entries : int
+        The maximum number of entries held in the cache.
+    ttl : float
+        Entries older than `ttl` seconds are treated as misses. None means no expiry.
+    hits : int
+        The number of calls to `get` that found an entry.
+    misses : int
+        The number of calls to `get` that did not find an entry.
+    """
+
+    def __init__(self, path, max_entries=100000, ttl=None):
+        self.path = path
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        self._connection = sqlite3.connect(path, check_same_thread=False)
+        self._connection.execute("CREATE TABLE IF NOT EXISTS cache "
+                                 "(key TEXT PRIMARY KEY, value TEXT, created REAL, accessed REAL)")
+        self._connection.execute("CREATE INDEX IF NOT EXISTS cache_accessed ON cache (accessed)")
+        self._connection.commit()
+
+
+    def get(self, key):
+        """
+        Returns the value stored for `key`, or None.
+        """
+        now = time.time()
+        with self._lock:
+            row = self._connection.execute("SELECT value, created FROM cache WHERE key = ?",
+                                           (key,)).fetchone()
+            if row is not None and self.ttl is not None and now - row[1] > self.ttl:
+                self._connection.execute("DELETE FROM cache WHERE key = ?", (key,))
+                self._connection.commit()
+                row = None
+
+            if row is None:
+                self.misses += 1
+                return None
+
+            self._connection.execute("UPDATE cache SET accessed = ? WHERE key = ?", (now, key))
+            self._connection.commit()
+            self.hits += 1
+            return json.loads(row[0])
+
+
+    def set(self, key, value):
+        """
+        Stores `value` under `key`, evicting the least recently used entries if necessary.
+        """
+        now = time.time()
+        with self._lock:
+            self._connection.execute("INSERT OR REPLACE INTO cache VALUES (?, ?, ?, ?)",
+                                     (key, json.dumps(value), now, now))
+            self._connection.execute("DELETE FROM cache WHERE key IN (SELECT key FROM cache "
+                                     "ORDER BY accessed DESC LIMIT -1 OFFSET ?)",
+                                     (self.max_entries,))
+            self._connection.commit()
+
+
+    def __len__(self):
+        with self._lock:
+            return self._connection.execute("SELECT COUNT(*) FROM cache").fetchone()[0]
+
+
+class TieredCache:
+    """
+    Combines several caches, fastest first. A hit in a slower tier is copied into the
+    faster tiers, and `set` writes to every tier.
+
+    Attributes
+    ----------
+    tiers : list
+        The caches, i.e. [MemoryCache(...), SQLiteCache(...)]
+    hits : int
+        The number of calls to `get` that found an entry in any tier.
+    misses : int
+        The number of calls to `get` that did not find an entry in any tier.
+    """
+
+    def __init__(self, *tiers):
+        self.tiers = list(tiers)
+        self.hits = 0
+        self.misses = 0
+
+
+    def get(self, key):
+        """
+        Returns the value stored for `key` in the fastest tier that has it, or None.
+        """
+        for i, tier in enumerate(self.tiers):
+            value = tier.get(key)
+            if value is not None:
+                for faster_tier in self.tiers[:i]:
+                    faster_tier.set(key, value)
+                self.hits += 1
+                return value
+
+        self.misses += 1
+        return None
+
+
+    def set(self, key, value):
+        """
+        Stores `value` under `key` in every tier.
+        """
+        for tier in self.tiers:
+            tier.set(key, value)
+
+
+class CachedBackend:
+    """
+    Looks like the `wikipedia` module, but answers `search`, `suggest`, `page` and `summary`
+    from a cache when it can. Search results are keyed by the query and page text is keyed
+    by the resolved title of the article, so that different spellings that lead to the same
+    article share a cache entry. `summary` is only there if `backend` has it.
+
+    Attributes
+    ----------
+    backend : module
+        The search engine whose results are cached. Defaults to the `wikipedia` module.
+    cache : object
+        Any cache with `get` and `set`. Defaults to a `MemoryCache`.
+    """
+
+    def __init__(self, backend=None, cache=None):
+        if backend is None:
+            import wikipedia as backend  # pylint: disable=import-outside-toplevel
+        self.backend = backend
+        self.cache = cache if cache is not None else MemoryCache()
+        self.exceptions = backend.exceptions
+        if hasattr(backend, "summary"):
+            self.summary = self._summary
+
+
+    def search(self, query, results=10):
+        key = f"search:{results}:{query}"
+        titles = self.cache.get(key)
+        if titles is None:
+            titles = list(self.backend.search(query, results=results))
+            self.cache.set(key, titles)
+
+        return titles
+
+
+    def suggest(self, query):
+        key = f"suggest:{query}"
+        suggestion = self.cache.get(key)
+        if suggestion is None:
+            suggestion = self.backend.suggest(query)
+            if suggestion is not None:
+                self.cache.set(key, suggestion)
+
+        return suggestion
+
+
+    def page(self, title, auto_suggest=True):
+        # Find the resolved title of the article, then its text.
+        title_key = f"title:{title}" if auto_suggest else f"exact_title:{title}"
+        resolved_title = self.cache.get(title_key)
+        content = None if resolved_title is None else self.cache.get(f"page:{resolved_title}")
+
+        if content is None:
+            page = self.backend.page(title) if auto_suggest else \
+                   self.backend.page(title, auto_suggest=False)
+            resolved_title, content = page.title, page.content
+            self.cache.set(title_key, resolved_title)
+            self.cache.set(f"page:{resolved_title}", content)
+
+        return SimpleNamespace(title=resolved_title, content=content)
+
+
+    def _summary(self, title, auto_suggest=True):
+        key = f"summary:{title}" if auto_suggest else f"exact_summary:{title}"
+        summary = self.cache.get(key)
+        if summary is None:
+            summary = self.backend.summary(title, auto_suggest=auto_suggest)
+            self.cache.set(key, summary)
+
+        return summary
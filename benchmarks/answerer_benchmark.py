@@ -0,0 +1,244 @@
+"""
+An offline benchmark of `Answerer.answer_question`. Wikipedia is replaced by a fixture corpus
+(`benchmarks/corpus.json`) and the model server by `benchmarks.stubs.StubModelServer`, each with
+a configurable latency, so the results only depend on this library.
+
+For every configuration in `CONFIGURATIONS`, every question in the corpus is answered and
+this reports questions per second, the p50/p95/p99 latency, the number of model server
+requests and chunks per question, the peak memory allocated by Python (measured in a
+separate pass, so that `tracemalloc` doesn't slow down the timed one), and the mean time
+spent in each stage (see `metrics`). Run it from the root of the repository:
+
+    python -m benchmarks.answerer_benchmark --output results.json
+    python -m benchmarks.answerer_benchmark --baseline results.json
+
+With `--baseline`, the exit code is 1 if any configuration got slower than the baseline by
+more than `--tolerance`.
+"""
+
+import argparse
+import json
+import os
+import re
+import sys
+import time
+import tracemalloc
+from collections import defaultdict
+import numpy as np
+
+from answer_question import Answerer
+from benchmarks.stubs import StubModelServer, StubWikipedia
+
+
+CORPUS = os.path.join(os.path.dirname(os.path.abspath(__file__)), "corpus.json")
+
+# Maps the name of each configuration to the keyword arguments of `Answerer`.
+CONFIGURATIONS = {
+    "words": {},
+    "words_unbatched": {"max_batch": 1},
+    "words_concurrent": {"retrieval_workers": 5},
+    "tokens": {"chunking": "tokens", "retrieval_workers": 5},
+    "tokens_rerank": {"chunking": "tokens", "retrieval_workers": 5, "rerank_top_n": 3},
+    "streaming": {"streaming": True, "chunking": "tokens"},
+    "answer_cache": {"answer_cache_size": 1024, "retrieval_workers": 5},
+    "processes": {"chunking": "tokens", "retrieval_workers": 5, "process_pool": 2},
+}
+
+
+class CorpusWikipedia(StubWikipedia):
+    """
+    A `StubWikipedia` whose search ranks the articles by the number of query words they
+    contain, so that different questions retrieve different articles.
+    """
+
+    def search(self, query, results=10):
+        words = set(re.findall(r"\w+", query.lower()))
+
+        def matches(title):
+            return len(words & set(re.findall(r"\w+", self.articles[title].lower())))
+
+        return sorted(self.articles, key=lambda title: (-matches(title), title))[:results]
+
+
+def load_corpus(path: str = CORPUS) -> dict:
+    """
+    Returns the fixture corpus, a dict with the keys `articles` (titles mapped to text)
+    and `questions`.
+    """
+    with open(path, encoding="utf-8") as corpus_file:
+        return json.load(corpus_file)
+
+
+def _peak_memory(answerer: Answerer, questions: list) -> int:
+    """
+    Answers every question once with `tracemalloc` on, and returns the peak memory
+    allocated by Python.
+    """
+    tracemalloc.start()
+    try:
+        for question in questions:
+            answerer.answer_question(question)
+        _, peak_memory = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+
+    return peak_memory
+
+
+def run_configuration(make_answerer, questions: list, server: StubModelServer,
+                      repeat: int = 1) -> dict:
+    """
+    Answers every question `repeat` times, one at a time, and returns the measurements.
+    `make_answerer` returns a new `Answerer`. The peak memory is measured in a separate pass
+    with another `Answerer`, because `tracemalloc` slows everything down a lot.
+    """
+    answerer = make_answerer()
+    requests_before, instances_before = server.requests, server.instances
+    latencies = []
+    stages = defaultdict(float)
+
+    try:
+        start = time.perf_counter()
+        for _ in range(repeat):
+            for question in questions:
+                question_start = time.perf_counter()
+                ans = answerer.answer_question(question)
+                latencies.append(time.perf_counter() - question_start)
+                for name, seconds in ans["timings"].items():
+                    stages[name] += seconds
+        elapsed = time.perf_counter() - start
+    finally:
+        answerer.close()
+
+    num_questions = len(latencies)
+    model_calls = server.requests - requests_before
+    chunks = server.instances - instances_before
+    p50, p95, p99 = np.percentile(latencies, [50, 95, 99])
+
+    answerer = make_answerer()
+    try:
+        peak_memory = _peak_memory(answerer, questions)
+    finally:
+        answerer.close()
+
+    return {"questions": num_questions,
+            "questions_per_second": num_questions / elapsed,
+            "latency_p50": float(p50),
+            "latency_p95": float(p95),
+            "latency_p99": float(p99),
+            "model_calls_per_question": model_calls / num_questions,
+            "chunks_per_question": chunks / num_questions,
+            "peak_memory_bytes": peak_memory,
+            "stage_seconds_per_question": {name: seconds / num_questions
+                                           for name, seconds in sorted(stages.items())}}
+
+
+def run_benchmark(configurations: dict = None, model_latency: float = 0.02,
+                  page_latency: float = 0.01, repeat: int = 1, num_questions: int = None,
+                  corpus: dict = None) -> dict:
+    """
+    Runs every configuration against the same corpus and stub model server.
+
+    Parameters
+    ----------
+    configurations : dict
+        Maps names to `Answerer` keyword arguments. Defaults to `CONFIGURATIONS`.
+    model_latency : float
+        The number of seconds the stub model server takes to answer each request.
+    page_latency : float
+        The number of seconds the stub backend takes to return each article.
+    repeat : int
+        The number of times each question is answered.
+    num_questions : int
+        If set, only the first `num_questions` questions of the corpus are used.
+    corpus : dict
+        Defaults to the fixture corpus, see `load_corpus`.
+
+    Returns
+    -------
+    dict
+        The settings under "settings" and the measurements of each configuration
+        under "results".
+    """
+    configurations = CONFIGURATIONS if configurations is None else configurations
+    corpus = load_corpus() if corpus is None else corpus
+    questions = corpus["questions"][:num_questions]
+
+    results = {}
+    with StubModelServer(latency=model_latency) as server:
+        for name, kwargs in configurations.items():
+            def make_answerer(kwargs=kwargs):
+                backend = CorpusWikipedia(corpus["articles"],
+                                          delays=dict.fromkeys(corpus["articles"], page_latency))
+                return Answerer(server.address, backend=backend, **kwargs)
+
+            results[name] = run_configuration(make_answerer, questions, server, repeat)
+
+    return {"settings": {"model_latency": model_latency, "page_latency": page_latency,
+                         "repeat": repeat, "questions": len(questions)},
+            "results": results}
+
+
+def find_regressions(results: dict, baseline: dict, tolerance: float = 0.2) -> list:
+    """
+    Compares two outputs of `run_benchmark` and returns a description of every
+    configuration whose throughput or p95 latency is worse than the baseline by more
+    than `tolerance` (a fraction).
+    """
+    regressions = []
+    for name, result in results["results"].items():
+        if name not in baseline["results"]:
+            continue
+        previous = baseline["results"][name]
+
+        if result["questions_per_second"] < previous["questions_per_second"] * (1 - tolerance):
+            regressions.append(f"{name}: {result['questions_per_second']:.2f} questions/s, "
+                               f"was {previous['questions_per_second']:.2f}")
+        if result["latency_p95"] > previous["latency_p95"] * (1 + tolerance):
+            regressions.append(f"{name}: p95 latency {result['latency_p95']:.3f}s, "
+                               f"was {previous['latency_p95']:.3f}s")
+
+    return regressions
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="Benchmark Answerer.answer_question offline.")
+    parser.add_argument("--config", action="append", choices=sorted(CONFIGURATIONS),
+                        help="A configuration to run (can be repeated). Defaults to all of them.")
+    parser.add_argument("--model-latency", type=float, default=0.02,
+                        help="Seconds the stub model server takes per request.")
+    parser.add_argument("--page-latency", type=float, default=0.01,
+                        help="Seconds the stub backend takes per article.")
+    parser.add_argument("--repeat", type=int, default=1,
+                        help="The number of times each question is answered.")
+    parser.add_argument("--questions", type=int, default=None,
+                        help="Only use the first QUESTIONS questions of the corpus.")
+    parser.add_argument("--output", help="Write the results to this JSON file.")
+    parser.add_argument("--baseline", help="Compare the results to this JSON file.")
+    parser.add_argument("--tolerance", type=float, default=0.2,
+                        help="The fraction by which a result may be worse than the baseline.")
+    args = parser.parse_args(argv)
+
+    configurations = {name: CONFIGURATIONS[name] for name in args.config} if args.config \
+                     else CONFIGURATIONS
+    results = run_benchmark(configurations, args.model_latency, args.page_latency,
+                            args.repeat, args.questions)
+
+    text = json.dumps(results, indent=2)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as output_file:
+            output_file.write(text)
+    print(text)
+
+    if args.baseline:
+        with open(args.baseline, encoding="utf-8") as baseline_file:
+            regressions = find_regressions(results, json.load(baseline_file), args.tolerance)
+        for regression in regressions:
+            print(f"REGRESSION {regression}", file=sys.stderr)
+        return 1 if regressions else 0
+
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,70 @@
+"""
+Measures how long it takes to start using this library, each time in a fresh interpreter:
+
+- importing each module (the tokenizer and `wikipedia` are only loaded when first used),
+- loading the tokenizer from the `tokenizer.json` snapshot,
+- loading it with `transformers` from the vocabulary, as importing `reading_comprehension`
+  used to do.
+
+Run it from the root of the repository:
+
+    python -m benchmarks.import_benchmark --repeat 5
+"""
+
+import argparse
+import json
+import os
+import subprocess
+import sys
+import numpy as np
+
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Maps the name of each measurement to the code that is timed.
+SNIPPETS = {
+    "import_answer_question": "import answer_question",
+    "import_reading_comprehension": "import reading_comprehension",
+    "import_serve": "import serve",
+    "load_snapshot_tokenizer": "import reading_comprehension\n"
+                               "reading_comprehension.get_tokenizer()",
+    "load_transformers_tokenizer": "from transformers import BertTokenizer, BertTokenizerFast\n"
+                                   "BertTokenizer.from_pretrained('models/tokenizer')\n"
+                                   "BertTokenizerFast.from_pretrained('models/tokenizer')",
+}
+
+TIMER = """
+import time
+start = time.perf_counter()
+{}
+print(time.perf_counter() - start)
+"""
+
+
+def time_snippet(code: str, repeat: int = 3) -> float:
+    """
+    Runs `code` in `repeat` fresh interpreters and returns the median number of seconds.
+    """
+    times = []
+    for _ in range(repeat):
+        output = subprocess.run([sys.executable, "-c", TIMER.format(code)], cwd=ROOT,
+                                check=True, capture_output=True, text=True).stdout
+        times.append(float(output.split()[-1]))
+
+    return float(np.median(times))
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="Measure the import and startup time.")
+    parser.add_argument("--repeat", type=int, default=3,
+                        help="The number of fresh interpreters per measurement.")
+    args = parser.parse_args(argv)
+
+    results = {name: time_snippet(code, args.repeat) for name, code in SNIPPETS.items()}
+    print(json.dumps(results, indent=2))
+
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,179 @@
+"""
+Local stand-ins for the external services used by this library, so that the tests and
+the benchmarks can run without an internet connection or a model server.
+"""
+
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from types import SimpleNamespace
+from document_retrieval import split_sections
+
+
+class StubPageError(Exception):
+    """
+    Raised by `StubWikipedia.page` for unknown titles, like `wikipedia.exceptions.PageError`.
+    """
+
+
+class StubWikipedia:
+    """
+    Looks like the `wikipedia` module, but serves articles from a dict.
+
+    Attributes
+    ----------
+    articles : dict
+        Maps article titles to their text.
+    delays : dict
+        Maps article titles to the number of seconds `page` sleeps before returning.
+    failures : dict
+        Maps article titles to the number of times `page` raises before it succeeds.
+    suggestions : dict
+        Maps "incorrect" titles to the titles returned by `suggest`. `search` returns
+        these "incorrect" titles first, followed by the titles in `articles`.
+    redirects : dict
+        Maps titles to the titles that `page` resolves them to unless `auto_suggest` is
+        False, like the auto-suggest of `wikipedia.page`.
+    page_calls : list
+        The titles passed to `page`, in order.
+    summary_calls : list
+        The titles passed to `summary`, which returns the text before the first section
+        heading.
+    """
+    exceptions = SimpleNamespace(PageError=StubPageError)
+
+    def __init__(self, articles, delays=None, failures=None, suggestions=None, redirects=None):
+        self.articles = articles
+        self.delays = delays or {}
+        self.failures = dict(failures or {})
+        self.suggestions = suggestions or {}
+        self.redirects = redirects or {}
+        self.page_calls = []
+        self.summary_calls = []
+        self._lock = threading.Lock()
+
+    def search(self, query, results=10):
+        return (list(self.suggestions) + list(self.articles))[:results]
+
+    def suggest(self, title):
+        return self.suggestions.get(title)
+
+    def page(self, title, auto_suggest=True):
+        with self._lock:
+            self.page_calls.append(title)
+            fail = self.failures.get(title, 0) > 0
+            if fail:
+                self.failures[title] -= 1
+
+        time.sleep(self.delays.get(title, 0))
+        if fail:
+            raise ConnectionError(f"Could not download {title}")
+        if auto_suggest:
+            title = self.redirects.get(title, title)
+        if title not in self.articles:
+            raise StubPageError(title)
+
+        return SimpleNamespace(title=title, content=self.articles[title])
+
+    def summary(self, title, auto_suggest=True):  # pylint: disable=unused-argument
+        with self._lock:
+            self.summary_calls.append(title)
+
+        time.sleep(self.delays.get(title, 0))
+        if title not in self.articles:
+            raise StubPageError(title)
+
+        return split_sections(self.articles[title])[0]
+
+
+class StubModelServer:
+    """
+    A local HTTP server that answers TF Serving `:predict` requests in either the row
+    ("instances") or the columnar ("inputs") format with deterministic logits. Tokens
+    whose id is in `answer_ids` get a high score, so they are chosen as the answer.
+    Use it as a context manager:
+
+        with StubModelServer() as server:
+            get_model_predictions(question, context, server.address)
+
+    Attributes
+    ----------
+    address : str
+        The `:predict` address of the server.
+    answer_ids : set
+        Token ids that get a high start and end score. Defaults to "paris".
+    latency : float
+        The number of seconds the server waits before answering each request.
+    requests : int
+        The number of requests answered so far.
+    instances : int
+        The number of instances scored so far.
+    """
+
+    def __init__(self, answer_ids=(3000,), latency=0.0):
+        self.answer_ids = set(answer_ids)
+        self.latency = latency
+        self.requests = 0
+        self.instances = 0
+        self._lock = threading.Lock()
+        self._server = ThreadingHTTPServer(("127.0.0.1", 0), self._handler())
+        self._server.daemon_threads = True
+        self.address = f"http://127.0.0.1:{self._server.server_port}/v1/models/stub:predict"
+
+
+    def logits(self, input_ids):
+        """
+        Returns the (deterministic) start and end logits for a list of token ids.
+        """
+        scores = [10.0 if token_id in self.answer_ids else ((token_id * 31 + i) % 97) / 100
+                  for i, token_id in enumerate(input_ids)]
+        return scores, scores
+
+
+    def _predict(self, request):
+        if "inputs" in request:
+            batch = request["inputs"]["input_ids"]
+        else:
+            batch = [instance["input_ids"] for instance in request["instances"]]
+
+        with self._lock:
+            self.requests += 1
+            self.instances += len(batch)
+        time.sleep(self.latency)
+
+        logits = [self.logits(input_ids) for input_ids in batch]
+        if "inputs" in request:
+            return {"outputs": {"start_logits": [start for start, _ in logits],
+                                "end_logits": [end for _, end in logits]}}
+        return {"predictions": [{"start_logits": start, "end_logits": end}
+                                for start, end in logits]}
+
+
+    def _handler(self):
+        stub = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_POST(self):  # pylint: disable=invalid-name
+                request = json.loads(self.rfile.read(int(self.headers["content-length"])))
+                body = json.dumps(stub._predict(request)).encode()  # pylint: disable=protected-access
+                self.send_response(200)
+                self.send_header("content-type", "application/json")
+                self.send_header("content-length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, *args):  # pylint: disable=arguments-differ
+                pass
+
+        return Handler
+
+
+    def __enter__(self):
+        threading.Thread(target=self._server.serve_forever, daemon=True).start()
+        return self
+
+
+    def __exit__(self, *exc):
+        self._server.shutdown()
+        self._server.server_close()
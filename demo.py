@@ -1,25 +1,29 @@
 """
 A demonstration of how to use this library.
 Make sure you have a model server up and running!
+To answer questions over HTTP instead, run `python serve.py`.
 """
 
 import logging
-import yaml
 from answer_question import Answerer
+from local_index import LocalIndex
+from serve import load_config
 
 
 # Change this to debug if you want to see documents being downloaded.
 logging.basicConfig(level=logging.INFO)
 
 # Model Server config
-with open("model_server_config.yaml") as conf:
-    config = yaml.load(conf, Loader=yaml.FullLoader)
-    MODEL_SERVER = f"http://{config['model_server_url']}:{config['model_server_port']}/v{config['model_version']}/models/{config['model_name']}:predict"
+config = load_config("model_server_config.yaml")
+MODEL_SERVER = config["model_server_address"]
+
+# Search a local index instead of Wikipedia if one is configured.
+BACKEND = LocalIndex(config["local_index"]) if config.get("local_index") else None
 
 # Build the query.
 logging.info("Beginning QA")
 
-answerer = Answerer(model_server_address=MODEL_SERVER)
+answerer = Answerer(model_server_address=MODEL_SERVER, backend=BACKEND)
 
 print("Ask a question, i.e. 'what is the capital of France?'")
 print("To exit the session, type 'end'")
@@ -1,18 +1,180 @@
 """
-This module contains one function, `get_articles`, which performs document retrieval:
+This module contains the function `get_articles`, which performs document retrieval:
 https://en.wikipedia.org/wiki/Document_retrieval
 In other words, this is a search engine.
+
+`get_articles_concurrent` does the same thing, but downloads all the articles in parallel.
+`iter_articles` also downloads in parallel, but yields each article as soon as it arrives.
+`iter_article_depths` reads the introductions of the articles first, and their sections
+only when asked for them.
+All of them accept a `backend`, which is any object that looks like the `wikipedia`
+module (it must have `search`, `page`, `suggest` and `exceptions.PageError`, and may have
+`summary`). See `article_cache.CachedBackend` for a backend that caches results.
 """
-from typing import List
+from typing import Callable, Iterator, List
+import functools
 import logging
-import wikipedia as wiki
+import queue
+import re
+import threading
+import time
+from metrics import REGISTRY, run_in_context, stage
 
 
 logging.basicConfig(level=logging.INFO)
 logging.info("Running doc retrieval module")
 
 
-def get_articles(query: str, num_articles_search: int, characters_per_article: int) -> List[tuple]:
+def _default_backend():
+    """
+    Returns the `wikipedia` module. It is only imported when it is first needed, because
+    importing it is slow.
+    """
+    import wikipedia  # pylint: disable=import-outside-toplevel
+
+    return wikipedia
+
+
+# Wikipedia section headings, i.e. "== History ==", each on a line of its own.
+SECTION_HEADING = re.compile(r"\n(?==+[^=\n]+=+ *\n)")
+
+
+def split_sections(text: str) -> List[str]:
+    """
+    Splits the text of an article before every section heading. The first part is the
+    introduction, the other parts start with their heading.
+    """
+    return [section for section in SECTION_HEADING.split(text) if section.strip()]
+
+
+def _download(title: str, backend, intro: bool, auto_suggest: bool = True) -> str:
+    """
+    Downloads the whole text of an article, or only its introduction. The introduction is
+    always looked up by its exact title; the whole text only if `auto_suggest` is False.
+    """
+    if intro:
+        with stage("wiki_summary"):
+            text = backend.summary(title, auto_suggest=False)
+        REGISTRY.inc("qa_article_intros_downloaded_total")
+    else:
+        with stage("wiki_page"):
+            page = backend.page(title) if auto_suggest else \
+                   backend.page(title, auto_suggest=False)
+            text = page.content
+        REGISTRY.inc("qa_articles_downloaded_total")
+
+    REGISTRY.inc("qa_article_characters_downloaded_total", len(text))
+    return text
+
+
+def _fetch_article(title: str, characters_per_article: int, backend=None, retries: int = 0,
+                   intro: bool = False, auto_suggest: bool = True) -> tuple:
+    """
+    Downloads the text of a single article, retrying up to `retries` times if the
+    download fails for reasons other than an invalid title. If `intro` is True, only the
+    introduction is downloaded, with `backend.summary`. If `auto_suggest` is False, the
+    backend must not resolve the title to another article (see `_download`).
+
+    Returns
+    -------
+    tuple
+        A tuple of (article_title, article_text).
+    """
+    backend = _default_backend() if backend is None else backend
+    not_retried = (backend.exceptions.PageError,
+                   getattr(backend.exceptions, "DisambiguationError", backend.exceptions.PageError))
+
+    for attempt in range(retries + 1):
+        try:
+            try:
+                # Try to get the text of the article.
+                text = _download(title, backend, intro, auto_suggest)[:characters_per_article]
+            except backend.exceptions.PageError:
+                # Not all the results returned by wiki.search are valid titles.
+                # wiki.suggest returns a valid title for the "incorrect" title
+                # i.e. "Joe Biden" -> "joe biden n"
+                with stage("wiki_suggest"):
+                    title = backend.suggest(title)
+                text = _download(title, backend, intro, auto_suggest)[:characters_per_article]
+
+            return title, text
+        except not_retried:
+            raise
+        except Exception as err:  # pylint: disable=broad-except
+            if attempt == retries:
+                REGISTRY.inc("qa_article_errors_total")
+                raise
+            logging.debug("Retrying article %s after error: %s", title, err)
+            time.sleep(0.1 * 2 ** attempt)
+
+
+def _run_with_deadlines(downloads: List[Callable], titles: List[str], max_workers: int,
+                        page_timeout: float) -> Iterator[tuple]:
+    """
+    Runs the functions in `downloads` on up to `max_workers` threads and yields
+    (rank, result) in the order that they finish, where rank is the position of the
+    function in `downloads` and `titles[rank]` is the article it downloads.
+
+    Downloads that fail or take more than `page_timeout` seconds are dropped. A download
+    that times out stops counting against `max_workers`, so it cannot stall the others.
+    """
+    results = queue.Queue()
+    waiting = list(enumerate(downloads))[::-1]
+    running = {}  # Maps the rank of each running download to its deadline.
+
+    @run_in_context
+    def worker(rank, download):
+        try:
+            results.put((rank, download(), None))
+        except Exception as err:  # pylint: disable=broad-except
+            results.put((rank, None, err))
+
+    while waiting or running:
+        while waiting and len(running) < max_workers:
+            rank, download = waiting.pop()
+            running[rank] = time.monotonic() + page_timeout
+            threading.Thread(target=worker, args=(rank, download), daemon=True).start()
+
+        try:
+            timeout = max(0, min(running.values()) - time.monotonic())
+            rank, result, err = results.get(timeout=timeout)
+        except queue.Empty:
+            now = time.monotonic()
+            for rank in [rank for rank, deadline in running.items() if deadline <= now]:
+                logging.warning("Timed out downloading article %s", titles[rank])
+                REGISTRY.inc("qa_article_timeouts_total")
+                del running[rank]
+            continue
+
+        if rank not in running:
+            # This download already timed out.
+            continue
+        del running[rank]
+
+        if err is not None:
+            logging.warning("Could not download article %s: %s", titles[rank], err)
+            continue
+
+        yield rank, result
+
+
+def _fetch_concurrently(titles: List[str], characters_per_article: int, max_workers: int,
+                        page_timeout: float, retries: int, backend=None) -> Iterator[tuple]:
+    """
+    Downloads the articles in `titles` on up to `max_workers` threads and yields
+    (rank, (article_title, article_text)) in the order that the downloads finish,
+    where rank is the position of the title in `titles`. Articles that fail or take more
+    than `page_timeout` seconds are dropped, see `_run_with_deadlines`.
+    """
+    backend = _default_backend() if backend is None else backend
+    downloads = [functools.partial(_fetch_article, title, characters_per_article, backend,
+                                   retries) for title in titles]
+
+    return _run_with_deadlines(downloads, titles, max_workers, page_timeout)
+
+
+def get_articles(query: str, num_articles_search: int, characters_per_article: int,
+                 backend=None) -> List[tuple]:
     """
     This function takes a query and downloads the text if relevant Wikipedia articles.
 
@@ -27,6 +189,8 @@ def get_articles(query: str, num_articles_search: int, characters_per_article: i
         The number of characters that will be included. The answer to a question
         is usually in the beginning of an article, so it's not necessary to search
         the entire article.
+    backend : module
+        The search engine. Defaults to the `wikipedia` module.
 
     Returns
     -------
@@ -36,23 +200,215 @@ def get_articles(query: str, num_articles_search: int, characters_per_article: i
         ("Barack Obama", "Barack Obama is a politician..."), ...]
     """
     logging.debug("Retrieving documents")
+    backend = _default_backend() if backend is None else backend
 
-    # A list of article titles - these may not be the "correct" titles (see below)
-    article_titles = wiki.search(query, results=num_articles_search)
+    # A list of article titles - these may not be the "correct" titles (see `_fetch_article`)
+    with stage("wiki_search"):
+        article_titles = backend.search(query, results=num_articles_search)
 
     # Collect tuples of (article_title, article_text)
-    article_data = []
-    for title in article_titles:
-        try:
-            # Try to get the text of the article.
-            text = wiki.page(title).content[:characters_per_article]
-        except wiki.exceptions.PageError:
-            # Not all the results returned by wiki.search are valid titles.
-            # wiki.suggest returns a valid title for the "incorrect" title
-            # i.e. "Joe Biden" -> "joe biden n"
-            title = wiki.suggest(title)
-            text = wiki.page(title).content[:characters_per_article]
-
-        article_data.append((title, text))
-
-    return article_data
+    return [_fetch_article(title, characters_per_article, backend) for title in article_titles]
+
+
+def get_articles_concurrent(query: str, num_articles_search: int, characters_per_article: int,
+                            max_workers: int = 4, page_timeout: float = 10.0, retries: int = 1,
+                            backend=None) -> List[tuple]:
+    """
+    Like `get_articles`, but all the articles are downloaded in parallel. The articles are
+    returned in the order that they were ranked by the search engine. Articles that cannot
+    be downloaded within `page_timeout` seconds (after `retries` retries) are left out.
+
+    Parameters
+    ----------
+    query : str
+        A query that will be used to identify relevant wikipedia articles.
+    num_articles_search : int
+        The number of articles that will be searched and downloaded.
+    characters_per_article : int
+        The number of characters that will be included.
+    max_workers : int
+        The maximum number of articles downloaded at the same time.
+    page_timeout : float
+        The number of seconds to wait for a single article.
+    retries : int
+        The number of times a failed download is retried.
+    backend : module
+        The search engine. Defaults to the `wikipedia` module.
+
+    Returns
+    -------
+    list
+        A list of (article_title, article_text) tuples, as in `get_articles`.
+    """
+    logging.debug("Retrieving documents concurrently")
+    backend = _default_backend() if backend is None else backend
+
+    with stage("wiki_search"):
+        article_titles = backend.search(query, results=num_articles_search)
+
+    articles = sorted(_fetch_concurrently(article_titles, characters_per_article, max_workers,
+                                          page_timeout, retries, backend))
+
+    return [article for _, article in articles]
+
+
+def search_titles(query: str, num_articles_search: int, backend=None) -> List[str]:
+    """
+    Returns the titles of the `num_articles_search` best search results for a query.
+    """
+    backend = _default_backend() if backend is None else backend
+
+    with stage("wiki_search"):
+        return list(backend.search(query, results=num_articles_search))
+
+
+def get_articles_batch(titles: List[List[str]], characters_per_article: int,
+                       max_workers: int = 4, page_timeout: float = 10.0, retries: int = 1,
+                       backend=None) -> List[List[tuple]]:
+    """
+    Downloads the articles found for many queries (see `search_titles`) in parallel. A title
+    found by several queries is only downloaded once. Articles that cannot be downloaded
+    are left out, as in `get_articles_concurrent`.
+
+    Parameters
+    ----------
+    titles : list
+        One list of article titles per query.
+    characters_per_article : int
+        The number of characters that will be included.
+    max_workers : int
+        The maximum number of articles downloaded at the same time.
+    page_timeout : float
+        The number of seconds to wait for a single article.
+    retries : int
+        The number of times a failed download is retried.
+    backend : module
+        The search engine. Defaults to the `wikipedia` module.
+
+    Returns
+    -------
+    list
+        One list of (article_title, article_text) tuples per query, in search order.
+    """
+    unique_titles = list(dict.fromkeys(title for query_titles in titles for title in query_titles))
+    articles = {unique_titles[rank]: article for rank, article in _fetch_concurrently(
+        unique_titles, characters_per_article, max_workers, page_timeout, retries, backend)}
+
+    return [[articles[title] for title in query_titles if title in articles]
+            for query_titles in titles]
+
+
+def iter_articles(query: str, num_articles_search: int, characters_per_article: int,
+                  max_workers: int = 4, page_timeout: float = 10.0, retries: int = 1,
+                  backend=None) -> Iterator[tuple]:
+    """
+    Like `get_articles_concurrent`, but yields each (article_title, article_text) tuple as
+    soon as it has been downloaded, so that the caller can start working on the first
+    article while the others are still downloading. The articles are yielded in the order
+    that they finish, not in search order. If the caller stops iterating early, no further
+    downloads are started.
+
+    Parameters
+    ----------
+    See `get_articles_concurrent`.
+
+    Yields
+    ------
+    tuple
+        (article_title, article_text)
+    """
+    logging.debug("Streaming documents")
+    backend = _default_backend() if backend is None else backend
+
+    with stage("wiki_search"):
+        article_titles = backend.search(query, results=num_articles_search)
+
+    for _, article in _fetch_concurrently(article_titles, characters_per_article, max_workers,
+                                          page_timeout, retries, backend):
+        yield article
+
+
+def iter_article_sections(title: str, characters_per_article: int, backend=None,
+                          retries: int = 1) -> Iterator[tuple]:
+    """
+    Yields the introduction of an article, then each of its sections, until
+    `characters_per_article` characters have been yielded. Only the introduction is
+    downloaded (with `backend.summary`) until the first section is asked for. Both are
+    looked up without auto-suggest, so that they come from the same article. Backends
+    without `summary` yield the first `characters_per_article` characters at once.
+
+    Yields
+    ------
+    tuple
+        (article_title, text)
+    """
+    backend = _default_backend() if backend is None else backend
+    if not hasattr(backend, "summary"):
+        yield _fetch_article(title, characters_per_article, backend, retries)
+        return
+
+    title, intro = _fetch_article(title, characters_per_article, backend, retries, intro=True)
+    if intro.strip():
+        yield title, intro
+    if len(intro) >= characters_per_article:
+        return
+
+    _, text = _fetch_article(title, characters_per_article, backend, retries,
+                             auto_suggest=False)
+    if text.startswith(intro):
+        text = text[len(intro):]
+
+    for section in split_sections(text):
+        yield title, section
+
+
+def iter_article_depths(query: str, num_articles_search: int, characters_per_article: int,
+                        max_workers: int = 4, page_timeout: float = 10.0, retries: int = 1,
+                        backend=None) -> Iterator[List[tuple]]:
+    """
+    Reads the articles for a query one level deeper at a time: first yields the
+    introductions of all the articles, then the next section of every article that has
+    one, and so on (see `iter_article_sections`). The rest of an article is only
+    downloaded when its first section is asked for, so a caller that stops after the
+    introductions doesn't download the whole articles. Articles that fail, or that take
+    more than `page_timeout` seconds at any depth, are dropped.
+
+    Parameters
+    ----------
+    query : str
+        A query that will be used to identify relevant wikipedia articles.
+    num_articles_search : int
+        The number of articles that will be searched.
+    characters_per_article : int
+        The maximum number of characters read from each article.
+    max_workers : int
+        The maximum number of articles downloaded at the same time.
+    page_timeout : float
+        The number of seconds to wait for the next part of a single article.
+    retries : int
+        The number of times a failed download is retried.
+    backend : module
+        The search engine. Defaults to the `wikipedia` module.
+
+    Yields
+    ------
+    list
+        (article_title, text) tuples, in search order, with one part of each article.
+    """
+    logging.debug("Retrieving documents incrementally")
+    backend = _default_backend() if backend is None else backend
+
+    titles = search_titles(query, num_articles_search, backend)
+    readers = [iter_article_sections(title, characters_per_article, backend, retries)
+               for title in titles]
+
+    while readers:
+        # A reader that has no more parts returns None.
+        parts = dict(_run_with_deadlines([functools.partial(next, reader, None)
+                                          for reader in readers],
+                                         titles, max_workers, page_timeout))
+        ranks = [rank for rank in sorted(parts) if parts[rank] is not None]
+        readers = [readers[rank] for rank in ranks]
+        titles = [titles[rank] for rank in ranks]
+        if ranks:
+            yield [parts[rank] for rank in ranks]
@@ -0,0 +1,178 @@
+"""
+This module contains the class DynamicBatcher, an `inference_backend.InferenceBackend` that
+combines the instances of many concurrent `predict` calls into larger batches before they
+are sent to the model server. Each `Answerer.answer_question` call only has a few chunks,
+so when a service answers many questions at the same time, batching them together keeps
+the model server busy with fewer, fuller requests.
+
+    batcher = DynamicBatcher(ModelServerClient(address), max_batch_size=64, max_wait_ms=5)
+    answerer = Answerer(batcher)
+"""
+
+import logging
+import queue
+import threading
+import time
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import List
+from inference_backend import InferenceBackend
+from metrics import REGISTRY, stage
+
+
+logging.info("Running dynamic batching module")
+
+
+class BatcherOverloaded(Exception):
+    """
+    Raised by `DynamicBatcher.predict` when its queue is full, so that the caller can shed
+    the request (i.e. answer with "503 Service Unavailable") instead of waiting.
+    """
+
+
+class DynamicBatcher(InferenceBackend):
+    """
+    Attributes
+    ----------
+    backend : InferenceBackend
+        The backend that scores the combined batches, i.e. a `ModelServerClient`.
+    max_batch_size : int
+        The maximum number of instances in a combined batch. A single call with more
+        instances is sent on its own.
+    max_wait_ms : float
+        How long the first call in a batch waits for other calls to join it.
+    max_queue_size : int
+        The maximum number of calls waiting to be batched. When the queue is full,
+        `predict` raises `BatcherOverloaded`.
+    max_in_flight : int
+        The maximum number of combined batches sent to the backend at the same time.
+    pad_token_id : int
+        The id used to pad instances of different lengths to the same length.
+
+    Methods
+    -------
+    predict
+        Queues a batch of instances and waits for its start and end logits.
+    ready
+        Returns True if the batcher is running and has room in its queue.
+    close
+        Stops accepting calls, answers the calls that were already queued, and closes the
+        backend.
+    """
+
+    def __init__(self, backend: InferenceBackend, max_batch_size=64, max_wait_ms=5.0,
+                 max_queue_size=256, max_in_flight=2, pad_token_id=0):
+        self.backend = backend
+        self.max_batch_size = max_batch_size
+        self.max_wait_ms = max_wait_ms
+        self.max_queue_size = max_queue_size
+        self.max_in_flight = max_in_flight
+        self.pad_token_id = pad_token_id
+
+        self._queue = queue.Queue(maxsize=max_queue_size)
+        self._in_flight = threading.BoundedSemaphore(max_in_flight)
+        self._executor = ThreadPoolExecutor(max_workers=max_in_flight)
+        self._closed = threading.Event()
+        self._lock = threading.Lock()  # Makes sure that nothing is queued after `close`.
+        self._dispatcher = threading.Thread(target=self._collect, daemon=True)
+        self._dispatcher.start()
+
+
+    def predict(self, instances: List[dict]) -> tuple:
+        future = Future()
+        with self._lock:
+            if self._closed.is_set():
+                raise RuntimeError("The batcher is closed")
+            try:
+                self._queue.put_nowait((instances, future))
+            except queue.Full:
+                REGISTRY.inc("qa_batcher_rejected_total")
+                raise BatcherOverloaded(f"More than {self.max_queue_size} batches are waiting")
+
+        with stage("batch_wait"):
+            return future.result()
+
+
+    def ready(self) -> bool:
+        return not self._closed.is_set() and self._dispatcher.is_alive() and \
+               not self._queue.full()
+
+
+    def close(self):
+        with self._lock:
+            self._closed.set()
+        self._dispatcher.join()
+        self._executor.shutdown()
+        self.backend.close()
+
+
+    def _collect(self):
+        """
+        Groups queued calls into batches of up to `max_batch_size` instances, waiting up
+        to `max_wait_ms` after the first call of each batch, and dispatches them.
+        """
+        carry = None  # A call that did not fit in the previous batch.
+
+        # After `close`, the calls that were queued before it are still dispatched. Nothing
+        # can be queued after it, so an empty queue means that they are all done.
+        while not self._closed.is_set() or carry is not None or not self._queue.empty():
+            if carry is None:
+                try:
+                    carry = self._queue.get(timeout=0.1)
+                except queue.Empty:
+                    continue
+
+            items, size = [carry], len(carry[0])
+            carry = None
+            deadline = time.monotonic() + self.max_wait_ms / 1000
+
+            while size < self.max_batch_size:
+                try:
+                    item = self._queue.get(timeout=max(0, deadline - time.monotonic()))
+                except queue.Empty:
+                    break
+                if size + len(item[0]) > self.max_batch_size:
+                    carry = item
+                    break
+                items.append(item)
+                size += len(item[0])
+
+            # Wait for a free slot, so that calls keep queueing (and are eventually shed)
+            # while the backend is busy.
+            self._in_flight.acquire()  # pylint: disable=consider-using-with
+            self._executor.submit(self._dispatch, items)
+
+
+    def _dispatch(self, items: List[tuple]):
+        """
+        Pads the instances of several calls to the same length, scores them as one batch,
+        and gives each call its own rows of the logits, without the extra padding. If
+        anything fails, every call that has no result yet gets the error.
+        """
+        try:
+            lengths = [len(instances[0]["input_ids"]) for instances, _ in items]
+            max_len = max(lengths)
+
+            batch = []
+            for instances, _ in items:
+                for instance in instances:
+                    num_pad = max_len - len(instance["input_ids"])
+                    batch.append({
+                        "attention_mask": instance["attention_mask"] + [0] * num_pad,
+                        "token_type_ids": instance["token_type_ids"] + [0] * num_pad,
+                        "input_ids": instance["input_ids"] + [self.pad_token_id] * num_pad})
+
+            REGISTRY.inc("qa_batcher_batches_total")
+            REGISTRY.inc("qa_batcher_calls_total", len(items))
+            start_logits, end_logits = self.backend.predict(batch)
+
+            row = 0
+            for (instances, future), length in zip(items, lengths):
+                future.set_result((start_logits[row:row + len(instances), :length],
+                                   end_logits[row:row + len(instances), :length]))
+                row += len(instances)
+        except Exception as err:  # pylint: disable=broad-except
+            for _, future in items:
+                if not future.done():
+                    future.set_exception(err)
+        finally:
+            self._in_flight.release()
@@ -0,0 +1,115 @@
+"""
+This module contains the class InferenceBackend, the interface that reading comprehension
+uses to run the BERT model, and OnnxRuntimeBackend, which runs an exported ONNX model in
+this process instead of calling a model server. `model_client.ModelServerClient` is the
+backend for TF Serving.
+
+Export the model with `python models/create_saved_model.py --format onnx --quantize`, then:
+
+    backend = OnnxRuntimeBackend("models/bert_qa_squad.int8.onnx", intra_op_threads=4)
+    answerer = Answerer(backend)
+"""
+
+import logging
+from typing import List
+import numpy as np
+from metrics import REGISTRY, stage
+
+
+logging.info("Running inference backend module")
+
+OUTPUT_NAMES = ("start_logits", "end_logits")
+
+
+class InferenceBackend:
+    """
+    Runs the question answering model. Subclasses implement `predict`.
+
+    Methods
+    -------
+    predict
+        Scores a batch of instances and returns the start and end logits.
+    close
+        Releases the resources held by the backend.
+    """
+
+    def predict(self, instances: List[dict]) -> tuple:
+        """
+        Scores a batch of instances.
+
+        Parameters
+        ----------
+        instances : list
+            A list of dicts with the keys `input_ids`, `token_type_ids` and `attention_mask`,
+            all of the same length.
+
+        Returns
+        -------
+        tuple
+            The start and end logits, as float32 arrays with one row per instance.
+        """
+        raise NotImplementedError
+
+
+    def close(self):
+        pass
+
+
+class OnnxRuntimeBackend(InferenceBackend):
+    """
+    Runs an ONNX export of the model (see `models/create_saved_model.py`) with ONNX Runtime
+    on the CPU. The model accepts any batch size and sequence length, so batches are run as
+    they are, split into runs of at most `max_batch` instances.
+
+    Attributes
+    ----------
+    model_path : str
+        The path of the `.onnx` file. This may be the int8 quantized model.
+    max_batch : int
+        The maximum number of instances scored in a single run.
+    intra_op_threads : int
+        The number of threads used inside each operator. 0 lets ONNX Runtime decide.
+    inter_op_threads : int
+        The number of threads used to run independent operators. 0 lets ONNX Runtime decide.
+    """
+
+    def __init__(self, model_path: str, max_batch=16, intra_op_threads=0, inter_op_threads=0):
+        try:
+            import onnxruntime  # pylint: disable=import-outside-toplevel
+        except ImportError as err:
+            raise ImportError("OnnxRuntimeBackend requires onnxruntime: "
+                              "pip install onnxruntime") from err
+
+        self.model_path = model_path
+        self.max_batch = max_batch
+        self.intra_op_threads = intra_op_threads
+        self.inter_op_threads = inter_op_threads
+
+        options = onnxruntime.SessionOptions()
+        options.intra_op_num_threads = intra_op_threads
+        options.inter_op_num_threads = inter_op_threads
+        options.graph_optimization_level = onnxruntime.GraphOptimizationLevel.ORT_ENABLE_ALL
+        self.session = onnxruntime.InferenceSession(model_path, options,
+                                                    providers=["CPUExecutionProvider"])
+        self._input_names = [model_input.name for model_input in self.session.get_inputs()]
+
+
+    def predict(self, instances: List[dict]) -> tuple:
+        with stage("model_request_serialize"):
+            inputs = {name: np.asarray([instance[name] for instance in instances], dtype=np.int64)
+                      for name in self._input_names}
+        REGISTRY.inc("qa_model_instances_total", len(instances))
+
+        start_logits, end_logits = [], []
+        for i in range(0, len(instances), self.max_batch):
+            REGISTRY.inc("qa_model_requests_total")
+            with stage("model_inference"):
+                start, end = self.session.run(
+                    list(OUTPUT_NAMES),
+                    {name: array[i:i + self.max_batch] for name, array in inputs.items()})
+            start_logits.append(start)
+            end_logits.append(end)
+
+        return (np.concatenate(start_logits).astype(np.float32, copy=False),
+                np.concatenate(end_logits).astype(np.float32, copy=False))
+
@@ -0,0 +1,428 @@
+"""
+This module contains the class LocalIndex, an offline alternative to searching Wikipedia.
+It builds a BM25 inverted index over any collection of (title, text) documents, such as a
+Wikipedia dump, and stores it on disk as memory-mapped arrays. Terms and titles are
+looked up by their 64-bit hashes, so nothing that grows with the size of the index has to be
+loaded into memory, and the index is built in batches, so it can hold all of Wikipedia.
+
+A LocalIndex looks like the `wikipedia` module, so it can be passed as the `backend` of
+`get_articles` or `Answerer`:
+
+    index = LocalIndex.build(iter_wikipedia_dump("enwiki-latest-pages-articles.xml.bz2"),
+                             "wiki_index")
+    answerer = Answerer(model_server_address, backend=LocalIndex("wiki_index"))
+
+An index can also be built from the command line:
+
+    python local_index.py enwiki-latest-pages-articles.xml.bz2 wiki_index
+"""
+
+import argparse
+import bz2
+import functools
+import hashlib
+import json
+import logging
+import os
+import re
+import tempfile
+import xml.etree.ElementTree as ElementTree
+from array import array
+from collections import Counter
+from types import SimpleNamespace
+from typing import Iterable, Iterator, List
+import numpy as np
+from document_retrieval import split_sections
+
+
+logging.info("Running local index module")
+
+# Bumped whenever the files of an index change.
+FORMAT_VERSION = 2
+
+
+class LocalPageError(Exception):
+    """
+    Raised when a title is not in the index, like `wikipedia.exceptions.PageError`.
+    """
+
+
+def tokenize(text: str) -> List[str]:
+    """
+    Splits text into lower-cased words for indexing and searching.
+    """
+    return re.findall(r"\w+", text.lower())
+
+
+def _hash(text: str) -> int:
+    """
+    Returns a stable 64-bit hash of a string. Terms and titles are stored as hashes, so that
+    the index doesn't need a vocabulary or a title lookup table in memory.
+    """
+    return int.from_bytes(hashlib.blake2b(text.encode("utf-8"), digest_size=8).digest(),
+                          "little")
+
+
+_hash_term = functools.lru_cache(maxsize=2 ** 20)(_hash)
+
+
+def _save_array(directory: str, name: str, values) -> np.ndarray:
+    array = np.asarray(values)
+    np.save(os.path.join(directory, name + ".npy"), array)
+    return array
+
+
+def _write_run(directory: str, run: int, terms: array, docs: array, counts: array):
+    """
+    Sorts a batch of postings by term (the documents of each term stay in order) and saves
+    it as run number `run`.
+    """
+    terms = np.frombuffer(terms, dtype=np.uint64)
+    order = np.argsort(terms, kind="stable")
+    for name, values in [("terms", terms), ("docs", np.frombuffer(docs, dtype=np.int32)),
+                         ("counts", np.frombuffer(counts, dtype=np.uint32))]:
+        np.save(os.path.join(directory, f"{name}_{run}.npy"), values[order])
+
+
+def _merge_runs(run_directory: str, num_runs: int, directory: str, num_postings: int,
+                num_ranges: int):
+    """
+    Merges the sorted runs into the `terms`, `term_offsets`, `posting_docs` and
+    `posting_counts` arrays of the index. The hashes are split into `num_ranges` ranges,
+    and only the postings of one range are in memory at a time.
+    """
+    def load(name, run):
+        return np.load(os.path.join(run_directory, f"{name}_{run}.npy"), mmap_mode="r")
+
+    runs = [(load("terms", run), load("docs", run), load("counts", run))
+            for run in range(num_runs)]
+    posting_docs = np.lib.format.open_memmap(os.path.join(directory, "posting_docs.npy"),
+                                             mode="w+", dtype=np.int32, shape=(num_postings,))
+    posting_counts = np.lib.format.open_memmap(os.path.join(directory, "posting_counts.npy"),
+                                               mode="w+", dtype=np.float32,
+                                               shape=(num_postings,))
+
+    bounds = [2 ** 64 * i // num_ranges for i in range(num_ranges + 1)] if runs else [0]
+    terms, term_counts, position = [], [], 0
+    for low, high in zip(bounds[:-1], bounds[1:]):
+        parts = []
+        for run_terms, run_docs, run_counts in runs:
+            first, last = np.searchsorted(run_terms, np.uint64(low)), \
+                          np.searchsorted(run_terms, np.uint64(high - 1), side="right")
+            parts.append((run_terms[first:last], run_docs[first:last], run_counts[first:last]))
+
+        # The runs hold increasing document ids, so a stable sort by term keeps the
+        # documents of every term in order.
+        range_terms = np.concatenate([part[0] for part in parts])
+        order = np.argsort(range_terms, kind="stable")
+        end = position + len(order)
+        posting_docs[position:end] = np.concatenate([part[1] for part in parts])[order]
+        posting_counts[position:end] = np.concatenate([part[2] for part in parts])[order]
+        position = end
+
+        unique_terms, counts = np.unique(range_terms, return_counts=True)
+        terms.append(unique_terms)
+        term_counts.append(counts)
+
+    posting_docs.flush()
+    posting_counts.flush()
+    del posting_docs, posting_counts, runs
+
+    term_counts = np.concatenate(term_counts) if term_counts else np.zeros(0, dtype=np.int64)
+    _save_array(directory, "terms", np.concatenate(terms) if terms
+                else np.zeros(0, dtype=np.uint64))
+    _save_array(directory, "term_offsets", np.concatenate(([0], np.cumsum(term_counts)))
+                .astype(np.int64))
+
+    return len(term_counts)
+
+
+class LocalIndex:
+    """
+    Attributes
+    ----------
+    directory : str
+        The directory the index is stored in.
+    num_docs : int
+        The number of documents in the index.
+    k1 : float
+        BM25 term frequency saturation.
+    b : float
+        BM25 document length normalization.
+
+    Methods
+    -------
+    build
+        Builds an index from (title, text) tuples and saves it to a directory.
+    search
+        Returns the titles of the best matching documents for a query.
+    title
+        Returns the title of a document.
+    page
+        Returns a document by title.
+    summary
+        Returns the introduction of a document.
+    """
+    exceptions = SimpleNamespace(PageError=LocalPageError)
+
+    def __init__(self, directory: str):
+        self.directory = directory
+
+        with open(os.path.join(directory, "meta.json")) as meta_file:
+            meta = json.load(meta_file)
+        if meta.get("version") != FORMAT_VERSION:
+            raise ValueError(f"The index in {directory} was built by an older version of "
+                             f"local_index.py, please build it again")
+        self.k1 = meta["k1"]
+        self.b = meta["b"]
+        self.avg_doc_length = meta["avg_doc_length"]
+        self.num_docs = meta["num_docs"]
+
+        def load(name):
+            return np.load(os.path.join(directory, name + ".npy"), mmap_mode="r")
+
+        def load_bytes(name, offsets):
+            return np.memmap(os.path.join(directory, name + ".bin"), dtype=np.uint8, mode="r") \
+                   if offsets[-1] else np.zeros(0, dtype=np.uint8)
+
+        self.terms = load("terms")
+        self.term_offsets = load("term_offsets")
+        self.posting_docs = load("posting_docs")
+        self.posting_counts = load("posting_counts")
+        self.doc_lengths = load("doc_lengths")
+        self.text_offsets = load("text_offsets")
+        self.texts = load_bytes("texts", self.text_offsets)
+        self.title_offsets = load("title_offsets")
+        self.title_bytes = load_bytes("titles", self.title_offsets)
+        self.title_hashes = load("title_hashes")
+        self.title_hash_docs = load("title_hash_docs")
+
+
+    @classmethod
+    def build(cls, documents: Iterable[tuple], directory: str, k1: float = 1.5,
+              b: float = 0.75, batch_postings: int = 10_000_000) -> "LocalIndex":
+        """
+        Builds an index and saves it to `directory`. Only `batch_postings` postings (and a
+        few numbers per document) are held in memory: the postings are written to disk in
+        sorted runs, which are merged at the end, so a whole Wikipedia dump can be indexed.
+
+        Parameters
+        ----------
+        documents : iterable
+            (title, text) tuples, i.e. from `iter_wikipedia_dump`.
+        directory : str
+            Where to save the index. It is created if it does not exist.
+        k1 : float
+            BM25 term frequency saturation.
+        b : float
+            BM25 document length normalization.
+        batch_postings : int
+            The number of postings held in memory before they are written to disk.
+
+        Returns
+        -------
+        LocalIndex
+            The index, loaded from `directory`.
+        """
+        os.makedirs(directory, exist_ok=True)
+
+        doc_lengths, text_offsets = array("f"), array("q", [0])
+        title_hashes, title_offsets = array("Q"), array("q", [0])
+        terms, docs, counts = array("Q"), array("i"), array("I")
+        num_runs = num_postings = 0
+
+        with tempfile.TemporaryDirectory(dir=directory) as run_directory, \
+                open(os.path.join(directory, "texts.bin"), "wb") as texts_file, \
+                open(os.path.join(directory, "titles.bin"), "wb") as titles_file:
+            for doc_id, (title, text) in enumerate(documents):
+                encoded = text.encode("utf-8")
+                texts_file.write(encoded)
+                text_offsets.append(text_offsets[-1] + len(encoded))
+                encoded = title.encode("utf-8")
+                titles_file.write(encoded)
+                title_offsets.append(title_offsets[-1] + len(encoded))
+                title_hashes.append(_hash(title))
+
+                term_counts = Counter(tokenize(title + " " + text))
+                terms.extend(_hash_term(term) for term in term_counts)
+                docs.extend([doc_id] * len(term_counts))
+                counts.extend(term_counts.values())
+                doc_lengths.append(sum(term_counts.values()))
+
+                if len(terms) >= batch_postings:
+                    _write_run(run_directory, num_runs, terms, docs, counts)
+                    num_runs, num_postings = num_runs + 1, num_postings + len(terms)
+                    terms, docs, counts = array("Q"), array("i"), array("I")
+
+            if terms:
+                _write_run(run_directory, num_runs, terms, docs, counts)
+                num_runs, num_postings = num_runs + 1, num_postings + len(terms)
+
+            num_terms = _merge_runs(run_directory, num_runs, directory, num_postings,
+                                    max(1, -(-num_postings // batch_postings)))
+
+        doc_lengths = _save_array(directory, "doc_lengths", doc_lengths)
+        _save_array(directory, "text_offsets", text_offsets)
+        _save_array(directory, "title_offsets", title_offsets)
+        title_hashes = np.asarray(title_hashes, dtype=np.uint64)
+        order = np.argsort(title_hashes, kind="stable")
+        _save_array(directory, "title_hashes", title_hashes[order])
+        _save_array(directory, "title_hash_docs", order.astype(np.int64))
+
+        meta = {"version": FORMAT_VERSION, "k1": k1, "b": b, "num_docs": len(doc_lengths),
+                "avg_doc_length": float(np.mean(doc_lengths)) if len(doc_lengths) else 0.0}
+        with open(os.path.join(directory, "meta.json"), "w") as meta_file:
+            json.dump(meta, meta_file)
+
+        logging.info("Indexed %d documents with %d terms", len(doc_lengths), num_terms)
+
+        return cls(directory)
+
+
+    def scores(self, query: str) -> tuple:
+        """
+        Scores every document that contains at least one of the query's terms with BM25.
+
+        Returns
+        -------
+        tuple
+            An array of document ids and an array of their scores.
+        """
+        hashes = np.asarray(sorted({_hash_term(term) for term in tokenize(query)}),
+                            dtype=np.uint64)
+        positions = np.searchsorted(self.terms, hashes)
+        found = positions < len(self.terms)
+        found[found] = self.terms[positions[found]] == hashes[found]
+        term_ids = positions[found]
+        if not len(term_ids):
+            return np.zeros(0, dtype=np.int32), np.zeros(0, dtype=np.float32)
+
+        docs, contributions = [], []
+        for term_id in term_ids:
+            start, end = self.term_offsets[term_id], self.term_offsets[term_id + 1]
+            term_docs = np.asarray(self.posting_docs[start:end])
+            counts = np.asarray(self.posting_counts[start:end])
+
+            idf = np.log(1 + (self.num_docs - len(term_docs) + 0.5) / (len(term_docs) + 0.5))
+            length_norm = 1 - self.b + self.b * self.doc_lengths[term_docs] / self.avg_doc_length
+            docs.append(term_docs)
+            contributions.append(idf * counts * (self.k1 + 1) / (counts + self.k1 * length_norm))
+
+        doc_ids, inverse = np.unique(np.concatenate(docs), return_inverse=True)
+
+        return doc_ids, np.bincount(inverse, weights=np.concatenate(contributions))
+
+
+    def title(self, doc_id: int) -> str:
+        """
+        Returns the title of a document.
+        """
+        start, end = self.title_offsets[doc_id], self.title_offsets[doc_id + 1]
+        return bytes(self.title_bytes[start:end]).decode("utf-8")
+
+
+    def search(self, query: str, results: int = 10) -> List[str]:
+        """
+        Returns the titles of the `results` best matching documents, best first.
+        """
+        doc_ids, scores = self.scores(query)
+
+        if len(doc_ids) > results:
+            best = np.argpartition(-scores, results - 1)[:results]
+            doc_ids, scores = doc_ids[best], scores[best]
+        order = np.argsort(-scores, kind="stable")
+
+        return [self.title(doc_id) for doc_id in doc_ids[order]]
+
+
+    def suggest(self, query: str):  # pylint: disable=unused-argument
+        """
+        Search results are always valid titles, so there is nothing to suggest.
+        """
+        return None
+
+
+    # pylint: disable-next=unused-argument
+    def page(self, title: str, auto_suggest: bool = True) -> SimpleNamespace:
+        """
+        Returns the document with the given title. Titles are always matched exactly, so
+        `auto_suggest` is ignored.
+        """
+        target = np.uint64(_hash(title))
+        first = np.searchsorted(self.title_hashes, target)
+        last = np.searchsorted(self.title_hashes, target, side="right")
+        matches = [doc_id for doc_id in self.title_hash_docs[first:last]
+                   if self.title(doc_id) == title]
+        if not matches:
+            raise LocalPageError(title)
+
+        doc_id = matches[0]
+        start, end = self.text_offsets[doc_id], self.text_offsets[doc_id + 1]
+
+        return SimpleNamespace(title=title, content=bytes(self.texts[start:end]).decode("utf-8"))
+
+
+    # pylint: disable-next=unused-argument
+    def summary(self, title: str, auto_suggest: bool = True) -> str:
+        """
+        Returns the introduction of the document with the given title, i.e. the text before
+        its first section heading.
+        """
+        sections = split_sections(self.page(title).content)
+        return sections[0] if sections else ""
+
+
+def _strip_wikitext(text: str) -> str:
+    """
+    Removes the most common wiki markup, so that the text reads like an article.
+    """
+    text = re.sub(r"<ref[^>]*/>|<ref.*?</ref>|<!--.*?-->", "", text, flags=re.DOTALL)
+    while re.search(r"\{\{[^{}]*\}\}", text):
+        text = re.sub(r"\{\{[^{}]*\}\}", "", text)
+    text = re.sub(r"\[\[(?:[^\]|]*\|)?([^\]]*)\]\]", r"\1", text)
+    text = re.sub(r"\[https?://[^\s\]]+ ?([^\]]*)\]", r"\1", text)
+    text = re.sub(r"'{2,}|<[^>]+>", "", text)
+
+    return re.sub(r"\n{3,}", "\n\n", text).strip()
+
+
+def iter_wikipedia_dump(path: str) -> Iterator[tuple]:
+    """
+    Reads the articles from a Wikipedia XML dump, i.e. `enwiki-latest-pages-articles.xml.bz2`.
+    Redirects and pages outside the main namespace are skipped.
+
+    Yields
+    ------
+    tuple
+        (article_title, article_text)
+    """
+    opener = bz2.open if path.endswith(".bz2") else open
+
+    with opener(path, "rb") as dump:
+        pages = ElementTree.iterparse(dump, events=("start", "end"))
+        _, root = next(pages)
+        for event, element in pages:
+            if event != "end" or not element.tag.endswith("}page") and element.tag != "page":
+                continue
+
+            namespace = element.tag[:-len("page")]
+            title = element.findtext(namespace + "title")
+            text = element.findtext(f"{namespace}revision/{namespace}text") or ""
+            is_article = element.findtext(namespace + "ns") == "0" and \
+                         element.find(namespace + "redirect") is None
+            # Clearing the page alone would leave it in the root, which grows with the dump.
+            root.clear()
+
+            if is_article:
+                yield title, _strip_wikitext(text)
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+
+    parser = argparse.ArgumentParser(description="Build a local index from a Wikipedia dump.")
+    parser.add_argument("dump", help="Path to a Wikipedia XML dump (.xml or .xml.bz2)")
+    parser.add_argument("directory", help="Where to save the index")
+    args = parser.parse_args()
+
+    LocalIndex.build(iter_wikipedia_dump(args.dump), args.directory)
@@ -0,0 +1,215 @@
+"""
+This module contains lightweight instrumentation for the QA pipeline: per-request timing
+breakdowns and process-wide counters and histograms that can be exported in the
+Prometheus text format.
+
+Wrap a stage of the pipeline in `stage` to time it:
+
+    with track_request() as timings:
+        with stage("wiki_search"):
+            titles = wiki.search(query)
+    timings.as_dict()  # {"wiki_search": 0.31}
+
+Every stage is also recorded in the `qa_stage_seconds` histogram of `REGISTRY`, and other
+modules count events with `REGISTRY.inc`. `REGISTRY.render_prometheus()` returns all of the
+metrics, and `REGISTRY.add_sink` forwards every measurement to another system.
+"""
+
+import bisect
+import contextvars
+import threading
+import time
+from collections import defaultdict
+from contextlib import contextmanager
+from typing import Callable
+
+
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+_current_timings = contextvars.ContextVar("current_timings", default=None)
+
+
+class Timings:
+    """
+    The time spent in each stage of a single request. Stages that run more than once,
+    or on several threads at the same time, are added up.
+    """
+
+    def __init__(self):
+        self._seconds = defaultdict(float)
+        self._lock = threading.Lock()
+
+
+    def add(self, name: str, seconds: float):
+        with self._lock:
+            self._seconds[name] += seconds
+
+
+    def update(self, other: "Timings"):
+        """
+        Adds the stages of another request, i.e. work that several requests shared.
+        """
+        for name, seconds in other.as_dict().items():
+            self.add(name, seconds)
+
+
+    def as_dict(self) -> dict:
+        """
+        Returns a dict that maps stage names to seconds.
+        """
+        with self._lock:
+            return dict(self._seconds)
+
+
+class MetricsRegistry:
+    """
+    Process-wide counters and histograms. Metrics are identified by a name and labels.
+
+    Methods
+    -------
+    inc
+        Adds to a counter.
+    observe
+        Records a value in a histogram.
+    add_sink
+        Registers a function that is called with every measurement.
+    render_prometheus
+        Returns all metrics in the Prometheus text exposition format.
+    """
+
+    def __init__(self, buckets=DEFAULT_BUCKETS):
+        self.buckets = tuple(buckets)
+        self._counters = defaultdict(float)
+        self._histograms = {}
+        self._sinks = []
+        self._lock = threading.Lock()
+
+
+    def inc(self, name: str, value: float = 1, **labels):
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            self._counters[key] += value
+
+        for sink in self._sinks:
+            sink("counter", name, value, labels)
+
+
+    def observe(self, name: str, value: float, **labels):
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            histogram = self._histograms.setdefault(key, [[0] * (len(self.buckets) + 1), 0.0])
+            histogram[0][bisect.bisect_left(self.buckets, value)] += 1
+            histogram[1] += value
+
+        for sink in self._sinks:
+            sink("histogram", name, value, labels)
+
+
+    def add_sink(self, sink: Callable):
+        """
+        Registers `sink(kind, name, value, labels)`, which is called with every measurement.
+        `kind` is "counter" or "histogram".
+        """
+        self._sinks.append(sink)
+
+
+    def counter(self, name: str, **labels) -> float:
+        """
+        Returns the current value of a counter.
+        """
+        with self._lock:
+            return self._counters[(name, tuple(sorted(labels.items())))]
+
+
+    def reset(self):
+        with self._lock:
+            self._counters.clear()
+            self._histograms.clear()
+
+
+    def render_prometheus(self) -> str:
+        """
+        Returns all metrics in the Prometheus text exposition format.
+        """
+        def format_labels(labels, extra=()):
+            labels = list(labels) + list(extra)
+            if not labels:
+                return ""
+            return "{" + ",".join(f'{key}="{value}"' for key, value in labels) + "}"
+
+        lines = []
+        with self._lock:
+            counters = sorted(self._counters.items())
+            histograms = sorted(self._histograms.items())
+
+        for name in sorted({name for (name, _), _ in counters}):
+            lines.append(f"# TYPE {name} counter")
+            lines.extend(f"{name}{format_labels(labels)} {value}"
+                         for (counter_name, labels), value in counters if counter_name == name)
+
+        for name in sorted({name for (name, _), _ in histograms}):
+            lines.append(f"# TYPE {name} histogram")
+            for (histogram_name, labels), (counts, total) in histograms:
+                if histogram_name != name:
+                    continue
+                cumulative = 0
+                for bucket, count in zip(self.buckets + ("+Inf",), counts):
+                    cumulative += count
+                    lines.append(f"{name}_bucket{format_labels(labels, [('le', bucket)])} "
+                                 f"{cumulative}")
+                lines.append(f"{name}_sum{format_labels(labels)} {total}")
+                lines.append(f"{name}_count{format_labels(labels)} {cumulative}")
+
+        return "\n".join(lines) + "\n"
+
+
+REGISTRY = MetricsRegistry()
+
+
+@contextmanager
+def track_request():
+    """
+    Collects the timings of every stage run inside this block, including stages run on
+    threads started with `run_in_context`.
+
+    Yields
+    ------
+    Timings
+        The timings of the request.
+    """
+    timings = Timings()
+    token = _current_timings.set(timings)
+    try:
+        yield timings
+    finally:
+        _current_timings.reset(token)
+
+
+@contextmanager
+def stage(name: str):
+    """
+    Times a stage of the pipeline, adds it to the current request's timings and records
+    it in the `qa_stage_seconds` histogram.
+    """
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        seconds = time.perf_counter() - start
+        timings = _current_timings.get()
+        if timings is not None:
+            timings.add(name, seconds)
+        REGISTRY.observe("qa_stage_seconds", seconds, stage=name)
+
+
+def run_in_context(function: Callable) -> Callable:
+    """
+    Wraps `function` so that, when it is run on another thread, its stages are added to
+    the timings of the request that created the wrapper.
+    """
+    context = contextvars.copy_context()
+
+    def wrapper(*args, **kwargs):
+        return context.copy().run(function, *args, **kwargs)
+
+    return wrapper
@@ -0,0 +1,165 @@
+"""
+This module contains the class ModelServerClient, which sends `:predict` requests to one
+or more TF Serving replicas over pooled keep-alive connections. It is the default
+`inference_backend.InferenceBackend`.
+"""
+
+import itertools
+import json
+import logging
+import threading
+import time
+from typing import List, Union
+import numpy as np
+import requests
+from inference_backend import InferenceBackend
+from metrics import REGISTRY, stage
+
+
+logging.info("Running model client module")
+
+
+class ModelServerClient(InferenceBackend):
+    """
+    Attributes
+    ----------
+    addresses : list
+        The `:predict` addresses of the model server replicas.
+    pool_size : int
+        The maximum number of connections kept open to each replica.
+    timeout : float
+        The number of seconds to wait for a replica to answer.
+    max_retries : int
+        The number of times a request is retried (on another replica, if there is one)
+        after a connection error, a timeout or a server error.
+    backoff : float
+        The number of seconds to wait before the first retry. Doubles on every retry.
+    load_balancing : str
+        "round_robin" sends requests to each replica in turn. "least_outstanding" sends each
+        request to the replica with the fewest requests in flight.
+    request_format : str
+        "row" sends a list of `instances`, and the server answers with one dict per instance.
+        "columnar" sends one list per input tensor, and the server answers with one list
+        per output tensor, which is more compact and much faster to parse.
+
+    Methods
+    -------
+    predict
+        Scores a batch of instances and returns the start and end logits.
+    """
+
+    def __init__(self, addresses: Union[str, List[str]], pool_size=10, timeout=10.0,
+                 max_retries=2, backoff=0.1, load_balancing="round_robin", request_format="row"):
+        self.addresses = [addresses] if isinstance(addresses, str) else list(addresses)
+        self.pool_size = pool_size
+        self.timeout = timeout
+        self.max_retries = max_retries
+        self.backoff = backoff
+        self.load_balancing = load_balancing
+        self.request_format = request_format
+
+        self.session = requests.Session()
+        adapter = requests.adapters.HTTPAdapter(pool_connections=len(self.addresses),
+                                                pool_maxsize=pool_size)
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+
+        self._lock = threading.Lock()
+        self._round_robin = itertools.cycle(range(len(self.addresses)))
+        self._outstanding = [0] * len(self.addresses)
+
+
+    def _acquire_replica(self) -> int:
+        """
+        Picks a replica for the next request and counts the request as outstanding.
+        """
+        with self._lock:
+            if self.load_balancing == "least_outstanding":
+                replica = min(range(len(self.addresses)), key=self._outstanding.__getitem__)
+            else:
+                replica = next(self._round_robin)
+            self._outstanding[replica] += 1
+
+        return replica
+
+
+    def _release_replica(self, replica: int):
+        with self._lock:
+            self._outstanding[replica] -= 1
+
+
+    def _post(self, data: str) -> dict:
+        """
+        Posts `data` to a replica, retrying with exponential backoff if necessary.
+        """
+        headers = {"content-type": "application/json"}
+
+        for attempt in range(self.max_retries + 1):
+            replica = self._acquire_replica()
+            REGISTRY.inc("qa_model_requests_total")
+            REGISTRY.inc("qa_model_request_bytes_total", len(data))
+            try:
+                with stage("model_request"):
+                    response = self.session.post(self.addresses[replica], data=data,
+                                                 headers=headers, timeout=self.timeout)
+                if response.status_code < 500:
+                    response.raise_for_status()
+                    with stage("model_response_parse"):
+                        return json.loads(response.text)
+                error = requests.HTTPError(f"{response.status_code} from model server",
+                                           response=response)
+            except (requests.ConnectionError, requests.Timeout) as err:
+                error = err
+            finally:
+                self._release_replica(replica)
+
+            REGISTRY.inc("qa_model_request_errors_total")
+            if attempt < self.max_retries:
+                logging.debug("Retrying model server request after error: %s", error)
+                time.sleep(self.backoff * 2 ** attempt)
+
+        raise error
+
+
+    def predict(self, instances: List[dict]) -> tuple:
+        """
+        Scores a batch of instances in a single `:predict` request.
+
+        Parameters
+        ----------
+        instances : list
+            A list of dicts with the keys `input_ids`, `token_type_ids` and `attention_mask`,
+            all of the same length.
+
+        Returns
+        -------
+        tuple
+            The start and end logits, as float32 arrays with one row per instance.
+        """
+        with stage("model_request_serialize"):
+            if self.request_format == "columnar":
+                inputs = {key: [instance[key] for instance in instances] for key in instances[0]}
+                data = json.dumps({"signature_name": "serving_default", "inputs": inputs})
+            else:
+                data = json.dumps({"signature_name": "serving_default", "instances": instances})
+        REGISTRY.inc("qa_model_instances_total", len(instances))
+
+        response_text = self._post(data)
+
+        if self.request_format == "columnar":
+            outputs = response_text["outputs"]
+            return (np.asarray(outputs["start_logits"], dtype=np.float32),
+                    np.asarray(outputs["end_logits"], dtype=np.float32))
+
+        predictions = response_text["predictions"]
+        return (np.asarray([prediction["start_logits"] for prediction in predictions],
+                           dtype=np.float32),
+                np.asarray([prediction["end_logits"] for prediction in predictions],
+                           dtype=np.float32))
+
+
+    def close(self):
+        """
+        Closes all the pooled connections.
+        """
+        self.session.close()
@@ -2,14 +2,128 @@
 Downloads the huggingface model and saves it in a format that can
 be used by tfx (tensorflow serving). Package this up as a Docker
 image and you can run it locally.
+
+It can also export the model to ONNX, to run it in-process with
+`inference_backend.OnnxRuntimeBackend` instead of a model server:
+
+    python models/create_saved_model.py --format onnx --quantize
+
+writes `models/bert_qa_squad.onnx` and the int8 quantized `models/bert_qa_squad.int8.onnx`.
+`--tiny` exports a tiny randomly initialized BERT instead, which needs no download.
 """
 
-import torch
-from transformers import TFBertForQuestionAnswering
+import argparse
+import inspect
+
+
+MODEL_NAME = "bert-large-uncased-whole-word-masking-finetuned-squad"
+
+
+def create_saved_model(save_directory="models/bert_qa_squad"):
+    """
+    Saves the model as a TF SavedModel for tensorflow serving.
+    """
+    from transformers import TFBertForQuestionAnswering  # pylint: disable=import-outside-toplevel
+
+    model = TFBertForQuestionAnswering.from_pretrained(MODEL_NAME)
+
+    model.save_pretrained(save_directory=save_directory, saved_model=True, version=1)
+
+
+def create_tiny_model(vocab_size=30522, max_length=512):
+    """
+    Returns a tiny, randomly initialized PyTorch BERT for question answering. It uses the
+    same vocabulary as the real model, so it works with the same tokenizer.
+    """
+    # pylint: disable=import-outside-toplevel
+    import torch
+    from transformers import BertConfig, BertForQuestionAnswering
+
+    torch.manual_seed(0)
+    config = BertConfig(vocab_size=vocab_size, hidden_size=32, num_hidden_layers=2,
+                        num_attention_heads=2, intermediate_size=64,
+                        max_position_embeddings=max_length)
+
+    return BertForQuestionAnswering(config).eval()
+
+
+def export_onnx(model, path, opset_version=14):
+    """
+    Exports a PyTorch `BertForQuestionAnswering` to ONNX with the inputs `input_ids`,
+    `attention_mask` and `token_type_ids` and the outputs `start_logits` and `end_logits`.
+    The batch size and the sequence length are dynamic.
+    """
+    import torch  # pylint: disable=import-outside-toplevel
+
+    # Newer versions of torch export with dynamo by default, which doesn't keep the axes dynamic.
+    options = {"dynamo": False} if "dynamo" in inspect.signature(torch.onnx.export).parameters \
+              else {}
+
+    class Logits(torch.nn.Module):
+        """
+        Returns the logits as a tuple instead of a ModelOutput.
+        """
+        def __init__(self):
+            super().__init__()
+            self.model = model
+
+        # pylint: disable=arguments-differ
+        def forward(self, input_ids, attention_mask, token_type_ids):
+            outputs = self.model(input_ids=input_ids, attention_mask=attention_mask,
+                                 token_type_ids=token_type_ids)
+            return outputs.start_logits, outputs.end_logits
+
+    # Pad the dummy inputs, so that the traced model doesn't assume there is no padding.
+    dummy = torch.ones((2, 16), dtype=torch.long)
+    dummy_mask = dummy.clone()
+    dummy_mask[1, 8:] = 0
+    dynamic_axes = {name: {0: "batch", 1: "sequence"}
+                    for name in ("input_ids", "attention_mask", "token_type_ids",
+                                 "start_logits", "end_logits")}
+
+    with torch.no_grad():
+        torch.onnx.export(Logits().eval(), (dummy, dummy_mask, dummy), path,
+                          input_names=["input_ids", "attention_mask", "token_type_ids"],
+                          output_names=["start_logits", "end_logits"],
+                          dynamic_axes=dynamic_axes, opset_version=opset_version, **options)
+
+    return path
+
+
+def create_onnx_model(path="models/bert_qa_squad.onnx", quantize=False, tiny=False):
+    """
+    Exports the model (or a tiny random one) to ONNX, and optionally writes an int8
+    quantized copy next to it, with the extension `.int8.onnx`. Dynamic quantization makes
+    the model about 4 times smaller and usually faster on the CPU, at the cost of slightly
+    different scores.
+    """
+    if tiny:
+        model = create_tiny_model()
+    else:
+        from transformers import BertForQuestionAnswering  # pylint: disable=import-outside-toplevel
+        model = BertForQuestionAnswering.from_pretrained(MODEL_NAME).eval()
+
+    export_onnx(model, path)
+
+    if quantize:
+        # pylint: disable=import-outside-toplevel
+        from onnxruntime.quantization import QuantType, quantize_dynamic
+        quantize_dynamic(path, path[:-len(".onnx")] + ".int8.onnx", weight_type=QuantType.QInt8)
 
 
-print("Creating a saved model. This might take a while...")
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Export the question answering model.")
+    parser.add_argument("--format", choices=["saved_model", "onnx"], default="saved_model")
+    parser.add_argument("--output", help="The output directory (saved_model) or file (onnx).")
+    parser.add_argument("--quantize", action="store_true",
+                        help="Also write an int8 quantized copy of the ONNX model.")
+    parser.add_argument("--tiny", action="store_true",
+                        help="Export a tiny randomly initialized model (ONNX only).")
+    args = parser.parse_args()
 
-model = TFBertForQuestionAnswering.from_pretrained("bert-large-uncased-whole-word-masking-finetuned-squad")
+    print("Creating a saved model. This might take a while...")
 
-model.save_pretrained(save_directory="models/bert_qa_squad", saved_model=True, version=1)
+    if args.format == "onnx":
+        create_onnx_model(args.output or "models/bert_qa_squad.onnx", args.quantize, args.tiny)
+    else:
+        create_saved_model(args.output or "models/bert_qa_squad")
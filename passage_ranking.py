@@ -0,0 +1,76 @@
+"""
+This module contains the function `rank_passages`, a cheap lexical pre-scoring stage that
+picks the passages most likely to contain the answer, so that only those are sent to BERT.
+"""
+
+from collections import Counter
+from typing import List
+import numpy as np
+from local_index import tokenize
+
+
+def score_passages(question: str, passages: List[str], k1: float = 1.5,
+                   b: float = 0.75) -> np.ndarray:
+    """
+    Scores passages against a question with BM25, treating the passages as the corpus.
+
+    Parameters
+    ----------
+    question : str
+        A question or query.
+    passages : list
+        A list of strings, i.e. article chunks.
+    k1 : float
+        BM25 term frequency saturation.
+    b : float
+        BM25 document length normalization.
+
+    Returns
+    -------
+    np.ndarray
+        One score per passage.
+    """
+    terms = sorted(set(tokenize(question)))
+    if not terms or not passages:
+        return np.zeros(len(passages))
+
+    # Count how often each question term occurs in each passage.
+    counts = np.zeros((len(passages), len(terms)))
+    lengths = np.zeros(len(passages))
+    for i, passage in enumerate(passages):
+        passage_counts = Counter(tokenize(passage))
+        counts[i] = [passage_counts[term] for term in terms]
+        lengths[i] = sum(passage_counts.values())
+
+    num_containing = (counts > 0).sum(axis=0)
+    idf = np.log(1 + (len(passages) - num_containing + 0.5) / (num_containing + 0.5))
+    length_norm = 1 - b + b * lengths / max(lengths.mean(), 1)
+
+    return (idf * counts * (k1 + 1) / (counts + k1 * length_norm[:, None])).sum(axis=1)
+
+
+def rank_passages(question: str, passages: List[str], top_n: int) -> List[int]:
+    """
+    Picks the `top_n` passages that best match the question.
+
+    Parameters
+    ----------
+    question : str
+        A question or query.
+    passages : list
+        A list of strings, i.e. article chunks.
+    top_n : int
+        The number of passages to keep.
+
+    Returns
+    -------
+    list
+        The indexes of the best passages, in their original order.
+    """
+    if len(passages) <= top_n:
+        return list(range(len(passages)))
+
+    scores = score_passages(question, passages)
+    best = np.argsort(-scores, kind="stable")[:top_n]
+
+    return sorted(best.tolist())
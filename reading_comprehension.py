@@ -1,38 +1,167 @@
 """
-This module contains the function `get_model_predictions` which calls an external
-model server to perform reading comprehension.
+This module contains the functions `get_model_predictions` and `get_model_predictions_batch`
+which call an external model server to perform reading comprehension.
+
+`get_article_predictions` does the same for whole articles. It tokenizes each article once
+with the fast tokenizer, splits the tokens into overlapping windows that fill BERT's entire
+context, and maps the answers back to the original text through the token offsets.
+
+All of them accept either the address of the model server or an
+`inference_backend.InferenceBackend`, such as a `ModelServerClient`, and optionally the
+tokenizer to use. By default, the tokenizer is loaded from `models/tokenizer` the first
+time it is needed (see `get_tokenizer`), so importing this module is cheap.
 """
 
+import functools
+import hashlib
 import json
 import logging
+import os
+from concurrent.futures import ThreadPoolExecutor
+from typing import List, Union
 import numpy as np
-import requests
-from transformers import BertTokenizer
+from inference_backend import InferenceBackend
+from metrics import REGISTRY, run_in_context, stage
+from model_client import ModelServerClient
+from passage_ranking import rank_passages
+from span_decoding import best_span_per_row, stack_logits, top_k_spans
 
 
 logging.info("Running reading comprehension module")
-tokenizer = BertTokenizer.from_pretrained("./models/tokenizer/") # load locally
 
+TOKENIZER_DIRECTORY = os.path.join(os.path.dirname(os.path.abspath(__file__)), "models",
+                                   "tokenizer")
+TOKENIZER_SNAPSHOT = "tokenizer.json"
 
-def get_model_predictions(question: str, answer_text: str, model_server_address: str) -> dict:
+
+class SnapshotTokenizer:
     """
-    This function accepts a question and some text that contains the answer and
-    returns a dict containing the answer along with the max scores for the start
-    and end indexes, along with the start/end scores for every index.
+    A BERT tokenizer loaded from a `tokenizer.json` snapshot with the `tokenizers` library,
+    which is much faster to import and to load than `transformers`. It has the parts of the
+    `BertTokenizerFast` API that this library uses.
+    """
+
+    def __init__(self, path: str):
+        from tokenizers import Tokenizer  # pylint: disable=import-outside-toplevel
+
+        self.path = path
+        with open(path, "rb") as snapshot:
+            self.fingerprint = hashlib.sha1(snapshot.read()).hexdigest()[:16]
+        self._tokenizer = Tokenizer.from_file(path)
+        self._tokenizer.no_truncation()
+        self._tokenizer.no_padding()
+        self.cls_token_id = self._tokenizer.token_to_id("[CLS]")
+        self.sep_token_id = self._tokenizer.token_to_id("[SEP]")
+        self.pad_token_id = self._tokenizer.token_to_id("[PAD]")
+
+
+    def encode(self, text: str, text_pair: str = None) -> List[int]:
+        return self._tokenizer.encode(text, text_pair).ids
+
+
+    def __call__(self, text: str, add_special_tokens: bool = True,
+                 return_offsets_mapping: bool = False, **kwargs) -> dict:
+        encoding = self._tokenizer.encode(text, add_special_tokens=add_special_tokens)
+
+        result = {"input_ids": encoding.ids,
+                  "token_type_ids": encoding.type_ids,
+                  "attention_mask": encoding.attention_mask}
+        if return_offsets_mapping:
+            result["offset_mapping"] = encoding.offsets
+
+        return result
+
+
+    def convert_ids_to_tokens(self, ids: List[int]) -> List[str]:
+        return [self._tokenizer.id_to_token(token_id) for token_id in ids]
+
+
+@functools.lru_cache(maxsize=None)
+def get_tokenizer(directory: str = TOKENIZER_DIRECTORY, fast: bool = True):
+    """
+    Loads the BERT tokenizer the first time it is needed.
+
+    Parameters
+    ----------
+    directory : str
+        The directory with the tokenizer files. Defaults to `models/tokenizer` next to
+        this module, no matter what the current directory is.
+    fast : bool
+        Whether to use a fast (Rust) tokenizer. If the directory has a `tokenizer.json`
+        snapshot (see `save_tokenizer_snapshot`) it is loaded without importing
+        `transformers` at all. `get_article_predictions` needs a fast tokenizer.
+
+    Returns
+    -------
+    object
+        A `SnapshotTokenizer`, a `BertTokenizerFast` or a `BertTokenizer`.
+    """
+    snapshot = os.path.join(directory, TOKENIZER_SNAPSHOT)
+    if fast and os.path.exists(snapshot):
+        return SnapshotTokenizer(snapshot)
+
+    # pylint: disable=import-outside-toplevel
+    from transformers import BertTokenizer, BertTokenizerFast
+
+    return (BertTokenizerFast if fast else BertTokenizer).from_pretrained(directory)
+
+
+def save_tokenizer_snapshot(directory: str = TOKENIZER_DIRECTORY) -> str:
+    """
+    Builds the fast tokenizer from the vocabulary in `directory` and saves it as a single
+    `tokenizer.json` file there, which `get_tokenizer` loads from then on.
+
+    Returns
+    -------
+    str
+        The path of the snapshot.
+    """
+    from transformers import BertTokenizerFast  # pylint: disable=import-outside-toplevel
+
+    path = os.path.join(directory, TOKENIZER_SNAPSHOT)
+    BertTokenizerFast.from_pretrained(directory).backend_tokenizer.save(path)
+    get_tokenizer.cache_clear()
+
+    return path
+
+
+@functools.lru_cache(maxsize=None)
+def tokenizer_fingerprint(tokenizer) -> str:
+    """
+    Returns a short hash of the vocabulary and settings of a tokenizer, so that things
+    derived from its output (like `token_cache.TokenCache` entries) can be invalidated
+    when the tokenizer changes.
+    """
+    fingerprint = getattr(tokenizer, "fingerprint", None)
+    if fingerprint is not None:
+        return fingerprint
+
+    backend = getattr(tokenizer, "backend_tokenizer", None)
+    text = backend.to_str() if backend is not None else \
+           json.dumps(sorted(tokenizer.get_vocab().items()))
+    return hashlib.sha1(text.encode()).hexdigest()[:16]
+
+
+def _build_instance(question: str, answer_text: str, tokenizer=None) -> dict:
+    """
+    Encodes a question and some context as a single model server instance.
 
     Parameters
+    ----------
     question : str
         A question or query like "what is the capital of France?"
-
-    answer : str
+    answer_text : str
         Some context that contains the answer, like "Paris is the capital of France..."
+    tokenizer : object
+        The tokenizer. Defaults to `get_tokenizer()`.
 
     Returns
     -------
     dict
-        A dict with the keys `answer`, `start_scores_max`, `end_scores_max`, `start_scores`,
-        and `end_scores`. The latter two are vectors across the entire tokenized `answer_text`.
+        A dict with the keys `input_ids`, `token_type_ids` and `attention_mask`.
     """
+    tokenizer = get_tokenizer() if tokenizer is None else tokenizer
+
     # Encode the question and answer as intergers.
     input_ids = tokenizer.encode(question, answer_text)
 
@@ -47,38 +176,581 @@ def get_model_predictions(question: str, answer_text: str, model_server_address:
     # Add the attention mask, which is all 1's (attend to everything)
     attention_mask = [1 for _ in range(len(input_ids))]
 
-    # Build the request that is sent to the server.
-    signatures = [{"attention_mask": attention_mask,
-                "token_type_ids": token_type_ids, "input_ids": input_ids}]
-    data = json.dumps({"signature_name": "serving_default", "instances": signatures})
+    return {"attention_mask": attention_mask,
+            "token_type_ids": token_type_ids,
+            "input_ids": input_ids}
 
-    headers = {"content-type": "application/json"}
-    json_response = requests.post(model_server_address, data=data, headers=headers)
 
-    response_text = json.loads(json_response.text)
+def _pad_instances(instances: List[dict], tokenizer=None) -> List[dict]:
+    """
+    Pads every instance to the length of the longest one so that they can be sent
+    to the model server as a single batch. Padding positions are not attended to.
 
-    # Get the start and end scores from the response.
-    start_scores = response_text["predictions"][0]["start_logits"]
-    end_scores = response_text["predictions"][0]["end_logits"]
+    Parameters
+    ----------
+    instances : list
+        A list of dicts as returned by `_build_instance`.
+    tokenizer : object
+        The tokenizer, whose padding token is used. Defaults to `get_tokenizer()`.
 
-    answer_start = np.argmax(start_scores)
-    answer_end = np.argmax(end_scores)
+    Returns
+    -------
+    list
+        A list of new dicts where every vector has the same length.
+    """
+    pad_token_id = (get_tokenizer() if tokenizer is None else tokenizer).pad_token_id
+    max_len = max(len(instance["input_ids"]) for instance in instances)
+
+    padded = []
+    for instance in instances:
+        num_pad = max_len - len(instance["input_ids"])
+        padded.append({
+            "attention_mask": instance["attention_mask"] + [0] * num_pad,
+            "token_type_ids": instance["token_type_ids"] + [0] * num_pad,
+            "input_ids": instance["input_ids"] + [pad_token_id] * num_pad})
 
-    # Convert back to tokens so that the answer can be a string.
-    tokens = tokenizer.convert_ids_to_tokens(input_ids)
-    answer = tokens[answer_start]
+    return padded
+
+
+@functools.lru_cache(maxsize=None)
+def _default_client(model_server_address: str, request_format: str) -> ModelServerClient:
+    """
+    Returns a shared client for a model server address, so that its connections are reused.
+    """
+    return ModelServerClient(model_server_address, request_format=request_format)
+
+
+def _post_instances(instances: List[dict], model_server_address: Union[str, InferenceBackend],
+                    request_format: str = "row") -> tuple:
+    """
+    Sends a list of instances to the model server in a single `:predict` request.
+
+    Parameters
+    ----------
+    instances : list
+        A list of dicts as returned by `_pad_instances`.
+    model_server_address : str or InferenceBackend
+        Address of the BERT model server, or a backend that runs the model.
+    request_format : str
+        "row" or "columnar", see `ModelServerClient`. Ignored if a backend is passed in.
+
+    Returns
+    -------
+    tuple
+        The start and end logits, as float32 arrays with one row per instance.
+    """
+    client = model_server_address
+    if not isinstance(client, InferenceBackend):
+        client = _default_client(model_server_address, request_format)
+
+    return client.predict(instances)
+
+
+def _predict_batches(instances: List[dict], model_server_address: Union[str, InferenceBackend],
+                     max_batch: int, request_format: str, max_in_flight: int = 1,
+                     tokenizer=None) -> tuple:
+    """
+    Sends instances to the model server in batches of up to `max_batch`, with up to
+    `max_in_flight` requests at the same time. `tokenizer` is used for padding.
+
+    Returns
+    -------
+    tuple
+        Two lists with one float32 vector per instance: the start and the end logits,
+        with the padding stripped.
+    """
+    batches = [instances[i:i + max_batch] for i in range(0, len(instances), max_batch)]
 
-    for i in range(answer_start + 1, answer_end + 1):
-        if tokens[i][0:2] == "##":
-            answer += tokens[i][2:]
+    def predict(batch):
+        return _post_instances(_pad_instances(batch, tokenizer), model_server_address,
+                               request_format)
+
+    if max_in_flight > 1 and len(batches) > 1:
+        with ThreadPoolExecutor(max_workers=max_in_flight) as executor:
+            predictions = list(executor.map(run_in_context(predict), batches))
+    else:
+        predictions = [predict(batch) for batch in batches]
+
+    start_rows, end_rows = [], []
+    for batch, (start_logits, end_logits) in zip(batches, predictions):
+        for j, instance in enumerate(batch):
+            num_tokens = len(instance["input_ids"])
+            start_rows.append(start_logits[j, :num_tokens])
+            end_rows.append(end_logits[j, :num_tokens])
+
+    return start_rows, end_rows
+
+
+def _context_mask(instances: List[dict]) -> np.ndarray:
+    """
+    Returns a boolean matrix that is True for the tokens of each instance that may be part
+    of an answer: the context tokens, but not the question, the special tokens or padding.
+    """
+    mask = np.zeros((len(instances), max(len(instance["input_ids"]) for instance in instances)),
+                    dtype=bool)
+    for i, instance in enumerate(instances):
+        # The context is marked by the token type ids, but ends with a "[SEP]".
+        mask[i, :len(instance["input_ids"]) - 1] = \
+            np.asarray(instance["token_type_ids"][:-1]) == 1
+
+    return mask
+
+
+def _merge_wordpieces(tokens: List[str]) -> str:
+    """
+    Joins WordPiece tokens into a string, i.e. ["the", "eiffel", "tow", "##er"] becomes
+    "the eiffel tower".
+    """
+    answer = tokens[0]
+
+    for token in tokens[1:]:
+        if token[0:2] == "##":
+            answer += token[2:]
         else:
-            answer += " " + tokens[i]
+            answer += " " + token
+
+    return answer
+
+
+def _no_answer() -> dict:
+    """
+    The prediction for an instance without any valid answer span, i.e. without context.
+    Its scores are -inf, so that it never beats a real answer.
+    """
+    return {"answer": "", "start_scores_max": -np.inf, "end_scores_max": -np.inf}
+
+
+def _top_spans(questions: List[str], instances: List[dict], start_rows: List[np.ndarray],
+               end_rows: List[np.ndarray], max_answer_len: int, top_k: int) -> List[List[tuple]]:
+    """
+    Finds the `top_k` best spans across all the instances of each question, in one
+    vectorized pass per question (see `span_decoding.top_k_spans`).
+
+    Returns
+    -------
+    list
+        One list per instance with the (start, end) token indexes of the spans that lie in
+        it, best first.
+    """
+    start_logits = stack_logits(start_rows)
+    end_logits = stack_logits(end_rows)
+    mask = _context_mask(instances)
+
+    rows_by_question = {}
+    for row, question in enumerate(questions):
+        rows_by_question.setdefault(question, []).append(row)
+
+    spans = [[] for _ in instances]
+    for rows in rows_by_question.values():
+        rows = np.asarray(rows)
+        best_rows, starts, ends, _ = top_k_spans(start_logits[rows], end_logits[rows],
+                                                 mask[rows], max_answer_len, top_k)
+        for row, start, end in zip(rows[best_rows], starts, ends):
+            spans[row].append((int(start), int(end)))
+
+    return spans
+
+
+def _decode_predictions(instances: List[dict], start_rows: List[np.ndarray],
+                        end_rows: List[np.ndarray], max_answer_len: int,
+                        include_scores: bool, tokenizer=None, pool=None,
+                        questions: List[str] = None, top_k: int = None) -> List[dict]:
+    """
+    Turns the start and end scores of every instance into an answer string. The best span
+    of every instance is found in one vectorized pass, see `span_decoding`. If a
+    `worker_pool.WorkerPool` is given, the decoding is spread over its processes. If
+    `top_k` is set, the best spans across the instances of each of `questions` are found
+    too, see `get_model_predictions_batch`.
+    """
+    if not instances:
+        return []
+
+    tokenizer = get_tokenizer() if tokenizer is None else tokenizer
+    if pool is not None:
+        with stage("span_decoding"):
+            starts, ends, scores, answers = pool.decode(instances, start_rows, end_rows,
+                                                        max_answer_len)
+    else:
+        with stage("span_decoding"):
+            starts, ends, scores = best_span_per_row(stack_logits(start_rows),
+                                                     stack_logits(end_rows),
+                                                     _context_mask(instances), max_answer_len)
+
+        # Convert back to tokens so that the answers can be strings.
+        answers = [_merge_wordpieces(tokenizer.convert_ids_to_tokens(
+                       instance["input_ids"][answer_start:answer_end + 1]))
+                   for instance, answer_start, answer_end in zip(instances, starts, ends)]
+
+    top_spans = None
+    if top_k is not None:
+        with stage("span_decoding"):
+            top_spans = _top_spans(questions, instances, start_rows, end_rows, max_answer_len,
+                                   top_k)
+
+    results = []
+    for i, (answer, start_scores, end_scores, answer_start, answer_end, score) in \
+            enumerate(zip(answers, start_rows, end_rows, starts, ends, scores)):
+        # Set up a dict to organize the data returned by the model.
+        all_data = {"answer": answer,
+                    "start_scores_max": float(start_scores[answer_start]),
+                    "end_scores_max": float(end_scores[answer_end])}
+        if np.isneginf(score):
+            all_data = _no_answer()
+
+        if top_spans is not None:
+            all_data["top_answers"] = [
+                {"answer": _merge_wordpieces(tokenizer.convert_ids_to_tokens(
+                     instances[i]["input_ids"][span_start:span_end + 1])),
+                 "start_scores_max": float(start_scores[span_start]),
+                 "end_scores_max": float(end_scores[span_end])}
+                for span_start, span_end in top_spans[i]]
+
+        if include_scores:
+            all_data["start_scores"] = start_scores
+            all_data["end_scores"] = end_scores
+
+        results.append(all_data)
+
+    return results
+
+
+def get_model_predictions(question: str, answer_text: str,
+                          model_server_address: Union[str, InferenceBackend],
+                          include_scores: bool = False, request_format: str = "row",
+                          max_answer_len: int = 30, tokenizer=None) -> dict:
+    """
+    This function accepts a question and some text that contains the answer and
+    returns a dict containing the answer along with the max scores for the start
+    and end indexes, along with the start/end scores for every index.
+
+    Parameters
+    question : str
+        A question or query like "what is the capital of France?"
+
+    answer : str
+        Some context that contains the answer, like "Paris is the capital of France..."
+
+    model_server_address : str or InferenceBackend
+        Address of the BERT model server, or a backend that runs the model.
+
+    include_scores : bool
+        Whether to return the start/end scores for every index.
+
+    request_format : str
+        "row" or "columnar", see `ModelServerClient`. Ignored if a backend is passed in.
+
+    max_answer_len : int
+        The maximum length of the answer, in tokens.
+
+    tokenizer : object
+        The tokenizer. Defaults to `get_tokenizer()`.
+
+    Returns
+    -------
+    dict
+        A dict with the keys `answer`, `start_scores_max`, `end_scores_max`, and, if
+        `include_scores` is True, `start_scores` and `end_scores`. The latter two are float32
+        vectors across the entire tokenized `answer_text`. If there is no valid answer span
+        (i.e. `answer_text` is empty), `answer` is "" and the maximum scores are -inf.
+    """
+    return get_model_predictions_batch(question, [answer_text], model_server_address,
+                                       include_scores=include_scores,
+                                       request_format=request_format,
+                                       max_answer_len=max_answer_len, tokenizer=tokenizer)[0]
+
+
+def get_model_predictions_batch(question: Union[str, List[str]], chunks: List[str],
+                                model_server_address: Union[str, InferenceBackend],
+                                max_batch: int = 16, include_scores: bool = False,
+                                request_format: str = "row", max_answer_len: int = 30,
+                                max_in_flight: int = 1, tokenizer=None,
+                                pool=None, top_k: int = None) -> List[dict]:
+    """
+    Batched version of `get_model_predictions`. Every chunk is paired with the question
+    and up to `max_batch` pairs are packed into a single `:predict` request, so the model
+    server can score them as one batch instead of one round trip per chunk.
+
+    Parameters
+    ----------
+    question : str or list
+        A question or query like "what is the capital of France?", or a list with one
+        question per chunk, so that chunks for different questions can share batches.
+    chunks : list
+        A list of strings, each of which may contain the answer.
+    model_server_address : str or InferenceBackend
+        Address of the BERT model server, or a backend that runs the model.
+    max_batch : int
+        The maximum number of instances sent in a single request.
+    include_scores : bool
+        Whether to return the start/end scores for every index.
+    request_format : str
+        "row" or "columnar", see `ModelServerClient`. Ignored if a backend is passed in.
+    max_answer_len : int
+        The maximum length of the answers, in tokens.
+    max_in_flight : int
+        The maximum number of requests sent to the model server at the same time.
+    tokenizer : object
+        The tokenizer. Defaults to `get_tokenizer()`.
+    pool : WorkerPool
+        If set, tokenization and decoding run on this `worker_pool.WorkerPool` instead.
+    top_k : int
+        If set, the `top_k` best answer spans across all the chunks of each question are
+        found in one pass, see `span_decoding.top_k_spans`.
+
+    Returns
+    -------
+    list
+        A list of dicts in the same order as `chunks`. Each dict has the same schema as
+        the one returned by `get_model_predictions`. Padding is stripped from the scores.
+        If `top_k` is set, each dict also has `top_answers`: the ones among the best spans
+        of its question that lie in this chunk, best first, as dicts with `answer`,
+        `start_scores_max` and `end_scores_max`.
+    """
+    tokenizer = get_tokenizer() if tokenizer is None else tokenizer
+    questions = [question] * len(chunks) if isinstance(question, str) else question
+    with stage("tokenization"):
+        if pool is not None:
+            instances = pool.build_instances(questions, chunks)
+        else:
+            instances = [_build_instance(chunk_question, chunk, tokenizer)
+                         for chunk_question, chunk in zip(questions, chunks)]
+    REGISTRY.inc("qa_chunks_scored_total", len(instances))
+    start_rows, end_rows = _predict_batches(instances, model_server_address, max_batch,
+                                            request_format, max_in_flight, tokenizer)
+
+    return _decode_predictions(instances, start_rows, end_rows, max_answer_len, include_scores,
+                               tokenizer, pool, questions, top_k)
+
+
+def encode_article(article: str, tokenizer=None) -> dict:
+    """
+    Tokenizes an article without any special tokens.
+
+    Parameters
+    ----------
+    article : str
+        The text of an article.
+    tokenizer : object
+        A fast tokenizer. Defaults to `get_tokenizer()`.
+
+    Returns
+    -------
+    dict
+        A dict with the keys `input_ids` and `offsets`, where `offsets[i]` is the
+        (start, end) character span of token i in `article`.
+    """
+    tokenizer = get_tokenizer() if tokenizer is None else tokenizer
+
+    # Articles are longer than the model's maximum length, so don't warn about it.
+    encoding = tokenizer(article, add_special_tokens=False, return_offsets_mapping=True,
+                         verbose=False)
+
+    return {"input_ids": encoding["input_ids"], "offsets": encoding["offset_mapping"]}
+
+
+def _encode_articles(articles: List[str], titles: List[str], tokenizer, pool,
+                     token_cache) -> List[dict]:
+    """
+    Tokenizes every distinct article once, unless it is in `token_cache`.
+    """
+    titles = [""] * len(articles) if titles is None else titles
+    unique = {}  # Maps (title, article) to the encoding
+    for title, article in zip(titles, articles):
+        if (title, article) not in unique:
+            unique[(title, article)] = None if token_cache is None else \
+                                       token_cache.get(title, article, tokenizer)
+
+    missing = [key for key, encoding in unique.items() if encoding is None]
+    if token_cache is not None:
+        REGISTRY.inc("qa_token_cache_hits_total", len(unique) - len(missing))
+        REGISTRY.inc("qa_token_cache_misses_total", len(missing))
+
+    if pool is not None:
+        encodings = pool.encode_articles([article for _, article in missing])
+    else:
+        encodings = [encode_article(article, tokenizer) for _, article in missing]
+    for (title, article), encoding in zip(missing, encodings):
+        unique[(title, article)] = encoding
+        if token_cache is not None:
+            token_cache.set(title, article, tokenizer, encoding)
+
+    return [unique[(title, article)] for title, article in zip(titles, articles)]
+
+
+def get_article_windows(num_question_tokens: int, num_article_tokens: int,
+                        max_length: int = 512, stride: int = 128) -> List[tuple]:
+    """
+    Splits the tokens of an article into windows that, together with the question and the
+    three special tokens, are exactly `max_length` tokens long (except for the last one).
+    Consecutive windows overlap by `stride` tokens so that answers are not cut in half.
+
+    Returns
+    -------
+    list
+        A list of (start, end) token indexes into the article. Empty articles have no windows.
+
+    Raises
+    ------
+    ValueError
+        If `stride` is not smaller than the number of article tokens in a window.
+    """
+    window_size = max_length - num_question_tokens - 3
+    step = window_size - stride
+    if step < 1:
+        raise ValueError(f"The stride ({stride}) must be smaller than the window size "
+                         f"({window_size} tokens)")
+
+    windows = []
+    for start in range(0, num_article_tokens, step):
+        windows.append((start, min(start + window_size, num_article_tokens)))
+        if start + window_size >= num_article_tokens:
+            break
+
+    return windows
+
+
+def get_article_predictions(question: Union[str, List[str]], articles: List[str],
+                            model_server_address: Union[str, InferenceBackend],
+                            max_length: int = 512, stride: int = 128, max_batch: int = 16,
+                            include_scores: bool = False, request_format: str = "row",
+                            max_answer_len: int = 30, top_n: int = None,
+                            max_in_flight: int = 1, tokenizer=None, pool=None,
+                            titles: List[str] = None, token_cache=None,
+                            top_k: int = None) -> List[dict]:
+    """
+    Finds the answer to a question in every window of every article. Each article is
+    tokenized once, and the windows are sent to the model server in batches of up to
+    `max_batch` as pre-built ids.
+
+    Parameters
+    ----------
+    question : str or list
+        A question or query like "what is the capital of France?", or a list with one
+        question per article, so that articles for different questions can share batches.
+    articles : list
+        A list of article texts.
+    model_server_address : str or InferenceBackend
+        Address of the BERT model server, or a backend that runs the model.
+    max_length : int
+        The number of tokens the model accepts.
+    stride : int
+        The number of tokens by which consecutive windows overlap.
+    max_batch : int
+        The maximum number of instances sent in a single request.
+    include_scores : bool
+        Whether to return the start/end scores for every index.
+    request_format : str
+        "row" or "columnar", see `ModelServerClient`. Ignored if a backend is passed in.
+    max_answer_len : int
+        The maximum length of the answers, in tokens.
+    top_n : int
+        If set, only the `top_n` windows that best match each question (see
+        `passage_ranking`) are sent to the model server.
+    max_in_flight : int
+        The maximum number of requests sent to the model server at the same time.
+    tokenizer : object
+        A fast tokenizer. Defaults to `get_tokenizer()`.
+    pool : WorkerPool
+        If set, the articles are tokenized on this `worker_pool.WorkerPool`.
+    titles : list
+        The title of each article, which is part of its key in `token_cache`.
+    token_cache : TokenCache
+        If set, articles found in this `token_cache.TokenCache` are not tokenized again,
+        and the others are added to it.
+    top_k : int
+        If set, the `top_k` best answer spans across all the windows of each question are
+        found in one pass, see `get_model_predictions_batch`.
+
+    Returns
+    -------
+    list
+        A list of dicts, one per window that was sent to the model server, with the same
+        keys as `get_model_predictions_batch` plus `article_index` (the index of the article
+        in `articles`) and `context` (the text of the window). `answer` is a span of the
+        original article text.
+    """
+    tokenizer = get_tokenizer() if tokenizer is None else tokenizer
+    questions = [question] * len(articles) if isinstance(question, str) else question
+    with stage("tokenization"):
+        question_ids = {text: tokenizer(text, add_special_tokens=False)["input_ids"]
+                        [:max_length // 2] for text in set(questions)}
+        encodings = _encode_articles(articles, titles, tokenizer, pool, token_cache)
+
+    # Collect the windows, grouped by question, as
+    # (article_index, encoding, instance, window_start, context_start, context)
+    windows = {text: [] for text in question_ids}
+    for article_index, (article_question, article, encoding) in \
+            enumerate(zip(questions, articles, encodings)):
+        offsets = encoding["offsets"]
+        ids = question_ids[article_question]
+        context_start = len(ids) + 2
+        article_ids = np.asarray(encoding["input_ids"])
+        prefix = [tokenizer.cls_token_id] + ids + [tokenizer.sep_token_id]
+        for start, end in get_article_windows(len(ids), len(article_ids), max_length, stride):
+            input_ids = np.concatenate((prefix, article_ids[start:end],
+                                        [tokenizer.sep_token_id])).tolist()
+            instance = {"attention_mask": [1] * len(input_ids),
+                        "token_type_ids": [0] * context_start + [1] * (end - start + 1),
+                        "input_ids": input_ids}
+            context = article[offsets[start][0]:offsets[end - 1][1]]
+            windows[article_question].append((article_index, encoding, instance, start,
+                                               context_start, context))
+
+    if top_n is not None:
+        for text, question_windows in windows.items():
+            windows[text] = [question_windows[i] for i in rank_passages(
+                text, [window[5] for window in question_windows], top_n)]
+
+    # Put the windows back in article order.
+    windows = sorted((window for question_windows in windows.values()
+                      for window in question_windows), key=lambda window: (window[0], window[3]))
+
+    instances = [window[2] for window in windows]
+    REGISTRY.inc("qa_chunks_scored_total", len(instances))
+    start_rows, end_rows = _predict_batches(instances, model_server_address, max_batch,
+                                            request_format, max_in_flight, tokenizer)
+    if not instances:
+        return []
+
+    with stage("span_decoding"):
+        starts, ends, scores = best_span_per_row(stack_logits(start_rows),
+                                                 stack_logits(end_rows),
+                                                 _context_mask(instances), max_answer_len)
+        top_spans = None
+        if top_k is not None:
+            top_spans = _top_spans([questions[window[0]] for window in windows], instances,
+                                   start_rows, end_rows, max_answer_len, top_k)
+
+    def span_text(window, answer_start, answer_end):
+        # Map the tokens of the window back to the article text.
+        article_index, encoding, _, start, context_start, _ = window
+        offsets = encoding["offsets"]
+        return articles[article_index][offsets[start + answer_start - context_start][0]:
+                                       offsets[start + answer_end - context_start][1]]
+
+    results = []
+    for i, (window, start_scores, end_scores, answer_start, answer_end, score) in \
+            enumerate(zip(windows, start_rows, end_rows, starts, ends, scores)):
+        article_index, context = window[0], window[5]
+        if np.isneginf(score):
+            all_data = dict(_no_answer(), context=context, article_index=article_index)
+        else:
+            all_data = {"answer": span_text(window, answer_start, answer_end),
+                        "context": context,
+                        "start_scores_max": float(start_scores[answer_start]),
+                        "end_scores_max": float(end_scores[answer_end]),
+                        "article_index": article_index}
+
+        if top_spans is not None:
+            all_data["top_answers"] = [{"answer": span_text(window, span_start, span_end),
+                                        "start_scores_max": float(start_scores[span_start]),
+                                        "end_scores_max": float(end_scores[span_end])}
+                                       for span_start, span_end in top_spans[i]]
+
+        if include_scores and not np.isneginf(score):
+            all_data["start_scores"] = start_scores
+            all_data["end_scores"] = end_scores
 
-    # Set up a dict to organize the data returned by the model.
-    all_data = {"answer": answer,
-                "start_scores_max": max(start_scores),
-                "end_scores_max": max(end_scores),
-                "start_scores": start_scores,
-                "end_scores": end_scores}
+        results.append(all_data)
 
-    return all_data
+    return results
@@ -0,0 +1,228 @@
+"""
+An HTTP service that answers questions. The chunks of concurrent questions are combined
+into shared batches for the model server by a `dynamic_batching.DynamicBatcher`.
+
+    python serve.py --port 8000
+    curl -X POST localhost:8000/answer -d '{"question": "What is the capital of France?"}'
+
+Endpoints
+---------
+POST /answer
+    Takes {"question": "..."} and returns the result of `Answerer.answer_question`, or
+    "404 Not Found" if no articles were found for the question.
+    Answers "503 Service Unavailable" when too many questions are being answered, or when
+    the batcher's queue is full, so that a load balancer can send the request elsewhere.
+GET /healthz
+    Answers 200 while the process is running.
+GET /readyz
+    Answers 200 when the service can take more questions, 503 otherwise.
+GET /metrics
+    The metrics of `metrics.REGISTRY` in the Prometheus text format.
+"""
+
+import argparse
+import json
+import logging
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import numpy as np
+import yaml
+
+from answer_question import Answerer, BertTokenSizeOutOfRange, NoAnswerFound
+from dynamic_batching import BatcherOverloaded, DynamicBatcher
+from local_index import LocalIndex
+from metrics import REGISTRY
+from model_client import ModelServerClient
+
+
+logging.info("Running QA service module")
+
+
+def load_config(path: str = "model_server_config.yaml") -> dict:
+    """
+    Reads the configuration file, and adds the `:predict` address of the model server
+    as `model_server_address`.
+    """
+    with open(path) as conf:
+        config = yaml.load(conf, Loader=yaml.FullLoader)
+
+    config["model_server_address"] = f"http://{config['model_server_url']}:" \
+                                     f"{config['model_server_port']}/v{config['model_version']}" \
+                                     f"/models/{config['model_name']}:predict"
+    return config
+
+
+def _to_json(value):
+    """
+    Converts the numpy values in answers to plain Python values.
+    """
+    if isinstance(value, np.ndarray):
+        return value.tolist()
+    if isinstance(value, np.generic):
+        return value.item()
+    raise TypeError(f"{type(value)} is not JSON serializable")
+
+
+class QAService:
+    """
+    Attributes
+    ----------
+    answerer : Answerer
+        Answers the questions.
+    address : str
+        The address the service listens on, i.e. "http://127.0.0.1:8000".
+    max_concurrent_requests : int
+        The maximum number of questions answered at the same time. Further requests are
+        rejected with 503 right away instead of queueing up.
+
+    Methods
+    -------
+    answer
+        Answers the body of a POST /answer request, and returns (status, response).
+    ready
+        Returns True if the service can take more questions.
+    serve_forever
+        Serves requests until `shutdown` is called.
+    """
+
+    def __init__(self, answerer: Answerer, host="127.0.0.1", port=8000,
+                 max_concurrent_requests=64):
+        self.answerer = answerer
+        self.max_concurrent_requests = max_concurrent_requests
+        self._slots = threading.BoundedSemaphore(max_concurrent_requests)
+        self._server = ThreadingHTTPServer((host, port), self._handler())
+        self._server.daemon_threads = True
+        self.address = f"http://{host}:{self._server.server_port}"
+
+
+    def ready(self) -> bool:
+        ready = getattr(self.answerer.client, "ready", None)
+        return ready() if ready is not None else True
+
+
+    def answer(self, body: bytes) -> tuple:
+        try:
+            question = json.loads(body)["question"]
+            if not isinstance(question, str) or not question.strip():
+                raise ValueError
+        except (ValueError, KeyError, TypeError):
+            return 400, {"error": 'Expected a JSON body like {"question": "..."}'}
+
+        if not self._slots.acquire(blocking=False):  # pylint: disable=consider-using-with
+            REGISTRY.inc("qa_service_rejected_total")
+            return 503, {"error": "Too many questions are being answered"}
+
+        try:
+            return 200, self.answerer.answer_question(question)
+        except BertTokenSizeOutOfRange as err:
+            return 400, {"error": f"The question is too long ({err.token_count} words)"}
+        except NoAnswerFound as err:
+            return 404, {"error": str(err)}
+        except BatcherOverloaded as err:
+            REGISTRY.inc("qa_service_rejected_total")
+            return 503, {"error": str(err)}
+        except Exception as err:  # pylint: disable=broad-except
+            logging.exception("Could not answer %r", question)
+            return 500, {"error": str(err)}
+        finally:
+            self._slots.release()
+
+
+    def _handler(self):
+        service = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):  # pylint: disable=invalid-name
+                if self.path == "/healthz":
+                    self._respond(200, {"status": "ok"})
+                elif self.path == "/readyz":
+                    ready = service.ready()
+                    self._respond(200 if ready else 503, {"ready": ready})
+                elif self.path == "/metrics":
+                    self._respond(200, REGISTRY.render_prometheus().encode(),
+                                  "text/plain; version=0.0.4")
+                else:
+                    self._respond(404, {"error": "Not found"})
+
+            def do_POST(self):  # pylint: disable=invalid-name
+                if self.path != "/answer":
+                    self._respond(404, {"error": "Not found"})
+                    return
+                body = self.rfile.read(int(self.headers.get("content-length", 0)))
+                self._respond(*service.answer(body))
+
+            def _respond(self, status, body, content_type="application/json"):
+                if not isinstance(body, bytes):
+                    body = json.dumps(body, default=_to_json).encode()
+                self.send_response(status)
+                self.send_header("content-type", content_type)
+                self.send_header("content-length", str(len(body)))
+                if status == 503:
+                    self.send_header("retry-after", "1")
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, *args):  # pylint: disable=arguments-differ
+                pass
+
+        return Handler
+
+
+    def serve_forever(self):
+        self._server.serve_forever()
+
+
+    def shutdown(self):
+        self._server.shutdown()
+        self._server.server_close()
+
+
+    def __enter__(self):
+        threading.Thread(target=self.serve_forever, daemon=True).start()
+        return self
+
+
+    def __exit__(self, *exc):
+        self.shutdown()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Serve the question answering model over HTTP.")
+    parser.add_argument("--config", default="model_server_config.yaml")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8000)
+    parser.add_argument("--max-batch-size", type=int, default=64,
+                        help="The maximum number of chunks sent to the model server at once.")
+    parser.add_argument("--max-wait-ms", type=float, default=5.0,
+                        help="How long a batch waits for chunks of other questions.")
+    parser.add_argument("--max-queue-size", type=int, default=256,
+                        help="The maximum number of batches waiting for the model server.")
+    parser.add_argument("--max-concurrent-requests", type=int, default=64,
+                        help="The maximum number of questions answered at the same time.")
+    parser.add_argument("--process-workers", type=int, default=None,
+                        help="Tokenize and decode on this many processes.")
+    args = parser.parse_args(argv)
+
+    config = load_config(args.config)
+    backend = LocalIndex(config["local_index"]) if config.get("local_index") else None
+    batcher = DynamicBatcher(ModelServerClient(config["model_server_address"],
+                                               pool_size=args.max_concurrent_requests),
+                             max_batch_size=args.max_batch_size, max_wait_ms=args.max_wait_ms,
+                             max_queue_size=args.max_queue_size)
+    answerer = Answerer(batcher, backend=backend, retrieval_workers=5,
+                        process_pool=args.process_workers)
+
+    service = QAService(answerer, args.host, args.port, args.max_concurrent_requests)
+    logging.info("Serving questions on %s", service.address)
+    try:
+        service.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        answerer.close()
+        batcher.close()
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    main()
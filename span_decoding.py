@@ -0,0 +1,124 @@
+"""
+This module contains vectorized functions that pick answer spans out of the start and end
+logits of many chunks at once. A span is only valid if it lies inside the context (not the
+question, special tokens or padding), and start <= end <= start + max_answer_len.
+"""
+
+from typing import List
+import numpy as np
+
+
+def stack_logits(rows: List[np.ndarray]) -> np.ndarray:
+    """
+    Stacks vectors of different lengths into one matrix, padded with -inf.
+
+    Parameters
+    ----------
+    rows : list
+        A list of 1-D arrays, i.e. the start logits of every chunk.
+
+    Returns
+    -------
+    np.ndarray
+        A float32 matrix with one row per vector.
+    """
+    matrix = np.full((len(rows), max((len(row) for row in rows), default=0)), -np.inf,
+                     dtype=np.float32)
+    for i, row in enumerate(rows):
+        matrix[i, :len(row)] = row
+
+    return matrix
+
+
+def _span_scores(start_logits: np.ndarray, end_logits: np.ndarray, mask: np.ndarray,
+                 max_answer_len: int) -> np.ndarray:
+    """
+    Scores every valid span as start_logit + end_logit.
+
+    Returns
+    -------
+    np.ndarray
+        An array of shape (num_rows, num_tokens, max_answer_len + 1) where element [i, s, d]
+        is the score of the span from token s to token s + d in row i, or -inf if that span
+        is not valid.
+    """
+    num_tokens = start_logits.shape[1]
+    start_logits = np.where(mask, start_logits, -np.inf)
+    end_logits = np.where(mask, end_logits, -np.inf)
+
+    # Gather the end logit of every (start, length) pair in one fancy-indexing operation.
+    padded_end = np.pad(end_logits, ((0, 0), (0, max_answer_len)), constant_values=-np.inf)
+    end_index = np.arange(num_tokens)[:, None] + np.arange(max_answer_len + 1)[None, :]
+
+    return start_logits[:, :, None] + padded_end[:, end_index]
+
+
+def best_span_per_row(start_logits: np.ndarray, end_logits: np.ndarray, mask: np.ndarray,
+                      max_answer_len: int = 30) -> tuple:
+    """
+    Finds the best valid span in every row.
+
+    Parameters
+    ----------
+    start_logits : np.ndarray
+        A (num_rows, num_tokens) matrix of start logits, see `stack_logits`.
+    end_logits : np.ndarray
+        A (num_rows, num_tokens) matrix of end logits.
+    mask : np.ndarray
+        A boolean (num_rows, num_tokens) matrix that is True for tokens that may be part of
+        an answer.
+    max_answer_len : int
+        The maximum number of tokens between the start and the end of an answer.
+
+    Returns
+    -------
+    tuple
+        Three arrays with one element per row: the start index, the end index and the score
+        (start_logit + end_logit) of the best span. Rows without a valid span have the
+        score -inf and the span (0, 0).
+    """
+    scores = _span_scores(start_logits, end_logits, mask, max_answer_len)
+    flat_scores = scores.reshape(len(scores), -1)
+
+    best = flat_scores.argmax(axis=1)
+    starts, lengths = np.divmod(best, max_answer_len + 1)
+    best_scores = flat_scores[np.arange(len(scores)), best]
+
+    invalid = np.isneginf(best_scores)
+    starts[invalid] = 0
+    lengths[invalid] = 0
+
+    return starts, starts + lengths, best_scores
+
+
+
+def top_k_spans(start_logits: np.ndarray, end_logits: np.ndarray, mask: np.ndarray,
+                max_answer_len: int = 30, top_k: int = 5) -> tuple:
+    """
+    Finds the `top_k` best valid spans across all rows.
+
+    Parameters
+    ----------
+    See `best_span_per_row`.
+
+    Returns
+    -------
+    tuple
+        Four arrays with one element per span, best first: the row, the start index, the
+        end index and the score of the span. There are fewer than `top_k` spans if there
+        are not enough valid spans; rows without a valid span have none.
+    """
+    scores = _span_scores(start_logits, end_logits, mask, max_answer_len)
+    flat_scores = scores.reshape(-1)
+
+    top_k = min(top_k, len(flat_scores))
+    if top_k > 0:
+        best = np.argpartition(-flat_scores, top_k - 1)[:top_k]
+    else:
+        best = np.zeros(0, dtype=np.intp)
+    best = best[np.argsort(-flat_scores[best], kind="stable")]
+    best = best[~np.isneginf(flat_scores[best])]
+
+    rows, starts, lengths = np.unravel_index(best, scores.shape)
+
+    return rows, starts, starts + lengths, flat_scores[best]
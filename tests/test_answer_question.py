@@ -0,0 +1,220 @@
+"""
+Test the Answerer class against a local stub of Wikipedia. The model server is
+replaced by a fake prediction function, so no model server is needed.
+"""
+
+import asyncio
+import unittest
+from unittest import mock
+from answer_question import Answerer, NoAnswerFound
+from reading_comprehension import get_model_predictions_batch
+from benchmarks.stubs import StubModelServer, StubWikipedia
+
+
+QUERY = "What is the capital of France?"
+
+ARTICLES = {"Paris": "Paris is the capital and most populous city of France.",
+            "France": "France is a country in Western Europe."}
+
+
+def fake_predictions(question, chunks, model_server_address, **kwargs):
+    """
+    Scores each chunk by how often it mentions "capital", and answers with its first word.
+    """
+    return [{"answer": chunk.split(" ")[0],
+             "start_scores_max": float(chunk.count("capital")),
+             "end_scores_max": 1.0,
+             "start_scores": [0.0] * len(chunk),
+             "end_scores": [0.0] * len(chunk)} for chunk in chunks]
+
+
+@mock.patch("answer_question.get_model_predictions_batch", side_effect=fake_predictions)
+class TestAnswerer(unittest.TestCase):
+    """
+    Test the different ways that Answerer can answer questions.
+    """
+    def test_answer_question(self, predictions):
+        """
+        The best chunk is chosen, and the other chunks are kept as other results.
+        """
+        answerer = Answerer("stub", backend=StubWikipedia(ARTICLES))
+        ans = answerer.answer_question(QUERY)
+
+        assert ans["answer"]["answer"] == "Paris"
+        assert ans["answer"]["context_article_title"] == "Paris"
+        assert [result["answer"] for result in ans["other_results"]] == ["France"]
+        assert ans["cache_hit"] is False
+        assert predictions.call_count == 1
+
+
+    def test_no_articles(self, predictions):
+        """
+        A named error is raised when there is nothing to answer from, i.e. when every page
+        fails to download or the articles are empty.
+        """
+        backend = StubWikipedia(ARTICLES, failures={"Paris": 5, "France": 5})
+        answerer = Answerer("stub", backend=backend, retrieval_workers=2)
+        with self.assertRaises(NoAnswerFound):
+            answerer.answer_question(QUERY)
+
+        answerer = Answerer("stub", backend=StubWikipedia({"Empty": ""}), chunking="tokens")
+        with self.assertRaises(NoAnswerFound):
+            answerer.answer_question(QUERY)
+
+        answerer = Answerer("stub", backend=StubWikipedia({}))
+        answers = answerer.answer_questions([QUERY])
+        assert answers[0]["answer"] is None and answers[0]["error"]
+        assert predictions.call_count == 0
+
+
+    def test_answer_cache(self, predictions):
+        """
+        Repeated questions are answered from the cache, without their score vectors.
+        """
+        backend = StubWikipedia(ARTICLES)
+        answerer = Answerer("stub", backend=backend, answer_cache_size=10, include_scores=True)
+
+        first = answerer.answer_question(QUERY)
+        second = answerer.answer_question("  what is the CAPITAL of france ")
+
+        assert second["cache_hit"] is True
+        assert second["question"] == "  what is the CAPITAL of france "
+        assert second["answer"]["answer"] == first["answer"]["answer"]
+        assert "start_scores" in first["answer"] and "start_scores" not in second["answer"]
+        assert predictions.call_count == 1
+        assert len(backend.page_calls) == 2
+
+        # Changing an answer doesn't change the cache, also when the scores are cached.
+        answerer = Answerer("stub", backend=backend, answer_cache_size=10, cache_scores=True)
+        for answer in [answerer.answer_question(QUERY), answerer.answer_question(QUERY),
+                       answerer.answer_questions([QUERY, QUERY])[0]]:
+            answer["other_results"].pop()
+            answer["answer"]["answer"] = "Lyon"
+
+        third = answerer.answer_question(QUERY)
+        assert third["answer"]["answer"] == "Paris" and len(third["other_results"]) == 1
+
+
+    def test_streaming(self, predictions):
+        """
+        With streaming, each article is scored as it arrives. The articles after a
+        confident answer are never downloaded, and all of them are scored if no answer is
+        confident enough.
+        """
+        articles = dict(ARTICLES, Lyon="Lyon is a city in France.")
+
+        backend = StubWikipedia(articles)
+        answerer = Answerer("stub", backend=backend, streaming=True, retrieval_workers=1,
+                            early_exit_score=2.0)
+        ans = answerer.answer_question(QUERY)
+
+        assert ans["answer"]["answer"] == "Paris"
+        assert backend.page_calls == ["Paris"]
+        assert predictions.call_count == 1
+
+        backend = StubWikipedia(articles)
+        answerer = Answerer("stub", backend=backend, streaming=True, retrieval_workers=1,
+                            early_exit_score=10.0)
+        ans = answerer.answer_question(QUERY)
+
+        assert ans["answer"]["answer"] == "Paris"
+        assert backend.page_calls == ["Paris", "France", "Lyon"]
+        assert predictions.call_count == 1 + 3
+        assert len(ans["other_results"]) == 2
+
+
+    def test_top_k(self, predictions):
+        """
+        The best spans across all the chunks are returned in order, also when the articles
+        are scored one at a time, and the best one is the answer.
+        """
+        predictions.side_effect = get_model_predictions_batch
+        with StubModelServer() as server:
+            for chunking, streaming in [("words", False), ("tokens", False), ("words", True)]:
+                answerer = Answerer(server.address, backend=StubWikipedia(ARTICLES),
+                                    chunking=chunking, streaming=streaming, top_k=3)
+                ans = answerer.answer_question(QUERY)
+
+                scores = [span["start_scores_max"] + span["end_scores_max"]
+                          for span in ans["top_answers"]]
+                assert len(scores) == 3 and scores == sorted(scores, reverse=True)
+                assert ans["top_answers"][0]["answer"] == ans["answer"]["answer"]
+                assert ans["top_answers"][0]["answer"].lower() == "paris"
+                assert ans["top_answers"][0]["context_article_title"] == "Paris"
+                assert "top_answers" not in ans["answer"]
+
+
+    def test_rerank(self, predictions):
+        """
+        Only the chunks that best match the question are sent to the model.
+        """
+        answerer = Answerer("stub", backend=StubWikipedia(ARTICLES), rerank_top_n=1)
+        ans = answerer.answer_question(QUERY)
+
+        assert ans["answer"]["answer"] == "Paris"
+        assert ans["other_results"] == []
+        assert predictions.call_args[0][1] == [ARTICLES["Paris"]]
+
+        # When streaming, each article is ranked on its own.
+        predictions.reset_mock()
+        answerer = Answerer("stub", backend=StubWikipedia(ARTICLES), rerank_top_n=1,
+                            streaming=True)
+        ans = answerer.answer_question(QUERY)
+
+        assert sorted(call[0][1][0] for call in predictions.call_args_list) == \
+               sorted(ARTICLES.values())
+        assert len(ans["other_results"]) == 1
+
+
+    def test_answer_questions(self, predictions):
+        """
+        Repeated questions are answered once, articles found for several questions are
+        downloaded once, all chunks share the same model server batches, and the answers
+        come back in order.
+        """
+        backend = StubWikipedia(ARTICLES)
+        answerer = Answerer("stub", backend=backend)
+        questions = [QUERY, "Where is France?", QUERY.lower()]
+
+        answers = answerer.answer_questions(questions)
+
+        assert [ans["question"] for ans in answers] == questions
+        assert [ans["answer"]["answer"] for ans in answers] == ["Paris"] * 3
+        assert predictions.call_count == 1
+        assert predictions.call_args[0][0] == [QUERY] * 2 + ["Where is France?"] * 2
+        assert sorted(backend.page_calls) == ["France", "Paris"]
+
+        answers = asyncio.run(answerer.answer_questions_async(questions[:1]))
+        assert answers[0]["answer"]["answer"] == "Paris"
+
+        # A question that is too long doesn't fail the others.
+        answers = answerer.answer_questions([" ".join(["word"] * 20), QUERY])
+        assert answers[0]["answer"] is None and "too long" in answers[0]["error"]
+        assert answers[1]["answer"]["answer"] == "Paris"
+
+
+    def test_adaptive_depth(self, predictions):
+        """
+        The sections of the articles are only downloaded and scored while no answer in the
+        introductions is good enough, and only until one is.
+        """
+        articles = {"Paris": "Paris is a city.\n\n== Government ==\nParis is the capital of "
+                             "France.\n\n== Climate ==\nParis has a capital climate.",
+                    "France": "France is a country in Western Europe."}
+
+        backend = StubWikipedia(articles)
+        answerer = Answerer("stub", backend=backend, adaptive_depth_score=1.0)
+        ans = answerer.answer_question(QUERY)
+
+        assert ans["answer"]["context"] == "Paris is a city.\n"
+        assert backend.page_calls == []
+        assert predictions.call_count == 1
+
+        backend = StubWikipedia(articles)
+        answerer = Answerer("stub", backend=backend, adaptive_depth_score=2.0)
+        ans = answerer.answer_question(QUERY)
+
+        assert ans["answer"]["context"] == "== Government ==\nParis is the capital of France.\n"
+        assert sorted(backend.page_calls) == ["France", "Paris"]
+        assert predictions.call_count == 3
+        assert len(ans["other_results"]) == 2
@@ -0,0 +1,110 @@
+"""
+Test the document retrieval cache. These tests do not need an internet connection.
+"""
+
+import os
+import tempfile
+import time
+import unittest
+from article_cache import CachedBackend, MemoryCache, SQLiteCache, TieredCache
+from document_retrieval import get_articles, iter_article_depths
+from benchmarks.stubs import StubWikipedia
+
+
+QUERY = "What is the capital of France?"
+
+
+class NoSummaryWikipedia:  # pylint: disable=too-few-public-methods
+    """
+    A search engine without `summary`.
+    """
+    def __init__(self, articles):
+        self._backend = StubWikipedia(articles)
+        self.exceptions = self._backend.exceptions
+        self.search = self._backend.search
+        self.suggest = self._backend.suggest
+        self.page = self._backend.page
+
+
+class TestArticleCache(unittest.TestCase):
+    """
+    Test the cache tiers and the cached search engine.
+    """
+    def test_memory_cache(self):
+        """
+        The least recently used entry is evicted, and old entries expire.
+        """
+        cache = MemoryCache(max_entries=2)
+        cache.set("a", 1)
+        cache.set("b", 2)
+        cache.get("a")
+        cache.set("c", 3)
+
+        assert cache.get("b") is None
+        assert cache.get("a") == 1 and cache.get("c") == 3
+        assert (cache.hits, cache.misses) == (3, 1)
+
+        cache = MemoryCache(ttl=0.05)
+        cache.set("a", 1)
+        time.sleep(0.1)
+        assert cache.get("a") is None
+
+
+    def test_sqlite_cache(self):
+        """
+        Entries survive re-opening the database and the least recently used are evicted.
+        """
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, "cache.sqlite")
+            cache = SQLiteCache(path, max_entries=2)
+            cache.set("a", ["x", "y"])
+            cache.set("b", "text")
+            cache.get("a")
+            cache.set("c", "more text")
+
+            cache = SQLiteCache(path, max_entries=2)
+            assert len(cache) == 2
+            assert cache.get("a") == ["x", "y"]
+            assert cache.get("b") is None
+
+
+    def test_cached_backend(self):
+        """
+        Repeated and overlapping queries are served from the cache.
+        """
+        backend = StubWikipedia({"Paris": "Paris is the capital of France.",
+                                 "France": "France is a country."})
+        memory = MemoryCache()
+        cached = CachedBackend(backend, TieredCache(memory, MemoryCache()))
+
+        first = get_articles(QUERY, num_articles_search=2, characters_per_article=100,
+                             backend=cached)
+        second = get_articles(QUERY, num_articles_search=2, characters_per_article=10,
+                              backend=cached)
+        third = get_articles("Paris", num_articles_search=1, characters_per_article=100,
+                             backend=cached)
+
+        assert first == [("Paris", "Paris is the capital of France."),
+                         ("France", "France is a country.")]
+        assert second == [("Paris", "Paris is t"), ("France", "France is ")]
+        assert third == first[:1]
+        assert backend.page_calls == ["Paris", "France"]
+
+        # After the memory tier is cleared, the second tier still serves the pages.
+        memory._entries.clear()  # pylint: disable=protected-access
+        assert get_articles(QUERY, 2, 100, backend=cached) == first
+        assert backend.page_calls == ["Paris", "France"]
+
+
+    def test_cached_backend_without_summary(self):
+        """
+        The cache only has `summary` if the backend has it, so articles are read whole
+        instead of failing.
+        """
+        articles = {"Paris": "Paris is the capital of France.\n\n== History ==\nParis is old."}
+        cached = CachedBackend(NoSummaryWikipedia(articles))
+
+        assert not hasattr(cached, "summary")
+        assert hasattr(CachedBackend(StubWikipedia(articles)), "summary")
+        assert list(iter_article_depths(QUERY, 1, 100, backend=cached)) == \
+               [[("Paris", articles["Paris"])]]
@@ -0,0 +1,46 @@
+"""
+Test that the offline benchmark runs and detects regressions.
+"""
+
+import copy
+import unittest
+from benchmarks.answerer_benchmark import CorpusWikipedia, find_regressions, load_corpus, \
+                                          run_benchmark
+
+
+class TestBenchmark(unittest.TestCase):
+    """
+    Run a small version of the benchmark.
+    """
+    def test_corpus_search(self):
+        """
+        The stub search ranks the articles that mention the query first.
+        """
+        backend = CorpusWikipedia(load_corpus()["articles"])
+
+        assert backend.search("Which river flows through Lisbon?", results=2)[0] == "Lisbon"
+
+
+    def test_run_benchmark(self):
+        """
+        Every configuration reports its measurements, and slower results are regressions.
+        """
+        results = run_benchmark({"words": {}, "tokens": {"chunking": "tokens"}},
+                                model_latency=0, page_latency=0, num_questions=2)
+
+        assert set(results["results"]) == {"words", "tokens"}
+        for result in results["results"].values():
+            assert result["questions"] == 2
+            assert result["model_calls_per_question"] == 1
+            assert result["chunks_per_question"] >= 1
+            assert result["latency_p50"] <= result["latency_p99"]
+            assert "model_request" in result["stage_seconds_per_question"]
+
+        slower = copy.deepcopy(results)
+        slower["results"]["words"]["questions_per_second"] /= 2
+        assert not find_regressions(results, results)
+        assert len(find_regressions(slower, results)) == 1
+
+
+if __name__ == "__main__":
+    unittest.main()
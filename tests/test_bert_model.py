@@ -4,11 +4,18 @@ WARNING: Initialize the model server before running these tests.
 """
 
 import json
+import subprocess
+import sys
 import unittest
+import numpy as np
 import requests
 import yaml
-from transformers import BertTokenizer
-from reading_comprehension import get_model_predictions
+from transformers import BertTokenizer, BertTokenizerFast
+from reading_comprehension import get_model_predictions, get_model_predictions_batch, \
+                                  get_article_predictions, get_article_windows, encode_article, \
+                                  _pad_instances, get_tokenizer, SnapshotTokenizer, \
+                                  TOKENIZER_DIRECTORY
+from benchmarks.stubs import StubModelServer
 
 
 # Model Server config
@@ -93,14 +100,185 @@ class TestModel(unittest.TestCase):
         """
         Test both of these functions together in the `get_model_predictions` function!
         """
-        model_output = get_model_predictions(QUERY, CONTEXT, MODEL_SERVER)
+        model_output = get_model_predictions(QUERY, CONTEXT, MODEL_SERVER, include_scores=True)
 
         # Check that the answer is correct.
         assert model_output["answer"] == "paris"
 
-        # Check that the start and end score max is a float.
-        assert model_output["start_scores_max"] == 6.06250906
-        assert model_output["end_scores_max"] == 7.04248047
+        # Check that the start and end score max is a float (the logits are float32).
+        self.assertAlmostEqual(model_output["start_scores_max"], 6.06250906, places=5)
+        self.assertAlmostEqual(model_output["end_scores_max"], 7.04248047, places=5)
 
         # Check that the start and end score tensors are the right length.
         assert len(model_output["start_scores"]) == len(model_output["start_scores"]) == 130
+
+
+    def test_pad_instances(self):
+        """
+        Instances of different lengths are padded to a common length and the
+        padding is not attended to.
+        """
+        short = {"input_ids": [101, 102], "token_type_ids": [0, 0], "attention_mask": [1, 1]}
+        padded = _pad_instances([short, {"input_ids": INPUT_IDS, "token_type_ids": TOKEN_TYPE_IDS,
+                                         "attention_mask": [1] * len(INPUT_IDS)}])
+
+        assert all(len(instance[key]) == len(INPUT_IDS) for instance in padded for key in instance)
+        assert padded[0]["input_ids"][:2] == [101, 102]
+        assert sum(padded[0]["attention_mask"]) == 2
+        assert padded[1]["input_ids"] == INPUT_IDS
+
+
+    def test_get_model_predictions_batch(self):
+        """
+        The batched predictions should match the single-chunk predictions, even when the
+        chunks have different lengths and must be padded.
+        """
+        chunks = [CONTEXT, "Paris is a city.", CONTEXT]
+        model_outputs = get_model_predictions_batch(QUERY, chunks, MODEL_SERVER, max_batch=2,
+                                                    include_scores=True)
+
+        assert len(model_outputs) == 3
+        assert model_outputs[0]["answer"] == model_outputs[2]["answer"] == "paris"
+        assert len(model_outputs[0]["start_scores"]) == 130
+        assert len(model_outputs[1]["start_scores"]) < 130
+
+
+    def test_article_windows(self):
+        """
+        Windows fill the whole context, overlap by `stride` tokens and cover every token.
+        """
+        windows = get_article_windows(9, 1200, max_length=512, stride=100)
+
+        assert windows == [(0, 500), (400, 900), (800, 1200)]
+        assert get_article_windows(9, 0) == []
+
+        # A stride that leaves no room for new tokens is a configuration error.
+        with self.assertRaises(ValueError):
+            get_article_windows(10, 1000, stride=600)
+        with self.assertRaises(ValueError):
+            get_article_windows(9, 1000, stride=500)
+        assert len(get_article_windows(9, 1000, stride=499)) == 1000 - 500 + 1
+
+        # Offsets map every token back to the original text.
+        encoding = encode_article(CONTEXT)
+        assert encoding["input_ids"] == INPUT_IDS[9:-1]
+        assert [CONTEXT[start:end] for start, end in encoding["offsets"][64:67]] == \
+               ["capital", "in", "Paris"]
+
+
+    def test_get_article_predictions(self):
+        """
+        The answer is a span of the original article rather than a string of tokens.
+        """
+        model_outputs = get_article_predictions(QUERY, [CONTEXT, CONTEXT * 10], MODEL_SERVER,
+                                                stride=64)
+
+        assert model_outputs[0]["article_index"] == 0
+        assert model_outputs[0]["answer"] == "Paris"
+        assert {output["article_index"] for output in model_outputs[1:]} == {1}
+
+
+class TestModelResponseFormats(unittest.TestCase):
+    """
+    Test the row and columnar request formats against a local stub of the model server.
+    """
+    def test_request_formats(self):
+        """
+        Both request formats give the same answers, and the scores are float32 arrays
+        that are only returned on request.
+        """
+        chunks = [CONTEXT, "Paris is a city."]
+        with StubModelServer() as server:
+            row = get_model_predictions_batch(QUERY, chunks, server.address)
+            columnar = get_model_predictions_batch(QUERY, chunks, server.address,
+                                                   include_scores=True, request_format="columnar")
+            assert server.requests == 2
+
+        assert [output["answer"] for output in row] == ["paris", "paris"]
+        assert [output["answer"] for output in columnar] == ["paris", "paris"]
+        assert "start_scores" not in row[0]
+
+        assert columnar[0]["start_scores"].dtype == np.float32
+        assert len(columnar[0]["start_scores"]) == 130
+        assert isinstance(columnar[0]["start_scores_max"], float)
+
+
+    def test_get_model_predictions_stub(self):
+        """
+        A single chunk can be scored in either format.
+        """
+        with StubModelServer() as server:
+            for request_format in ["row", "columnar"]:
+                model_output = get_model_predictions(QUERY, CONTEXT, server.address,
+                                                     request_format=request_format)
+                assert model_output["answer"] == "paris"
+                assert model_output["start_scores_max"] == 10.0
+
+
+    def test_get_article_predictions_stub(self):
+        """
+        Token windows are built from pre-encoded ids, and the answer is a span of the article.
+        """
+        with StubModelServer() as server:
+            model_outputs = get_article_predictions(QUERY, [CONTEXT * 10], server.address,
+                                                    max_batch=8, request_format="columnar")
+            assert server.requests == 1
+
+        assert len(model_outputs) > 1
+        assert all(output["answer"] == "Paris" for output in model_outputs)
+
+
+    def test_top_k_stub(self):
+        """
+        The best spans are found across all the chunks of each question.
+        """
+        questions = [QUERY, QUERY, "Where is Paris?"]
+        chunks = [CONTEXT, "Paris is a city.", "Paris is a city."]
+        with StubModelServer() as server:
+            model_outputs = get_model_predictions_batch(questions, chunks, server.address,
+                                                        top_k=3)
+            article_outputs = get_article_predictions(QUERY, [CONTEXT * 10], server.address,
+                                                      top_k=2)
+
+        spans = [span for output in model_outputs[:2] for span in output["top_answers"]]
+        assert len(spans) == 3 and len(model_outputs[2]["top_answers"]) == 3
+        assert sorted(span["start_scores_max"] + span["end_scores_max"]
+                      for span in spans)[-2:] == [20.0, 20.0]
+        assert [span["answer"] for output in article_outputs
+                for span in output["top_answers"]] == ["Paris", "Paris"]
+
+
+class TestTokenizer(unittest.TestCase):
+    """
+    Test the lazily loaded tokenizer. These tests don't need a model server.
+    """
+    def test_snapshot_tokenizer(self):
+        """
+        The `tokenizer.json` snapshot tokenizes exactly like the transformers tokenizer.
+        """
+        snapshot = get_tokenizer()
+        reference = BertTokenizerFast.from_pretrained(TOKENIZER_DIRECTORY)
+        assert isinstance(snapshot, SnapshotTokenizer)
+
+        assert snapshot.encode(QUERY, CONTEXT) == INPUT_IDS
+        assert snapshot.convert_ids_to_tokens(INPUT_IDS) == TOKENS
+        assert (snapshot.cls_token_id, snapshot.sep_token_id, snapshot.pad_token_id) == \
+               (reference.cls_token_id, reference.sep_token_id, reference.pad_token_id)
+
+        encoding = encode_article(CONTEXT)
+        expected = reference(CONTEXT, add_special_tokens=False, return_offsets_mapping=True)
+        assert encoding["input_ids"] == expected["input_ids"]
+        assert [tuple(offsets) for offsets in encoding["offsets"]] == \
+               [tuple(offsets) for offsets in expected["offset_mapping"]]
+
+
+    def test_lazy_imports(self):
+        """
+        Importing the library doesn't import transformers or wikipedia.
+        """
+        code = "import sys, answer_question, serve\n" \
+               "print('transformers' in sys.modules, 'wikipedia' in sys.modules)"
+        output = subprocess.run([sys.executable, "-c", code], check=True, capture_output=True,
+                                text=True).stdout
+
+        assert output.split() == ["False", "False"]
@@ -4,8 +4,11 @@ WARNING: Make sure that you have an internet connection before running this.
 TODO: warm up model server.
 """
 
+import time
 import unittest
-from document_retrieval import get_articles
+from document_retrieval import get_articles, get_articles_concurrent, iter_article_depths, \
+                               iter_article_sections, iter_articles, split_sections
+from benchmarks.stubs import StubWikipedia
 
 
 QUERY = "What is the capital of France?"
@@ -32,3 +35,112 @@ class TestDocumentRetrieval(unittest.TestCase):
         # Check that the returned text is correct (search a subset)
         assert "On what day were you born?" in results[0][1]
         assert "Since the 17th century, Paris has been one of Europe's major" in results[1][1]
+
+
+class TestConcurrentDocumentRetrieval(unittest.TestCase):
+    """
+    Test the concurrent document retrieval function against a local stub of Wikipedia.
+    """
+    def test_get_articles_concurrent_order(self):
+        """
+        Articles are returned in search order even when they finish out of order, and
+        "incorrect" titles are resolved with `suggest`.
+        """
+        backend = StubWikipedia({"Paris": "Paris is the capital of France.",
+                                 "France": "France is a country.",
+                                 "Lyon": "Lyon is a city."},
+                                delays={"Paris": 0.2},
+                                suggestions={"paris n": "Paris"})
+
+        results = get_articles_concurrent(QUERY, num_articles_search=4, characters_per_article=5,
+                                          max_workers=4, backend=backend)
+
+        assert results == [("Paris", "Paris"), ("Paris", "Paris"), ("France", "Franc"),
+                           ("Lyon", "Lyon ")]
+        assert results == get_articles(QUERY, num_articles_search=4, characters_per_article=5,
+                                       backend=backend)
+
+
+    def test_get_articles_concurrent_failures(self):
+        """
+        Failing pages are retried, and pages that are too slow are dropped without
+        holding up the rest.
+        """
+        backend = StubWikipedia({"Slow": "slow", "Flaky": "flaky", "Fast": "fast"},
+                                delays={"Slow": 2}, failures={"Flaky": 1})
+
+        start = time.monotonic()
+        results = get_articles_concurrent(QUERY, num_articles_search=3, characters_per_article=100,
+                                          max_workers=1, page_timeout=0.2, retries=1,
+                                          backend=backend)
+
+        assert results == [("Flaky", "flaky"), ("Fast", "fast")]
+        assert backend.page_calls.count("Flaky") == 2
+        assert time.monotonic() - start < 1
+
+
+    def test_iter_articles(self):
+        """
+        Articles are yielded as soon as they arrive, and no more downloads are started
+        once the caller stops iterating.
+        """
+        backend = StubWikipedia({"Slow": "slow", "Fast": "fast", "Later": "later"},
+                                delays={"Slow": 0.2})
+
+        articles = iter_articles(QUERY, num_articles_search=3, characters_per_article=100,
+                                 max_workers=2, backend=backend)
+
+        assert next(articles) == ("Fast", "fast")
+        articles.close()
+
+        assert "Later" not in backend.page_calls
+
+
+    def test_iter_article_depths(self):
+        """
+        Only the introductions are downloaded until the caller asks for the sections,
+        which come one at a time.
+        """
+        article = "Paris is a city.\n\n== History ==\nParis is old.\n\n== Climate ==\nIt rains."
+        backend = StubWikipedia({"Paris": article, "Lyon": "Lyon is a city."})
+
+        assert split_sections(article) == ["Paris is a city.\n", "== History ==\nParis is old.\n",
+                                           "== Climate ==\nIt rains."]
+
+        depths = iter_article_depths(QUERY, num_articles_search=2, characters_per_article=100,
+                                     backend=backend)
+
+        assert next(depths) == [("Paris", "Paris is a city.\n"), ("Lyon", "Lyon is a city.")]
+        assert backend.page_calls == []
+        assert next(depths) == [("Paris", "== History ==\nParis is old.\n")]
+        assert next(depths) == [("Paris", "== Climate ==\nIt rains.")]
+        assert next(depths, None) is None
+        assert sorted(backend.page_calls) == ["Lyon", "Paris"]
+
+        # Nothing deeper than characters_per_article is read.
+        depths = iter_article_depths(QUERY, num_articles_search=1, characters_per_article=40,
+                                     backend=backend)
+        assert [part for parts in depths for _, part in parts] == \
+               ["Paris is a city.\n", "== History ==\nParis is"]
+
+        # A slow article is dropped instead of holding up the others.
+        backend = StubWikipedia({"Slow": "slow", "Fast": "fast"}, delays={"Slow": 2})
+        start = time.monotonic()
+        depths = iter_article_depths(QUERY, num_articles_search=2, characters_per_article=100,
+                                     page_timeout=0.2, backend=backend)
+
+        assert list(depths) == [[("Fast", "fast")]]
+        assert time.monotonic() - start < 1
+
+
+    def test_iter_article_sections_auto_suggest(self):
+        """
+        The sections come from the same article as the introduction, even when the
+        backend's auto-suggest would resolve the title to another article.
+        """
+        articles = {"Paris": "Paris is a city.\n\n== History ==\nParis is old.",
+                    "Paris Hilton": "Paris Hilton is a person.\n\n== Career ==\nShe sings."}
+        backend = StubWikipedia(articles, redirects={"Paris": "Paris Hilton"})
+
+        assert list(iter_article_sections("Paris", 100, backend=backend)) == \
+               [("Paris", "Paris is a city.\n"), ("Paris", "== History ==\nParis is old.")]
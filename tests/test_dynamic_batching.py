@@ -0,0 +1,150 @@
+"""
+Test that DynamicBatcher combines concurrent calls, and sheds calls when it is overloaded.
+"""
+
+import threading
+import time
+import unittest
+from concurrent.futures import ThreadPoolExecutor
+import numpy as np
+from dynamic_batching import BatcherOverloaded, DynamicBatcher
+from inference_backend import InferenceBackend
+
+
+def make_instances(num_instances, length, first_id):
+    return [{"input_ids": [first_id + i] * length, "attention_mask": [1] * length,
+             "token_type_ids": [0] * length} for i in range(num_instances)]
+
+
+class RecordingBackend(InferenceBackend):
+    """
+    Returns each instance's ids as its logits, records the size of every batch, and waits
+    for `release` before answering.
+    """
+    def __init__(self):
+        self.batches = []
+        self.release = threading.Event()
+        self.release.set()
+        self.error = None
+
+    def predict(self, instances):
+        self.release.wait()
+        self.batches.append(len(instances))
+        if self.error is not None:
+            raise self.error
+        logits = np.asarray([instance["input_ids"] for instance in instances], dtype=np.float32)
+        return logits, -logits
+
+
+class TestDynamicBatcher(unittest.TestCase):
+    """
+    Run many concurrent calls through a DynamicBatcher.
+    """
+    def test_combined_batches(self):
+        """
+        Calls of different lengths share batches, and each gets back its own logits.
+        """
+        backend = RecordingBackend()
+        batcher = DynamicBatcher(backend, max_batch_size=8, max_wait_ms=50)
+        calls = [make_instances(2, 3 + i % 3, 100 * i) for i in range(8)]
+
+        with ThreadPoolExecutor(max_workers=8) as executor:
+            results = list(executor.map(batcher.predict, calls))
+        batcher.close()
+
+        assert sum(backend.batches) == 16
+        assert len(backend.batches) < 8
+        assert max(backend.batches) <= 8
+        for i, (instances, (start, end)) in enumerate(zip(calls, results)):
+            assert start.shape == (2, len(instances[0]["input_ids"]))
+            np.testing.assert_array_equal(start[:, 0], [100 * i, 100 * i + 1])
+            np.testing.assert_array_equal(end, -start)
+
+
+    def test_overloaded(self):
+        """
+        When the queue is full, calls fail right away instead of waiting.
+        """
+        backend = RecordingBackend()
+        backend.release.clear()
+        batcher = DynamicBatcher(backend, max_batch_size=1, max_wait_ms=0, max_queue_size=1,
+                                 max_in_flight=1)
+
+        with ThreadPoolExecutor(max_workers=3) as executor:
+            pending = batcher._queue  # pylint: disable=protected-access
+            try:
+                # One call is being scored, one waits for a slot and one fills the queue.
+                futures = []
+                for i in range(3):
+                    futures.append(executor.submit(batcher.predict, make_instances(1, 2, i)))
+                    deadline = time.monotonic() + 5
+                    # Wait until the batcher has taken the call off the queue.
+                    while i < 2 and (pending.unfinished_tasks <= i or not pending.empty()) and \
+                            time.monotonic() < deadline:
+                        time.sleep(0.01)
+                while batcher.ready() and time.monotonic() < deadline:
+                    time.sleep(0.01)
+
+                with self.assertRaises(BatcherOverloaded):
+                    batcher.predict(make_instances(1, 2, 3))
+            finally:
+                backend.release.set()
+
+        assert all(future.exception() is None for future in futures)
+        assert batcher.ready()
+        batcher.close()
+
+
+    def test_errors(self):
+        """
+        Errors are raised in every call of the batch, and calls fail once the batcher is
+        closed.
+        """
+        backend = RecordingBackend()
+        backend.error = ConnectionError("model server is down")
+        batcher = DynamicBatcher(backend, max_wait_ms=1)
+
+        with self.assertRaises(ConnectionError):
+            batcher.predict(make_instances(2, 3, 0))
+
+        # Errors before the backend is called don't leave the call waiting forever.
+        backend.error = None
+        with self.assertRaises(KeyError):
+            batcher.predict([{"input_ids": [1, 2, 3]}])
+        assert np.array_equal(batcher.predict(make_instances(1, 2, 5))[0], [[5, 5]])
+
+        batcher.close()
+        with self.assertRaises(RuntimeError):
+            batcher.predict(make_instances(1, 2, 0))
+
+
+    def test_close(self):
+        """
+        Calls that were queued before the batcher was closed are still answered.
+        """
+        backend = RecordingBackend()
+        backend.release.clear()
+        batcher = DynamicBatcher(backend, max_batch_size=1, max_wait_ms=0, max_in_flight=1)
+
+        with ThreadPoolExecutor(max_workers=5) as executor:
+            futures = [executor.submit(batcher.predict, make_instances(1, 2, i))
+                       for i in range(4)]
+            pending = batcher._queue  # pylint: disable=protected-access
+            deadline = time.monotonic() + 5
+            # One call waits for the backend, one for a slot and two in the queue.
+            while pending.qsize() < 2 and time.monotonic() < deadline:
+                time.sleep(0.01)
+
+            closing = executor.submit(batcher.close)
+            while batcher.ready() and time.monotonic() < deadline:
+                time.sleep(0.01)
+            with self.assertRaises(RuntimeError):
+                batcher.predict(make_instances(1, 2, 0))
+            backend.release.set()
+
+            assert [future.result(timeout=5)[0][0, 0] for future in futures] == [0, 1, 2, 3]
+            closing.result(timeout=5)
+
+
+if __name__ == "__main__":
+    unittest.main()
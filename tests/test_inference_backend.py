@@ -0,0 +1,110 @@
+"""
+Test the pluggable inference backends. The ONNX Runtime tests export a tiny randomly
+initialized BERT, so they need torch and onnxruntime but no network.
+"""
+
+import importlib.util
+import os
+import tempfile
+import unittest
+import numpy as np
+from inference_backend import InferenceBackend
+from reading_comprehension import get_article_predictions, get_model_predictions_batch
+
+
+HAS_ONNX = all(importlib.util.find_spec(name) for name in ("torch", "onnxruntime", "onnx"))
+
+
+class FixedBackend(InferenceBackend):
+    """
+    Scores the token "paris" highest, and counts the instances it was asked to score.
+    """
+    def __init__(self):
+        self.instances = 0
+
+    def predict(self, instances):
+        self.instances += len(instances)
+        ids = np.asarray([instance["input_ids"] for instance in instances])
+        logits = np.where(ids == 3000, 10.0, 0.0).astype(np.float32)
+        return logits, logits
+
+
+class TestInferenceBackend(unittest.TestCase):
+    """
+    Any InferenceBackend can be used instead of a model server address.
+    """
+    def test_custom_backend(self):
+        backend = FixedBackend()
+        predictions = get_model_predictions_batch(
+            "What is the capital of France?",
+            ["Paris is the capital of France.", "Berlin is in Germany."], backend)
+
+        assert predictions[0]["answer"] == "paris"
+        assert backend.instances == 2
+
+
+@unittest.skipUnless(HAS_ONNX, "torch, onnx and onnxruntime are required")
+class TestOnnxRuntimeBackend(unittest.TestCase):
+    """
+    Export a tiny model to ONNX and compare ONNX Runtime to PyTorch.
+    """
+    @classmethod
+    def setUpClass(cls):
+        # pylint: disable=import-outside-toplevel
+        from models.create_saved_model import create_onnx_model, create_tiny_model
+
+        cls.directory = tempfile.TemporaryDirectory()  # pylint: disable=consider-using-with
+        cls.path = os.path.join(cls.directory.name, "tiny.onnx")
+        create_onnx_model(cls.path, quantize=True, tiny=True)
+        cls.model = create_tiny_model()
+
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.directory.cleanup()
+
+
+    def test_matches_torch(self):
+        """
+        ONNX Runtime returns the same logits as PyTorch, for any batch size and length.
+        """
+        import torch  # pylint: disable=import-outside-toplevel
+        from inference_backend import OnnxRuntimeBackend  # pylint: disable=import-outside-toplevel
+
+        backend = OnnxRuntimeBackend(self.path, max_batch=2, intra_op_threads=1)
+        input_ids = [[101, 2054, 102, 3000, 2003, 102, 0], [101, 2054, 102, 4068, 102, 0, 0],
+                     [101, 102, 2003, 102, 0, 0, 0]]
+        instances = [{"input_ids": ids,
+                      "attention_mask": [int(token != 0) for token in ids],
+                      "token_type_ids": [0] * len(ids)} for ids in input_ids]
+
+        start, end = backend.predict(instances)
+        with torch.no_grad():
+            expected = self.model(input_ids=torch.tensor(input_ids),
+                                  attention_mask=torch.tensor([i["attention_mask"]
+                                                               for i in instances]),
+                                  token_type_ids=torch.zeros((3, 7), dtype=torch.long))
+
+        assert start.shape == end.shape == (3, 7)
+        assert start.dtype == np.float32
+        np.testing.assert_allclose(start, expected.start_logits.numpy(), atol=1e-4)
+        np.testing.assert_allclose(end, expected.end_logits.numpy(), atol=1e-4)
+
+
+    def test_quantized_model(self):
+        """
+        The int8 model can answer questions end to end.
+        """
+        from inference_backend import OnnxRuntimeBackend  # pylint: disable=import-outside-toplevel
+
+        backend = OnnxRuntimeBackend(self.path[:-len(".onnx")] + ".int8.onnx")
+        predictions = get_article_predictions("What is the capital of France?",
+                                              ["Paris is the capital of France. " * 100],
+                                              backend, max_batch=4)
+
+        assert len(predictions) > 1
+        assert all(prediction["answer"] for prediction in predictions)
+
+
+if __name__ == "__main__":
+    unittest.main()
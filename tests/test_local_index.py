@@ -0,0 +1,122 @@
+"""
+Test the local BM25 index. These tests do not need an internet connection.
+"""
+
+import os
+import tempfile
+import tracemalloc
+import unittest
+import numpy as np
+from document_retrieval import get_articles
+from local_index import LocalIndex, iter_wikipedia_dump
+
+
+QUERY = "What is the capital of France?"
+
+DOCUMENTS = [("Paris", "Paris is the capital and most populous city of France."),
+             ("France", "France is a country in Western Europe. Its capital is Paris."),
+             ("Lyon", "Lyon is the third largest city in France."),
+             ("Berlin", "Berlin is the capital of Germany.")]
+
+DUMP = """<mediawiki xmlns="http://www.mediawiki.org/xml/export-0.10/">
+  <page><title>Paris</title><ns>0</ns>
+    <revision><text>'''Paris''' is the [[capital city|capital]] of [[France]].{{citation needed}}<ref>A source</ref></text></revision>
+  </page>
+  <page><title>Paname</title><ns>0</ns><redirect title="Paris" />
+    <revision><text>#REDIRECT [[Paris]]</text></revision>
+  </page>
+  <page><title>Talk:Paris</title><ns>1</ns>
+    <revision><text>Discussion</text></revision>
+  </page>
+</mediawiki>
+"""
+
+
+class TestLocalIndex(unittest.TestCase):
+    """
+    Test building, loading and searching a local index.
+    """
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()  # pylint: disable=consider-using-with
+        self.index = LocalIndex.build(DOCUMENTS, self.directory.name)
+
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+
+    def test_search(self):
+        """
+        Documents are ranked with BM25 and the index can be re-opened from disk.
+        """
+        assert self.index.search(QUERY, results=2) == ["Paris", "Berlin"]
+        assert self.index.search("country in Europe") == ["France", "Lyon"]
+        assert LocalIndex(self.directory.name).search("Germany") == ["Berlin"]
+        assert self.index.search("no such words") == []
+
+
+    def test_build_in_batches(self):
+        """
+        Postings written to disk in many small runs are merged into the same index.
+        """
+        with tempfile.TemporaryDirectory() as directory:
+            index = LocalIndex.build(DOCUMENTS, directory, batch_postings=5)
+
+            assert sorted(os.listdir(directory)) == sorted(os.listdir(self.directory.name))
+            for query in [QUERY, "country in Europe", "Germany", "no such words"]:
+                doc_ids, scores = index.scores(query)
+                expected_doc_ids, expected_scores = self.index.scores(query)
+                assert doc_ids.tolist() == expected_doc_ids.tolist()
+                assert np.allclose(scores, expected_scores)
+
+        with tempfile.TemporaryDirectory() as directory:
+            assert LocalIndex.build([], directory).search(QUERY) == []
+
+
+    def test_get_articles(self):
+        """
+        The index can be used as a backend for document retrieval.
+        """
+        articles = get_articles(QUERY, num_articles_search=2, characters_per_article=15,
+                                backend=self.index)
+
+        assert articles == [("Paris", "Paris is the ca"), ("Berlin", "Berlin is the c")]
+
+        with self.assertRaises(self.index.exceptions.PageError):
+            self.index.page("London")
+
+        assert self.index.summary("Lyon") == "Lyon is the third largest city in France."
+
+
+    def test_iter_wikipedia_dump(self):
+        """
+        Articles are read from a dump without redirects, talk pages or markup.
+        """
+        path = os.path.join(self.directory.name, "dump.xml")
+        with open(path, "w") as dump:
+            dump.write(DUMP)
+
+        assert list(iter_wikipedia_dump(path)) == [("Paris", "Paris is the capital of France.")]
+
+
+    def test_iter_wikipedia_dump_memory(self):
+        """
+        Reading a dump doesn't hold on to the pages that were already read.
+        """
+        path = os.path.join(self.directory.name, "dump.xml")
+        page = "<page><title>Page {}</title><ns>0</ns><revision><text>Text</text></revision></page>"
+        with open(path, "w") as dump:
+            dump.write('<mediawiki xmlns="http://www.mediawiki.org/xml/export-0.10/">')
+            dump.writelines(page.format(i) for i in range(20000))
+            dump.write("</mediawiki>")
+
+        sizes = {}
+        tracemalloc.start()
+        try:
+            for i, _ in enumerate(iter_wikipedia_dump(path)):
+                if i in (1000, 19999):
+                    sizes[i] = tracemalloc.get_traced_memory()[0]
+        finally:
+            tracemalloc.stop()
+
+        assert sizes[19999] - sizes[1000] < 100 * 1024
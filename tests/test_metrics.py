@@ -0,0 +1,104 @@
+"""
+Test the timing and metrics helpers, and that the Answerer reports its stages.
+"""
+
+import threading
+import unittest
+from unittest import mock
+from answer_question import Answerer
+from metrics import MetricsRegistry, REGISTRY, run_in_context, stage, track_request
+from benchmarks.stubs import StubWikipedia
+from tests.test_answer_question import ARTICLES, QUERY, fake_predictions
+
+
+class TestMetrics(unittest.TestCase):
+    """
+    Test the stage timer, the per-request timings and the registry.
+    """
+    def test_stage_timings(self):
+        """
+        Repeated stages are added up, and stages outside the request are not included.
+        """
+        with track_request() as timings:
+            with stage("a"):
+                pass
+            first = timings.as_dict()["a"]
+            with stage("a"):
+                with stage("b"):
+                    pass
+
+        with stage("outside"):
+            pass
+
+        assert set(timings.as_dict()) == {"a", "b"}
+        assert timings.as_dict()["a"] >= first
+
+
+    def test_thread_timings(self):
+        """
+        Stages run with `run_in_context` count towards the request that started them.
+        """
+        def work():
+            with stage("worker"):
+                pass
+
+        with track_request() as timings:
+            threads = [threading.Thread(target=run_in_context(work)) for _ in range(3)]
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+
+        assert set(timings.as_dict()) == {"worker"}
+
+
+    def test_prometheus(self):
+        """
+        Counters and histograms are rendered in the Prometheus text format and sent to sinks.
+        """
+        registry = MetricsRegistry(buckets=(0.1, 1.0))
+        measurements = []
+        registry.add_sink(lambda *measurement: measurements.append(measurement))
+
+        registry.inc("requests_total")
+        registry.inc("requests_total", 2)
+        registry.inc("hits_total", kind="page")
+        registry.observe("latency_seconds", 0.5, stage="search")
+        registry.observe("latency_seconds", 5.0, stage="search")
+
+        text = registry.render_prometheus()
+        assert "requests_total 3" in text
+        assert 'hits_total{kind="page"} 1' in text
+        assert 'latency_seconds_bucket{stage="search",le="0.1"} 0' in text
+        assert 'latency_seconds_bucket{stage="search",le="1.0"} 1' in text
+        assert 'latency_seconds_bucket{stage="search",le="+Inf"} 2' in text
+        assert 'latency_seconds_sum{stage="search"} 5.5' in text
+        assert registry.counter("requests_total") == 3
+        assert len(measurements) == 5
+
+
+    @mock.patch("answer_question.get_model_predictions_batch", side_effect=fake_predictions)
+    def test_answerer_timings(self, _):
+        """
+        Answers include the time spent in each stage, and the registry counts cache hits.
+        """
+        answerer = Answerer("stub", backend=StubWikipedia(ARTICLES), answer_cache_size=10,
+                            retrieval_workers=2)
+        hits = REGISTRY.counter("qa_answer_cache_hits_total")
+
+        ans = answerer.answer_question(QUERY)
+        assert {"total", "retrieval", "wiki_search", "wiki_page", "reading_comprehension",
+                "decider"} <= set(ans["timings"])
+
+        ans = answerer.answer_question(QUERY)
+        assert ans["cache_hit"] is True
+        assert "wiki_search" not in ans["timings"]
+        assert REGISTRY.counter("qa_answer_cache_hits_total") == hits + 1
+
+        answers = answerer.answer_questions(["Where is Paris?", "Where is France?"])
+        assert all({"total", "retrieval", "wiki_search"} <= set(answer["timings"])
+                   for answer in answers)
+
+
+if __name__ == "__main__":
+    unittest.main()
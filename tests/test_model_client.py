@@ -0,0 +1,71 @@
+"""
+Test the model server client against local stubs of the model server.
+"""
+
+import socket
+import unittest
+import requests
+from model_client import ModelServerClient
+from benchmarks.stubs import StubModelServer
+
+
+INSTANCES = [{"input_ids": [101, 3000, 102], "token_type_ids": [0, 0, 0],
+              "attention_mask": [1, 1, 1]}] * 2
+
+
+def unused_address():
+    """
+    Returns the address of a port that nothing is listening on.
+    """
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        port = sock.getsockname()[1]
+
+    return f"http://127.0.0.1:{port}/v1/models/stub:predict"
+
+
+class TestModelServerClient(unittest.TestCase):
+    """
+    Test load balancing, retries and both request formats.
+    """
+    def test_predict(self):
+        """
+        Both request formats return float32 logits with one row per instance.
+        """
+        with StubModelServer() as server:
+            for request_format in ["row", "columnar"]:
+                client = ModelServerClient(server.address, request_format=request_format)
+                start_logits, end_logits = client.predict(INSTANCES)
+
+                assert start_logits.shape == end_logits.shape == (2, 3)
+                assert start_logits[0, 1] == 10.0
+
+
+    def test_round_robin(self):
+        """
+        Requests are spread evenly over the replicas.
+        """
+        with StubModelServer() as first, StubModelServer() as second:
+            client = ModelServerClient([first.address, second.address])
+            for _ in range(4):
+                client.predict(INSTANCES)
+
+            assert first.requests == second.requests == 2
+
+
+    def test_retries(self):
+        """
+        A request to a replica that is down is retried on the other replica, and the
+        error is raised once the retries run out.
+        """
+        with StubModelServer() as server:
+            client = ModelServerClient([unused_address(), server.address], max_retries=1,
+                                       backoff=0)
+            for _ in range(2):
+                client.predict(INSTANCES)
+
+            assert server.requests == 2
+
+        client = ModelServerClient(unused_address(), max_retries=1, backoff=0)
+        with self.assertRaises(requests.ConnectionError):
+            client.predict(INSTANCES)
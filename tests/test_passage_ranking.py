@@ -0,0 +1,37 @@
+"""
+Test the lexical passage re-ranking stage.
+"""
+
+import unittest
+from passage_ranking import rank_passages, score_passages
+
+
+QUERY = "What is the capital of France?"
+
+PASSAGES = ["The weather in Lyon is mild.",
+            "Paris is the capital of France.",
+            "France has twelve time zones.",
+            "Berlin is the capital of Germany."]
+
+
+class TestPassageRanking(unittest.TestCase):
+    """
+    Test that passages which share rare words with the question are kept.
+    """
+    def test_score_passages(self):
+        """
+        Passages that share more (and rarer) words with the question score higher.
+        """
+        scores = score_passages(QUERY, PASSAGES)
+
+        assert scores.argmax() == 1
+        assert scores[1] > scores[3] > scores[0]
+        assert len(score_passages("", PASSAGES)) == 4
+
+
+    def test_rank_passages(self):
+        """
+        The best passages are kept in their original order.
+        """
+        assert rank_passages(QUERY, PASSAGES, top_n=2) == [1, 3]
+        assert rank_passages(QUERY, PASSAGES, top_n=10) == [0, 1, 2, 3]
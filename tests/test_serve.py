@@ -0,0 +1,82 @@
+"""
+Test the QA service end to end against a stub of Wikipedia and a stub model server.
+"""
+
+import json
+import unittest
+from concurrent.futures import ThreadPoolExecutor
+import requests
+from answer_question import Answerer
+from dynamic_batching import DynamicBatcher
+from model_client import ModelServerClient
+from serve import QAService
+from benchmarks.stubs import StubModelServer, StubWikipedia
+
+
+ARTICLES = {"Paris": "Paris is the capital and most populous city of France.",
+            "France": "France is a country in Western Europe. Its capital is Paris."}
+
+
+class TestQAService(unittest.TestCase):
+    """
+    Send questions to the service over HTTP.
+    """
+    def setUp(self):
+        self.model_server = StubModelServer().__enter__()
+        self.batcher = DynamicBatcher(ModelServerClient(self.model_server.address),
+                                      max_batch_size=32, max_wait_ms=20)
+        answerer = Answerer(self.batcher, backend=StubWikipedia(ARTICLES))
+        self.service = QAService(answerer, port=0, max_concurrent_requests=8).__enter__()
+
+
+    def tearDown(self):
+        self.service.__exit__()
+        self.batcher.close()
+        self.model_server.__exit__()
+
+
+    def test_answer(self):
+        """
+        Concurrent questions are answered, and their chunks share model server requests.
+        """
+        def ask(question):
+            return requests.post(f"{self.service.address}/answer",
+                                 data=json.dumps({"question": question}), timeout=10)
+
+        with ThreadPoolExecutor(max_workers=8) as executor:
+            responses = list(executor.map(ask, ["What is the capital of France?"] * 8))
+
+        assert all(response.status_code == 200 for response in responses)
+        assert all(response.json()["answer"]["answer"] == "paris" for response in responses)
+        assert self.model_server.requests < 8
+
+
+    def test_bad_requests(self):
+        """
+        Malformed and overly long questions are rejected with 400.
+        """
+        response = requests.post(f"{self.service.address}/answer", data="{}", timeout=10)
+        assert response.status_code == 400
+
+        response = requests.post(f"{self.service.address}/answer", timeout=10,
+                                 data=json.dumps({"question": "why " * 20}))
+        assert response.status_code == 400
+
+
+    def test_health(self):
+        """
+        The health, readiness and metrics endpoints answer.
+        """
+        assert requests.get(f"{self.service.address}/healthz", timeout=10).status_code == 200
+        assert requests.get(f"{self.service.address}/readyz", timeout=10).json()["ready"]
+
+        response = requests.get(f"{self.service.address}/metrics", timeout=10)
+        assert response.status_code == 200
+        assert "# TYPE" in response.text
+
+        self.batcher.close()
+        assert requests.get(f"{self.service.address}/readyz", timeout=10).status_code == 503
+
+
+if __name__ == "__main__":
+    unittest.main()
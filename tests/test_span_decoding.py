@@ -0,0 +1,68 @@
+"""
+Test the vectorized span decoding functions.
+"""
+
+import unittest
+import numpy as np
+from span_decoding import best_span_per_row, stack_logits, top_k_spans
+
+
+class TestSpanDecoding(unittest.TestCase):
+    """
+    Test that only valid spans are chosen.
+    """
+    def setUp(self):
+        self.start_logits = stack_logits([np.array([9, 5, 1, 0, 8]), np.array([0, 1, 9])])
+        self.end_logits = stack_logits([np.array([9, 6, 1, 7, 0]), np.array([9, 2, 0])])
+
+        # The first token of every row is part of the question.
+        self.mask = np.isfinite(self.start_logits)
+        self.mask[:, 0] = False
+
+
+    def test_stack_logits(self):
+        """
+        Rows of different lengths are padded with -inf.
+        """
+        assert self.start_logits.shape == (2, 5)
+        assert self.start_logits.dtype == np.float32
+        assert np.isneginf(self.start_logits[1, 3:]).all()
+
+
+    def test_best_span_per_row(self):
+        """
+        The end never comes before the start, and the answer length is limited.
+        """
+        starts, ends, scores = best_span_per_row(self.start_logits, self.end_logits, self.mask,
+                                                 max_answer_len=5)
+        assert starts.tolist() == [1, 2] and ends.tolist() == [3, 2]
+        assert scores.tolist() == [12, 9]
+
+        starts, ends, scores = best_span_per_row(self.start_logits, self.end_logits, self.mask,
+                                                 max_answer_len=1)
+        assert starts.tolist() == [1, 2] and ends.tolist() == [1, 2]
+        assert scores.tolist() == [11, 9]
+
+        # Rows without any valid span.
+        _, _, scores = best_span_per_row(self.start_logits, self.end_logits,
+                                         np.zeros_like(self.mask))
+        assert np.isneginf(scores).all()
+
+
+    def test_top_k_spans(self):
+        """
+        The best spans across all rows are returned in order, without invalid spans.
+        """
+        rows, starts, ends, scores = top_k_spans(self.start_logits, self.end_logits, self.mask,
+                                                 max_answer_len=5, top_k=3)
+
+        assert rows.tolist() == [0, 0, 1]
+        assert starts.tolist() == [1, 1, 2] and ends.tolist() == [3, 1, 2]
+        assert scores.tolist() == [12, 11, 9]
+
+        rows, _, _, _ = top_k_spans(self.start_logits, self.end_logits, self.mask, top_k=100)
+        assert len(rows) == 13
+
+        rows, _, _, scores = top_k_spans(self.start_logits, self.end_logits,
+                                         np.zeros_like(self.mask), top_k=3)
+        assert len(rows) == len(scores) == 0
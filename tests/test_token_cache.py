@@ -0,0 +1,96 @@
+"""
+Test the cache of tokenized articles. These tests do not need a model server.
+"""
+
+import os
+import tempfile
+import unittest
+import numpy as np
+from answer_question import Answerer
+from reading_comprehension import encode_article, get_article_predictions, get_tokenizer
+from token_cache import TokenCache
+from benchmarks.stubs import StubModelServer, StubWikipedia
+
+
+QUERY = "What is the capital of France?"
+
+ARTICLES = {"Paris": "Paris is the capital and most populous city of France.",
+            "France": "France is a country in Western Europe. Its capital is Paris.",
+            "Lyon": "Lyon is the third largest city of France."}
+
+
+class TestTokenCache(unittest.TestCase):
+    """
+    Test the cache itself, and that cached articles give the same predictions.
+    """
+    def test_memory_cache(self):
+        """
+        Entries are keyed by title and text, and the least recently used are evicted.
+        """
+        tokenizer = get_tokenizer()
+        encodings = {title: encode_article(text) for title, text in ARTICLES.items()}
+        size = 3 * 4 * max(len(encoding["input_ids"]) for encoding in encodings.values())
+        cache = TokenCache(max_bytes=2 * size)
+
+        cache.set("Paris", ARTICLES["Paris"], tokenizer, encodings["Paris"])
+        cache.set("France", ARTICLES["France"], tokenizer, encodings["France"])
+        encoding = cache.get("Paris", ARTICLES["Paris"], tokenizer)
+        cache.set("Lyon", ARTICLES["Lyon"], tokenizer, encodings["Lyon"])
+
+        assert encoding["input_ids"].tolist() == encodings["Paris"]["input_ids"]
+        assert encoding["offsets"].tolist() == [list(offsets) for offsets
+                                                in encodings["Paris"]["offsets"]]
+        assert cache.get("France", ARTICLES["France"], tokenizer) is None
+        assert cache.get("Paris", ARTICLES["Paris"] + " New revision.", tokenizer) is None
+        assert cache.get("Lyon", ARTICLES["Lyon"], tokenizer) is not None
+        assert (cache.hits, cache.misses) == (2, 2)
+
+
+    def test_disk_cache(self):
+        """
+        Entries survive re-opening the directory and are memory-mapped.
+        """
+        tokenizer = get_tokenizer()
+        with tempfile.TemporaryDirectory() as directory:
+            cache = TokenCache(directory)
+            for title, text in ARTICLES.items():
+                cache.set(title, text, tokenizer, encode_article(text))
+
+            cache = TokenCache(directory)
+            encoding = cache.get("France", ARTICLES["France"], tokenizer)
+
+            assert len(cache) == 3
+            assert isinstance(encoding["input_ids"].base, np.memmap)
+            assert encoding["input_ids"].tolist() == encode_article(ARTICLES["France"])["input_ids"]
+
+            TokenCache(directory, max_bytes=0)
+            assert not [name for name in os.listdir(directory) if name.endswith(".npy")]
+
+
+    def test_article_predictions(self):
+        """
+        Cached articles give the same predictions, and are only tokenized once.
+        """
+        titles, articles = list(ARTICLES), [text * 30 for text in ARTICLES.values()]
+        cache = TokenCache()
+        with StubModelServer() as server:
+            expected = get_article_predictions(QUERY, articles, server.address)
+            first = get_article_predictions(QUERY, articles, server.address, titles=titles,
+                                            token_cache=cache)
+            second = get_article_predictions("Where is Lyon?", articles, server.address,
+                                             titles=titles, token_cache=cache)
+
+            answerer = Answerer(server.address, backend=StubWikipedia(ARTICLES),
+                                chunking="tokens", token_cache=cache)
+            answer = answerer.answer_question(QUERY)
+            answerer.answer_question("Which city is the capital of France?")
+
+        assert first == expected
+        assert [prediction["context"] for prediction in second] == \
+               [prediction["context"] for prediction in expected]
+        assert (cache.hits, cache.misses) == (3 + 3, 3 + 3)
+        assert answer["answer"]["answer"] == "Paris"
+
+
+if __name__ == "__main__":
+    unittest.main()
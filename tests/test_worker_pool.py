@@ -0,0 +1,132 @@
+"""
+Test that tokenizing and decoding on a WorkerPool gives the same results as in-process.
+"""
+
+import unittest
+import numpy as np
+from answer_question import Answerer
+from reading_comprehension import get_article_predictions, get_model_predictions_batch, \
+                                  get_tokenizer
+from worker_pool import WorkerPool
+from benchmarks.stubs import StubModelServer, StubWikipedia
+
+
+QUERY = "What is the capital of France?"
+
+CHUNKS = ["Paris is the capital and most populous city of France.",
+          "France is a country in Western Europe. Its capital is Paris.",
+          "The Eiffel Tower is a wrought-iron lattice tower in Paris.",
+          "Lyon is the third largest city of France."]
+
+
+class OtherTokenizer:  # pylint: disable=too-few-public-methods
+    """
+    A tokenizer with another vocabulary.
+    """
+    fingerprint = "other"
+
+
+class TestWorkerPool(unittest.TestCase):
+    """
+    Compare the results of a pool of 2 processes to the results without one.
+    """
+    @classmethod
+    def setUpClass(cls):
+        cls.pool = WorkerPool(2)
+        cls.server = StubModelServer().__enter__()
+
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.server.__exit__()
+        cls.pool.close()
+
+
+    def test_model_predictions(self):
+        expected = get_model_predictions_batch(QUERY, CHUNKS, self.server.address,
+                                               include_scores=True)
+        predictions = get_model_predictions_batch(QUERY, CHUNKS, self.server.address,
+                                                  include_scores=True, pool=self.pool)
+
+        assert [prediction["answer"] for prediction in predictions] == \
+               [prediction["answer"] for prediction in expected]
+        assert [prediction["start_scores_max"] for prediction in predictions] == \
+               [prediction["start_scores_max"] for prediction in expected]
+        assert all(len(prediction["start_scores"]) == len(reference["start_scores"])
+                   for prediction, reference in zip(predictions, expected))
+
+
+    def test_article_predictions(self):
+        articles = [" ".join(CHUNKS) * 20, CHUNKS[1]]
+        expected = get_article_predictions(QUERY, articles, self.server.address, max_batch=4)
+        predictions = get_article_predictions(QUERY, articles, self.server.address, max_batch=4,
+                                              pool=self.pool)
+
+        assert predictions == expected
+
+
+    def test_empty_chunks(self):
+        """
+        Chunks without any context have no answer and -inf scores, instead of "[CLS]".
+        """
+        for pool in (None, self.pool):
+            predictions = get_model_predictions_batch(QUERY, ["", CHUNKS[0]], self.server.address,
+                                                      pool=pool)
+
+            assert predictions[0] == {"answer": "", "start_scores_max": -np.inf,
+                                      "end_scores_max": -np.inf}
+            assert predictions[1]["answer"] == "paris"
+
+        answerer = Answerer(self.server.address, backend=StubWikipedia({"Empty": "",
+                                                                        "Paris": CHUNKS[0]}))
+        ans = answerer.answer_question(QUERY)
+        assert ans["answer"]["answer"] == "paris" and ans["other_results"] == []
+
+
+    def test_answerer(self):
+        articles = {"Paris": CHUNKS[0], "France": CHUNKS[1]}
+        answerer = Answerer(self.server.address, backend=StubWikipedia(articles),
+                            process_pool=self.pool)
+
+        assert answerer.answer_question(QUERY)["answer"]["answer"] == "paris"
+
+
+    def test_tokenizer(self):
+        """
+        A new pool uses the Answerer's tokenizer, and a pool with another tokenizer is
+        rejected when it is first used.
+        """
+        tokenizer = get_tokenizer()
+        with WorkerPool(1, tokenizer=tokenizer) as pool:
+            predictions = get_model_predictions_batch(QUERY, CHUNKS[:1], self.server.address,
+                                                      tokenizer=tokenizer, pool=pool)
+            assert predictions[0]["answer"] == "paris"
+            assert pool.fingerprint() == self.pool.fingerprint()
+
+        backend = StubWikipedia({"Paris": CHUNKS[0]})
+        answerer = Answerer(self.server.address, backend=backend, tokenizer=OtherTokenizer(),
+                            process_pool=self.pool)
+        with self.assertRaises(ValueError):
+            answerer.answer_question(QUERY)
+
+        # The tokenizer is still loaded lazily.
+        answerer = Answerer(self.server.address, backend=backend, process_pool=self.pool)
+        assert answerer._tokenizer is None  # pylint: disable=protected-access
+        assert answerer.answer_question(QUERY)["answer"]["answer"] == "paris"
+
+
+    def test_close(self):
+        """
+        An Answerer only closes the pool that it created itself.
+        """
+        with Answerer(self.server.address, process_pool=1) as answerer:
+            pool = answerer.process_pool
+        with self.assertRaises(RuntimeError):
+            pool.build_instances([QUERY], CHUNKS[:1])
+
+        Answerer(self.server.address, process_pool=self.pool).close()
+        assert len(self.pool.build_instances([QUERY], CHUNKS[:1])) == 1
+
+
+if __name__ == "__main__":
+    unittest.main()
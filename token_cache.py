@@ -0,0 +1,156 @@
+"""
+This module contains the class TokenCache, which keeps tokenized articles so that popular
+articles are not tokenized again for every question. `reading_comprehension.get_article_predictions`
+then only has to tokenize the question and concatenate the cached ids.
+
+Each article is stored as a single int32 array with one (input id, start offset, end offset)
+row per token. Entries are keyed by the title of the article, a hash of its text (which
+changes with every revision, and with `characters_per_article`) and a fingerprint of the
+tokenizer. With a `path`, every entry is an `.npy` file in that directory that is
+memory-mapped when it is read, so the cache survives restarts:
+
+    cache = TokenCache("token_cache", max_bytes=1024 ** 3)
+    answerer = Answerer(address, chunking="tokens", token_cache=cache)
+"""
+
+import hashlib
+import logging
+import os
+import tempfile
+import threading
+from collections import OrderedDict
+import numpy as np
+from reading_comprehension import tokenizer_fingerprint
+
+
+logging.info("Running token cache module")
+
+
+class TokenCache:
+    """
+    A cache of tokenized articles that evicts the least recently used articles when it
+    holds more than `max_bytes`. Only one process should use a directory at a time.
+
+    Attributes
+    ----------
+    path : str
+        The directory the entries are stored in. None keeps them in memory.
+    max_bytes : int
+        The maximum size of the entries.
+    hits : int
+        The number of calls to `get` that found an entry.
+    misses : int
+        The number of calls to `get` that did not find an entry.
+    """
+
+    def __init__(self, path=None, max_bytes=256 * 1024 ** 2):
+        self.path = path
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()  # Maps names to arrays, or to file sizes on disk
+        self._size = 0
+        self._lock = threading.Lock()
+
+        if path is not None:
+            os.makedirs(path, exist_ok=True)
+            files = [entry for entry in os.scandir(path) if entry.name.endswith(".npy")]
+            for entry in sorted(files, key=lambda entry: entry.stat().st_mtime):
+                self._entries[entry.name[:-4]] = entry.stat().st_size
+                self._size += entry.stat().st_size
+            with self._lock:
+                self._evict()
+
+
+    @staticmethod
+    def key(title: str, article: str, tokenizer) -> str:
+        """
+        Returns the key of an article, i.e. "Paris:3f2a...:9c1b...".
+        """
+        digest = hashlib.blake2b(article.encode(), digest_size=16).hexdigest()
+        return f"{title}:{digest}:{tokenizer_fingerprint(tokenizer)}"
+
+
+    def _name(self, title: str, article: str, tokenizer) -> str:
+        return hashlib.sha1(self.key(title, article, tokenizer).encode()).hexdigest()
+
+
+    def _filename(self, name: str) -> str:
+        return os.path.join(self.path, f"{name}.npy")
+
+
+    def get(self, title: str, article: str, tokenizer) -> dict:
+        """
+        Returns the encoding of an article (see `reading_comprehension.encode_article`),
+        with the ids and offsets as read-only arrays, or None.
+        """
+        name = self._name(title, article, tokenizer)
+        with self._lock:
+            tokens = self._entries.get(name)
+            if tokens is not None:
+                self._entries.move_to_end(name)
+
+        if tokens is not None and self.path is not None:
+            try:
+                tokens = np.load(self._filename(name), mmap_mode="r")
+                os.utime(self._filename(name))
+            except (OSError, ValueError):  # Evicted in the meantime
+                tokens = None
+
+        with self._lock:
+            if tokens is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+
+        return {"input_ids": tokens[:, 0], "offsets": tokens[:, 1:]}
+
+
+    def set(self, title: str, article: str, tokenizer, encoding: dict):
+        """
+        Stores the encoding of an article, evicting the least recently used articles if
+        necessary.
+        """
+        name = self._name(title, article, tokenizer)
+        tokens = np.empty((len(encoding["input_ids"]), 3), dtype=np.int32)
+        tokens[:, 0] = encoding["input_ids"]
+        tokens[:, 1:] = np.asarray(encoding["offsets"]).reshape(-1, 2)
+        tokens.flags.writeable = False
+        size = tokens.nbytes
+
+        if self.path is not None:
+            # Write to a temporary file first, so that readers never see half an entry.
+            handle, temporary = tempfile.mkstemp(dir=self.path, suffix=".tmp")
+            with os.fdopen(handle, "wb") as entry_file:
+                np.save(entry_file, tokens)
+            os.replace(temporary, self._filename(name))
+            size = os.path.getsize(self._filename(name))
+
+        with self._lock:
+            previous = self._entries.pop(name, None)
+            if previous is not None:
+                self._size -= previous if self.path is not None else previous.nbytes
+            self._entries[name] = tokens if self.path is None else size
+            self._size += size
+            self._evict()
+
+
+    def _evict(self):
+        """
+        Removes the least recently used entries until the cache fits in `max_bytes`.
+        Must be called with the lock held.
+        """
+        while self._size > self.max_bytes and self._entries:
+            name, entry = self._entries.popitem(last=False)
+            if self.path is None:
+                self._size -= entry.nbytes
+            else:
+                self._size -= entry
+                try:
+                    os.remove(self._filename(name))
+                except FileNotFoundError:
+                    pass
+
+
+    def __len__(self):
+        return len(self._entries)
@@ -0,0 +1,214 @@
+"""
+This module contains the class WorkerPool, which runs the CPU-bound parts of reading
+comprehension (tokenization and answer decoding) on a pool of processes, so that they are
+not limited by the GIL. Each worker loads the tokenizer once, when it starts.
+
+Logits are not pickled: they are written to a block of shared memory, together with the
+token ids and the context mask, and each worker decodes its own rows in place.
+
+    with WorkerPool(4) as pool:
+        answerer = Answerer(address, process_pool=pool)
+"""
+
+import logging
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import shared_memory
+from typing import List
+import numpy as np
+from reading_comprehension import TOKENIZER_DIRECTORY, _build_instance, _context_mask, \
+                                  _merge_wordpieces, encode_article, get_tokenizer, \
+                                  tokenizer_fingerprint
+from span_decoding import best_span_per_row, stack_logits
+
+
+logging.info("Running worker pool module")
+
+_worker_tokenizer = None  # The tokenizer of each worker process.
+
+
+def _init_worker(tokenizer_directory: str, tokenizer):
+    global _worker_tokenizer  # pylint: disable=global-statement
+    _worker_tokenizer = get_tokenizer(tokenizer_directory) if tokenizer is None else tokenizer
+
+
+def _build_instances(pairs: List[tuple]) -> List[dict]:
+    return [_build_instance(question, chunk, _worker_tokenizer) for question, chunk in pairs]
+
+
+def _encode_articles(articles: List[str]) -> List[dict]:
+    return [encode_article(article, _worker_tokenizer) for article in articles]
+
+
+def _shared_arrays(buffer, num_rows: int, num_columns: int) -> tuple:
+    """
+    Returns the start logits, end logits, token ids and context mask stored in `buffer`.
+    """
+    shapes = [(np.float32, 2), (np.int32, 1), (np.bool_, 1)]
+    arrays, offset = [], 0
+    for dtype, count in shapes:
+        array = np.ndarray((count, num_rows, num_columns), dtype=dtype, buffer=buffer,
+                           offset=offset)
+        arrays.extend(array)
+        offset += array.nbytes
+
+    return tuple(arrays)
+
+
+def _shared_size(num_rows: int, num_columns: int) -> int:
+    return num_rows * num_columns * (2 * 4 + 4 + 1)
+
+
+def _attach(name: str) -> shared_memory.SharedMemory:
+    """
+    Opens an existing shared memory block without taking ownership of it, so that the
+    worker doesn't try to clean it up when it exits. Only `WorkerPool.decode` unlinks it.
+    """
+    try:
+        return shared_memory.SharedMemory(name=name, track=False)
+    except TypeError:  # Python < 3.13 has no `track`.
+        # The workers share the resource tracker of the parent, which already tracks the
+        # block, so registering it again is a no-op and must not be undone here.
+        return shared_memory.SharedMemory(name=name)
+
+
+def _decode_rows(name: str, num_rows: int, num_columns: int, first: int, last: int,
+                 max_answer_len: int) -> tuple:
+    """
+    Decodes rows `first` to `last` of the logits in the shared memory block `name`.
+    """
+    block = _attach(name)
+    try:
+        start, end, input_ids, mask = _shared_arrays(block.buf, num_rows, num_columns)
+        starts, ends, scores = best_span_per_row(start[first:last], end[first:last],
+                                                 mask[first:last], max_answer_len)
+        answers = [_merge_wordpieces(_worker_tokenizer.convert_ids_to_tokens(
+                       input_ids[row, answer_start:answer_end + 1].tolist()))
+                   for row, answer_start, answer_end in zip(range(first, last), starts, ends)]
+        # The views must be gone before the block can be closed.
+        del start, end, input_ids, mask
+    finally:
+        block.close()
+
+    return starts.tolist(), ends.tolist(), scores.tolist(), answers
+
+
+class WorkerPool:
+    """
+    Attributes
+    ----------
+    workers : int
+        The number of worker processes.
+    tokenizer_directory : str
+        The directory the workers load the tokenizer from, see
+        `reading_comprehension.get_tokenizer`.
+    tokenizer : object
+        If set, the workers use a copy of this tokenizer instead of loading one from
+        `tokenizer_directory`.
+
+    Methods
+    -------
+    build_instances
+        Tokenizes (question, chunk) pairs as model server instances.
+    encode_articles
+        Tokenizes articles, see `reading_comprehension.encode_article`.
+    decode
+        Finds the best answer span of each instance and turns it into a string.
+    fingerprint
+        Returns the fingerprint of the workers' tokenizer.
+    close
+        Stops the worker processes.
+    """
+
+    def __init__(self, workers: int = 4, tokenizer_directory: str = TOKENIZER_DIRECTORY,
+                 tokenizer=None):
+        self.workers = workers
+        self.tokenizer_directory = tokenizer_directory
+        self.tokenizer = tokenizer
+        # The pool starts its processes when the first question arrives, i.e. on a thread of
+        # a service, where forking is not safe.
+        start_method = "forkserver" if "forkserver" in multiprocessing.get_all_start_methods() \
+                       else "spawn"
+        self._executor = ProcessPoolExecutor(max_workers=workers, initializer=_init_worker,
+                                             initargs=(tokenizer_directory, tokenizer),
+                                             mp_context=multiprocessing.get_context(start_method))
+
+
+    def fingerprint(self) -> str:
+        """
+        Returns the fingerprint of the tokenizer used by the workers, see
+        `reading_comprehension.tokenizer_fingerprint`.
+        """
+        tokenizer = get_tokenizer(self.tokenizer_directory) if self.tokenizer is None \
+                    else self.tokenizer
+        return tokenizer_fingerprint(tokenizer)
+
+
+    def _split(self, num_items: int) -> List[tuple]:
+        """
+        Splits `num_items` into one contiguous (first, last) range per worker.
+        """
+        bounds = np.linspace(0, num_items, min(self.workers, num_items) + 1).astype(int)
+        return list(zip(bounds[:-1].tolist(), bounds[1:].tolist()))
+
+
+    def build_instances(self, questions: List[str], chunks: List[str]) -> List[dict]:
+        pairs = list(zip(questions, chunks))
+        futures = [self._executor.submit(_build_instances, pairs[first:last])
+                   for first, last in self._split(len(pairs))]
+
+        return [instance for future in futures for instance in future.result()]
+
+
+    def encode_articles(self, articles: List[str]) -> List[dict]:
+        futures = [self._executor.submit(_encode_articles, articles[first:last])
+                   for first, last in self._split(len(articles))]
+
+        return [encoding for future in futures for encoding in future.result()]
+
+
+    def decode(self, instances: List[dict], start_rows: List[np.ndarray],
+               end_rows: List[np.ndarray], max_answer_len: int) -> tuple:
+        """
+        Returns
+        -------
+        tuple
+            (starts, ends, scores, answers): the token index of the start and end of each
+            answer, its score (-inf if there is no valid span) and the answer strings.
+        """
+        start_logits = stack_logits(start_rows)
+        num_rows, num_columns = start_logits.shape
+
+        block = shared_memory.SharedMemory(create=True,
+                                           size=max(_shared_size(num_rows, num_columns), 1))
+        try:
+            start, end, input_ids, mask = _shared_arrays(block.buf, num_rows, num_columns)
+            start[:] = start_logits
+            end[:] = stack_logits(end_rows)
+            input_ids[:] = 0
+            for i, instance in enumerate(instances):
+                input_ids[i, :len(instance["input_ids"])] = instance["input_ids"]
+            mask[:] = _context_mask(instances)
+            del start, end, input_ids, mask
+
+            futures = [self._executor.submit(_decode_rows, block.name, num_rows, num_columns,
+                                             first, last, max_answer_len)
+                       for first, last in self._split(num_rows)]
+            results = [future.result() for future in futures]
+        finally:
+            block.close()
+            block.unlink()
+
+        return tuple([value for result in results for value in result[i]] for i in range(4))
+
+
+    def close(self):
+        self._executor.shutdown()
+
+
+    def __enter__(self):
+        return self
+
+
+    def __exit__(self, *exc):
+        self.close()